@@ -21,6 +21,9 @@ from flask import render_template
 from flask import request
 from flask import jsonify
 from flask import send_from_directory
+from flask import send_file
+
+from werkzeug.utils import secure_filename
 
 HOST = '0.0.0.0'
 PORT = 8086
@@ -49,6 +52,39 @@ def index():
     return render_template('index.html')
 
 
+# the precompressed siblings saved by the pipeline, in the order of preference
+PRECOMPRESSED_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+def send_precompressed(folder, fn):
+    '''
+    Send the precompressed sibling matching the Accept-Encoding
+
+    Return None if the client doesn't accept any of them or the sibling
+    is not available.
+    '''
+    # the same as send_from_directory, relative to the app folder
+    full_filename = os.path.join(app.root_path, folder, secure_filename(fn))
+    if not os.path.exists(full_filename):
+        return None
+
+    for encoding, ext in PRECOMPRESSED_ENCODINGS:
+        if request.accept_encodings[encoding] <= 0:
+            continue
+
+        fn_sibling = full_filename + ext
+        if not os.path.exists(fn_sibling) or \
+            os.path.getmtime(fn_sibling) < os.path.getmtime(full_filename):
+            continue
+
+        response = send_file(fn_sibling, mimetype='application/json', 
+            conditional=True)
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    return None
+
+
 @app.route('/mapdata/<fn>')
 def mapdata(fn):
     calc = request.args.get('calc')
@@ -58,6 +94,11 @@ def mapdata(fn):
     # j = json.load(open('../data/rst/state_' + calc + '/' + fn))
     # return jsonify(j)
 
+    # the .br or .gz saved by the pipeline
+    response = send_precompressed('../data/rst/state_' + calc, fn)
+    if response is not None:
+        return response
+
     return send_from_directory('../data/rst/state_' + calc, fn)
 
 
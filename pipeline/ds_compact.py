@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+The compact schema of the merged history JSON files
+
+The history files keep ~20 series of each region as decimal lists, and
+repeat the full list of dates. The compact schema encodes the same data:
+
+- dates: {"start": "YYYY-MM-DD", "n": N} when the dates are continuous
+- the cumulative series (nccs, dths, fvcs, vacs): the first value and
+  then the daily differences
+- the rounded float series: integers scaled by 10^d, where d is the
+  digits of the _round in the parsers, e.g., 0.1234 -> 1234, and the
+  missing values (None, NaN or infinity) are null
+- the crcs: one string of the G/Y/R
+
+The encoding is saved in the file, so a client can decode it without
+hard-coding the series. The decoded data is the same as the full schema.
+'''
+import datetime
+
+import numpy as np
+
+
+SCHEMA_COMPACT = 'compact-1'
+
+# the cumulative integer series
+SERIES_DELTA = ['nccs', 'dths', 'fvcs', 'vacs']
+
+# the float series and the digits of rounding
+SERIES_FIXED = {
+    'npps': 2, 'dpps': 2, 'd7ps': 2, 'cdts': 2, 'crps': 2,
+    'dtrs': 4, 'crts': 4, 'pvis': 4, 'fvps': 4, 'vaps': 4,
+    'tprs': 4, 't7rs': 4,
+}
+
+# the char series
+SERIES_CHARS = ['crcs']
+
+ALL_SERIES = set(SERIES_DELTA) | set(SERIES_FIXED) | set(SERIES_CHARS)
+
+
+def _is_record(obj):
+    '''
+    Check if the object is the data of one region
+    '''
+    return isinstance(obj, dict) and any([ k in obj for k in ALL_SERIES ])
+
+
+def _encode_dates(dates):
+    '''
+    Encode the list of dates as the start and the length if continuous
+    '''
+    if dates is None or len(dates) == 0:
+        return dates
+
+    start = datetime.datetime.strptime(dates[0], '%Y-%m-%d')
+    for i, date in enumerate(dates):
+        if (start + datetime.timedelta(days=i)).strftime('%Y-%m-%d') != date:
+            # not continuous, keep the list
+            return dates
+
+    return {'start': dates[0], 'n': len(dates)}
+
+
+def _decode_dates(dates):
+    '''
+    Decode the dates to the list of YYYY-MM-DD
+    '''
+    if not isinstance(dates, dict):
+        return dates
+
+    start = datetime.datetime.strptime(dates['start'], '%Y-%m-%d')
+    return [
+        (start + datetime.timedelta(days=i)).strftime('%Y-%m-%d')
+        for i in range(dates['n'])
+    ]
+
+
+def _encode_record(rec):
+    '''
+    Encode the series of one region, the other fields are kept
+    '''
+    ret = {}
+    for k, v in rec.items():
+        if k in SERIES_DELTA and len(v) > 0:
+            arr = np.asarray(v, dtype=np.int64)
+            ret[k] = np.concatenate([arr[:1], np.diff(arr)]).tolist()
+        elif k in SERIES_FIXED:
+            scale = 10 ** SERIES_FIXED[k]
+            arr = np.asarray(v, dtype=np.float64)
+            # NaN can't be cast to int64, so the missing values are null
+            ok = np.isfinite(arr)
+            ints = np.rint(np.where(ok, arr, 0) * scale).astype(np.int64).tolist()
+            ret[k] = [ x if f else None for x, f in zip(ints, ok.tolist()) ]
+        elif k in SERIES_CHARS:
+            ret[k] = ''.join(v)
+        else:
+            ret[k] = v
+
+    return ret
+
+
+def _decode_record(rec, encoding):
+    '''
+    Decode the series of one region by the encoding in the file
+    '''
+    ret = {}
+    for k, v in rec.items():
+        if k in encoding['delta'] and len(v) > 0:
+            ret[k] = np.cumsum(np.asarray(v, dtype=np.int64)).tolist()
+        elif k in encoding['fixed']:
+            scale = 10 ** encoding['fixed'][k]
+            ret[k] = [ None if x is None else x / scale for x in v ]
+        elif k in encoding['chars']:
+            ret[k] = list(v)
+        else:
+            ret[k] = v
+
+    return ret
+
+
+def _map_records(j, func):
+    '''
+    Apply the func to each region in the *_data fields of the JSON
+    '''
+    ret = {}
+    for k, v in j.items():
+        if not k.endswith('_data'):
+            ret[k] = v
+        elif _is_record(v):
+            ret[k] = func(v)
+        elif isinstance(v, dict):
+            ret[k] = {
+                key: func(rec) if _is_record(rec) else rec
+                for key, rec in v.items()
+            }
+        else:
+            ret[k] = v
+
+    return ret
+
+
+def encode(j):
+    '''
+    Encode the merged JSON in the compact schema
+
+    Args:
+        j: the merged JSON of the state, USA, world or MCHRR
+
+    Return:
+        the compact JSON
+    '''
+    ret = _map_records(j, _encode_record)
+    ret['dates'] = _encode_dates(j.get('dates'))
+    ret['schema'] = SCHEMA_COMPACT
+    ret['encoding'] = {
+        'delta': SERIES_DELTA,
+        'fixed': SERIES_FIXED,
+        'chars': SERIES_CHARS,
+    }
+
+    return ret
+
+
+def decode(j):
+    '''
+    Decode the compact JSON to the full schema
+    '''
+    if j.get('schema') != SCHEMA_COMPACT:
+        return j
+
+    encoding = j['encoding']
+    ret = _map_records(j, lambda rec: _decode_record(rec, encoding))
+    ret['dates'] = _decode_dates(j.get('dates'))
+    del ret['schema']
+    del ret['encoding']
+
+    return ret
@@ -25,6 +25,8 @@ FULLPATH = pathlib.Path(__file__).parent.absolute()
 FOLDER_SRC = os.path.join(FULLPATH, '../data/src')
 # folder for the parsed results
 FOLDER_PRS = os.path.join(FULLPATH, '../data/prs')
+# folder for the dense panels of the source files
+FOLDER_PNL = os.path.join(FULLPATH, '../data/pnl')
 # folder for the result files
 FOLDER_RST = os.path.join(FULLPATH, '../data/rst')
 # folder for the raw data files
@@ -52,6 +54,10 @@ FOLDER_SRC_JHU = os.path.join(
 FOLDER_SRC_JHU_RAW = os.path.join(
     FOLDER_SRC_JHU, 'raw'
 )
+# the per-day fragments for JHU state data
+FOLDER_SRC_JHU_FRAG = os.path.join(
+    FOLDER_SRC_JHU, 'frag'
+)
 # unlike usafacts and ct, the CDCPVI data files are splited by date
 # so, need to save the raw file first
 # source folder for CDCPVI
@@ -62,6 +68,10 @@ FOLDER_SRC_CDCPVI = os.path.join(
 FOLDER_SRC_CDCPVI_RAW = os.path.join(
     FOLDER_SRC_CDCPVI, 'raw'
 )
+# the per-day fragments for CDCPVI
+FOLDER_SRC_CDCPVI_FRAG = os.path.join(
+    FOLDER_SRC_CDCPVI, 'frag'
+)
 # source folder for CDCVAC
 FOLDER_SRC_CDCVAC = os.path.join(
     FOLDER_SRC, 'cdcvac'
@@ -89,9 +99,14 @@ FOLDER_SRC_OWIDVAC = os.path.join(
 
 # result folder for v2
 FOLDER_RST_V2 = os.path.join(FOLDER_RST, 'v2')
+# the staging folder of v2, on the same disk for the atomic rename
+FOLDER_RST_V2_STAGING = os.path.join(FOLDER_RST, '.staging_v2')
 # result folder for v3
 FOLDER_RST_V3 = os.path.join(FOLDER_RST, 'v3')
 
+# the panel of a source on the parse date, e.g., 2020-05-15/owid.npz
+FN_PANEL = os.path.join(FOLDER_PNL, '%s', '%s.npz')
+
 # the last update time file
 FN_LAST_UPDATE = os.path.join(FOLDER_RST, 'last_update.json')
 
@@ -191,6 +206,13 @@ FN_SAVE_ACTNOW_STATE_DATA = os.path.join(
 FN_SAVE_ACTNOW_COUNTY_DATA = os.path.join(
     FOLDER_SRC_ACTNOW, 'county_data_%s.csv'
 )
+
+# the columns of ActNow data which are forward filled for each region
+ACTNOW_FFILL_COLUMNS = [
+    'actuals.cases', 
+    'actuals.deaths', 
+    'actuals.vaccinationsCompleted'
+]
 # for the NYTimes
 FN_SAVE_NYTIMES_USA_DATA = os.path.join(
     FOLDER_SRC_NYTIMES, 'usa_data_%s.csv'
@@ -206,12 +228,52 @@ FN_SAVE_OWIDVAC_WORLD_VAC_DATA = os.path.join(
     FOLDER_SRC_OWIDVAC, 'world_vac_data_%s.csv'
 )
 
+# the per-day fragment, the merged history and the index of them in the
+# fragment folder
+FN_FRAG = 'frag_%s.csv'
+FN_FRAG_HISTORY = 'history.csv'
+FN_FRAG_INDEX = 'index.json'
+
+# the batch file of the parsed records of each kind in the prs date folder
+FN_PRS_BATCH = 'records_%s.tsv'
+PRS_BATCH_KINDS = ['county', 'state', 'country', 'mchrr']
+
+# save the JSON file of each region in the prs date folder for debugging
+PRS_SAVE_JSON = False
+
+# the JSON backend, auto for orjson if installed, or stdlib
+JSON_BACKEND = 'auto'
+
 # the output JSON file for front end
 FN_OUTPUT_STATE = '%s-history.json'
 FN_OUTPUT_USA = 'US-history.json'
 FN_OUTPUT_WORLD = 'WORLD-history.json'
 FN_OUTPUT_MCHRR = 'MCHRR-history.json'
 
+# also save the output in the compact schema, e.g., AL-history.compact.json
+OUTPUT_COMPACT = True
+FN_OUTPUT_COMPACT_SUFFIX = '.compact.json'
+
+# also save the last days of the output, e.g., AL-history.delta.json
+OUTPUT_DELTA = True
+OUTPUT_DELTA_DAYS = 7
+FN_OUTPUT_DELTA_SUFFIX = '.delta.json'
+
+# save the .gz and .br siblings of the result files for the web servers
+PRECOMPRESS_OUTPUT = True
+PRECOMPRESS_FOLDERS = [FOLDER_RST_V2]
+PRECOMPRESS_EXTS = ['.json']
+PRECOMPRESS_GZIP_LEVEL = 9
+PRECOMPRESS_BR_QUALITY = 11
+
+# merge to the staging folder, then publish to v2 with the manifest
+PUBLISH_STAGING = True
+FN_MANIFEST = 'manifest.json'
+
+# the recent versions of each file kept in the manifest, so the delta route
+# can tell the date of a stale version
+MANIFEST_HISTORY_N = 14
+
 ###############################################################################
 # Data source URLS
 ###############################################################################
@@ -263,6 +325,48 @@ DS_CDCVAC_STATE = 'https://covid.cdc.gov/covid-data-tracker/COVIDData/getAjaxDat
 # data source of the world vaccine
 DS_OWIDVAC_WORLD = "https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/vaccinations/vaccinations.csv"
 
+###############################################################################
+# Downloading configs
+###############################################################################
+
+# the number of threads for downloading in parallel
+FETCH_MAX_WORKERS = 8
+
+# the max number of concurrent requests to one host
+FETCH_MAX_PER_HOST = 4
+
+# the number of retries and the backoff factor (seconds)
+FETCH_RETRIES = 3
+FETCH_BACKOFF_FACTOR = 1
+FETCH_RETRY_STATUS = [429, 500, 502, 503, 504]
+
+# the timeout (seconds) for connecting and reading
+FETCH_TIMEOUT = 60
+
+# the chunk size for writing the downloaded file
+FETCH_CHUNK_SIZE = 1 << 20
+
+# the sidecar suffix for the ETag and Last-Modified of the downloaded file
+FETCH_META_SUFFIX = '.meta.json'
+
+# probe the remote CSV in the detectors instead of downloading all
+DETECT_PROBE_MODE = True
+
+# the bytes of the head and tail to read by HTTP Range when probing
+PROBE_HEAD_BYTES = 4096
+PROBE_TAIL_BYTES = 64 * 1024
+
+# the number of lines per batch when scanning the stream
+PROBE_SCAN_LINES = 10000
+
+# the timeout (seconds) of each detector when running concurrently
+DETECT_TIMEOUT = 120
+
+# the timeout of the detectors which need more time, e.g., full reading
+DETECT_TIMEOUTS = {
+    'actnow_state': 300,
+}
+
 ###############################################################################
 # Parsing configs
 ###############################################################################
@@ -324,6 +428,28 @@ FIRST_DATE_VAC = '2021-01-13'
 # if the number of NaN states is greater than this value, skip updating
 N_ACTNOW_NAN_STATES = 45
 
+# the mode for parsing the counties in parallel
+# pool: send the values of each county to the workers
+# panel: share one dense panel of all counties with the workers
+COUNTY_PARSE_MODE = 'panel'
+
+# cache the panels of the sources by parse date, False to build them
+# in each parser
+PANEL_CACHE = True
+
+# the number of processes for merging the state files, 1 for serial
+MERGE_STATE_WORKERS = 4
+
+# the columnar store for the downloaded data, only used when pyarrow exists
+STORE_SUFFIX = '.feather'
+# also export the CSV file, which is needed by the old parsers
+STORE_EXPORT_CSV = True
+# the text columns to be dictionary-encoded in the store
+STORE_CATEGORY_COLUMNS = ['state', 'date', 'iso_code', 'location']
+# build the history from the per-day fragments, only new or changed days
+# are merged again. False to merge all days from the raw files
+STORE_INCREMENTAL = True
+
 
 # MAYO CLINIC REGIONS
 _mc_region_list = [
@@ -33,8 +33,11 @@ from termcolor import colored
 
 import ds_detector
 import ds_downloader
+import ds_fetcher
+import ds_panel
 import ds_parser
 import ds_merger
+import ds_records
 import ds_config as cfg
 
 
@@ -78,52 +81,41 @@ def pipeline(parse_date=None):
 
     # 1. detect
     if g_steps == 'all' or 'detect' in g_steps:
-        rets = []
-        rets.append(ds_detector.detect_ds_jhu_usa(parse_date))        # 0
-        rets.append(ds_detector.detect_ds_jhu_state(parse_date))      # 1
-        rets.append(ds_detector.detect_ds_jhu_ts_world(parse_date))   # 2
-        rets.append(ds_detector.detect_ds_cdcpvi(parse_date))         # 3
-        rets.append(ds_detector.detect_ds_actnow_state(parse_date))   # 4
-        rets.append(ds_detector.detect_ds_actnow_county(parse_date))  # 5
-        rets.append(ds_detector.detect_ds_owidvac_world(parse_date))  # 6
-
-        # the followings are not required
-        rets.append(ds_detector.detect_ds_jhucci_vax(parse_date))
-        rets.append(ds_detector.detect_ds_covidtracking_state(parse_date))
-        rets.append(ds_detector.detect_ds_covidtracking_usa(parse_date))
-        rets.append(ds_detector.detect_ds_usafacts_covid(parse_date))
-        rets.append(ds_detector.detect_ds_usafacts_death(parse_date))
-        rets.append(ds_detector.detect_ds_nytimes_usa(parse_date))
-        rets.append(ds_detector.detect_ds_nytimes_state(parse_date))
-        rets.append(ds_detector.detect_ds_nytimes_county(parse_date))
-
-        ds_detector.show_detect_rs(parse_date, *rets)
-
-        # if any of the data source is not ready, skip
-        if not rets[0]['flag'] or \
-            not rets[1]['flag'] or \
-            not rets[2]['flag'] or \
-            not rets[3]['flag'] or \
-            not rets[4]['flag'] or \
-            not rets[5]['flag'] or \
-            not rets[6]['flag']:
-            logger.info('* NOT ready for one of the top 7 data sources')
+        # the detectors run concurrently, each has its own timeout
+        rs = ds_detector.run_detectors(parse_date)
+        ds_detector.show_detect_rs(parse_date, rs)
+
+        # if any of the required data sources is not ready, skip
+        not_ready = ds_detector.get_not_ready(rs)
+        if len(not_ready) > 0:
+            logger.info('* NOT ready for the data sources: %s' % ', '.join(not_ready))
             return -1
 
     # 2. download
     if g_steps == 'all' or 'download' in g_steps:
-        ds_downloader.download_state_data_from_jhu(parse_date)
-        ds_downloader.download_world_ts_data_from_jhu(parse_date)
-        ds_downloader.download_allusa_data_from_cdcpvi(parse_date)
-        ds_downloader.download_state_data_from_actnow(parse_date)
-        ds_downloader.download_county_data_from_actnow(parse_date)
-        ds_downloader.download_world_vax_data_from_owidvac(parse_date)
-        # ds_downloader.download_current_state_vac_data_from_cdvvac(parse_date)
+        # the data sources are independent, download them in parallel
+        ds_fetcher.run_parallel([
+            (ds_downloader.download_state_data_from_jhu, (parse_date, )),
+            (ds_downloader.download_world_ts_data_from_jhu, (parse_date, )),
+            (ds_downloader.download_allusa_data_from_cdcpvi, (parse_date, )),
+            (ds_downloader.download_state_data_from_actnow, (parse_date, )),
+            (ds_downloader.download_county_data_from_actnow, (parse_date, )),
+            (ds_downloader.download_world_vax_data_from_owidvac, (parse_date, )),
+            # (ds_downloader.download_current_state_vac_data_from_cdvvac, (parse_date, )),
+        ])
         
         logger.info('* Downloaded all %s data files from our data sources' % parse_date)
         logger.info('*' * cfg.WIDTH_SEP_LINE)
 
-    # 3. parse
+    # 3. panel
+    if g_steps == 'all' or 'panel' in g_steps:
+        # align the downloaded data into the dense panels for the parsers
+        ds_panel.build_panels(parse_date)
+
+        logger.info('* Built all %s data panels' % parse_date)
+        logger.info('*' * cfg.WIDTH_SEP_LINE)
+
+    # 4. parse
     if g_steps == 'all' or 'parse' in g_steps:
         ds_parser.parse_county_with_actnow_and_cdcpvi_data_v2(parse_date)
         ds_parser.parse_state_with_cdcpvi_and_actnow_v2(parse_date)
@@ -133,17 +125,20 @@ def pipeline(parse_date=None):
         logger.info('* Parsed all %s data files' % parse_date)
         logger.info('*' * cfg.WIDTH_SEP_LINE)
 
-    # 4. merge
+    # 5. merge
     if g_steps == 'all' or 'merge' in g_steps:
-        ds_merger.merge_states_v2(parse_date)
-        ds_merger.merge_usa_v2(parse_date)
-        ds_merger.merge_world_v2(parse_date)
-        ds_merger.merge_mchrr_v2(parse_date)
+        ds_merger.merge_all_v2(parse_date)
+
+        # the records in memory are not needed any more
+        ds_records.clear(parse_date)
+
+        # precompress and move the files to the v2 folder at once
+        ds_merger.publish_output(parse_date)
 
         logger.info('* Merged all %s STATE, USA, WORLD, and MCHRR JSON files' % parse_date)
         logger.info('*' * cfg.WIDTH_SEP_LINE)
 
-    # 5. upload
+    # 6. upload
     if g_steps == 'all' or 'upload' in g_steps:
         if g_last == 'to_local_rcf':
             # then upload to azure
@@ -232,7 +227,7 @@ if __name__ == "__main__":
         help="Run this program in a loop* or just once?")
     parser.add_argument("--steps", type=str, 
         default='all',
-        help="Run all steps or just some? detect,download,parse,merge,upload")
+        help="Run all steps or just some? detect,download,panel,parse,merge,upload")
     parser.add_argument("--last", type=str, 
         choices=['to_pub_ohnlp', 'to_local_rcf', 'both', 'none'], default='to_pub_ohnlp',
         help="What to do after generating JSON files?")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+The delta of the merged history JSON files
+
+Each day only one date is appended to the history files, but the clients
+download the whole history again. The delta file has the same structure
+as the history file, but each series only keeps the last days, e.g.,
+AL-history.delta.json with the last 7 days.
+
+A client holding the history of any date in the window patches it by
+keeping the first base_n values of each series and appending the values
+in the delta. The values in the window which are revised by the data
+sources are also updated in this way. For the client older than the
+window, or a region not in its file, the full file is needed.
+'''
+SCHEMA_DELTA = 'delta-1'
+
+
+def _is_series(v, n):
+    '''
+    Check if the field is a series of the dates
+    '''
+    return isinstance(v, list) and len(v) == n
+
+
+def _slice_record(rec, base_n, n):
+    '''
+    Keep the values from base_n of the series, the other fields are kept
+    '''
+    return {
+        k: v[base_n:] if _is_series(v, n) else v
+        for k, v in rec.items()
+    }
+
+
+def make_delta(j, n_days):
+    '''
+    Make the delta of the last days of the merged JSON
+
+    Args:
+        j: the merged JSON of the state, USA, world or MCHRR
+        n_days: the number of days in the delta
+
+    Return:
+        the delta JSON, the since is the last date the client should have
+    '''
+    dates = j['dates']
+    n = len(dates)
+    base_n = max(n - n_days, 0)
+
+    ret = {}
+    for k, v in j.items():
+        if k == 'dates':
+            continue
+        elif not k.endswith('_data') or not isinstance(v, dict):
+            ret[k] = v
+        elif any([ _is_series(s, n) for s in v.values() ]):
+            # the data of one region, e.g., usa_data
+            ret[k] = _slice_record(v, base_n, n)
+        else:
+            ret[k] = {
+                key: _slice_record(rec, base_n, n) if isinstance(rec, dict) else rec
+                for key, rec in v.items()
+            }
+
+    ret['dates'] = dates[base_n:]
+    ret['base_n'] = base_n
+    ret['since'] = dates[base_n - 1] if base_n > 0 else None
+    ret['schema'] = SCHEMA_DELTA
+
+    return ret
+
+
+def apply_delta(j, delta):
+    '''
+    Patch the history JSON by the delta
+
+    Return:
+        the patched JSON, or None if the delta can't be applied to it
+    '''
+    base_n = delta['base_n']
+    n_old = len(j['dates'])
+    if n_old < base_n or j['dates'][base_n - 1:base_n] != \
+        ([delta['since']] if base_n > 0 else []):
+        return None
+
+    def _patch(old, new):
+        if old is None:
+            return None
+        rec = dict(new)
+        for k, v in old.items():
+            if _is_series(v, n_old) and k in new:
+                rec[k] = v[:base_n] + new[k]
+        return rec
+
+    ret = {}
+    for k, v in delta.items():
+        if k in ['base_n', 'since', 'schema']:
+            continue
+        elif k == 'dates':
+            ret[k] = j['dates'][:base_n] + v
+        elif not k.endswith('_data') or not isinstance(v, dict):
+            ret[k] = v
+        elif k in j and any([ _is_series(s, n_old) for s in j[k].values() ]):
+            ret[k] = _patch(j[k], v)
+        else:
+            ret[k] = {}
+            for key, rec in v.items():
+                if not isinstance(rec, dict):
+                    ret[k][key] = rec
+                    continue
+                ret[k][key] = _patch(j.get(k, {}).get(key), rec)
+                if ret[k][key] is None:
+                    # a new region
+                    return None
+
+    return ret
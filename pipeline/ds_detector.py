@@ -2,19 +2,98 @@
 
 import os
 import sys
+import time
 import datetime
 import argparse
+from collections import namedtuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError
 
-import requests
 from termcolor import colored
 from prettytable import PrettyTable
 
 import pandas as pd
 
 import ds_config as cfg
+import ds_fetcher
 
 
-def detect_ds_jhucci_vax(parse_date=None):
+# the result of a detector, elapsed is the seconds it takes
+DetectResult = namedtuple('DetectResult', [
+    'name', 'ds', 'lvtp', 'check_date', 'success', 'flag',
+    'latest_date', 'errmsg', 'required', 'elapsed', 'sample'
+])
+
+
+def _get_date_stats(url, parse_date, probe=None):
+    '''
+    Get the latest date and the number of rows of parse_date in a remote CSV
+
+    Args:
+        url: the URL of the CSV with a date column
+        parse_date: the YYYY-MM-DD date to check
+        probe: True to probe the file instead of reading the whole CSV,
+            default cfg.DETECT_PROBE_MODE
+
+    Return:
+        the latest date, the number of rows of parse_date, and the sample,
+        which is None if the whole file is read. Otherwise, the probe has
+        found parse_date in the `tail` or `head` of the file and stopped,
+        so the latest date and the rows are only of that part
+    '''
+    if probe is None:
+        probe = cfg.DETECT_PROBE_MODE
+
+    if probe:
+        rs = ds_fetcher.probe_csv_dates(url, 'date', parse_date)
+        if rs['latest_date'] is None:
+            raise ValueError('No date found in %s' % url)
+        return rs['latest_date'], rs['n_found'], rs['sample']
+
+    df = ds_fetcher.read_csv(url, usecols=['date'])
+    dates = pd.to_datetime(df['date']).apply(lambda v: v.strftime('%Y-%m-%d'))
+
+    return dates.max(), (dates == parse_date).sum(), None
+
+
+def _fmt_found(n_found, sample):
+    '''
+    Format the number of rows found, the rows of a sample are at least
+    '''
+    if sample is None:
+        return 'Found %s' % n_found
+
+    return 'Found %s+ in %s' % (n_found, sample)
+
+
+def _head_or_read(url, probe=None):
+    '''
+    Check if the remote file exists, raise HTTPError if not
+    '''
+    if probe is None:
+        probe = cfg.DETECT_PROBE_MODE
+
+    if probe:
+        ds_fetcher.request('HEAD', url, allow_redirects=True)
+    else:
+        ds_fetcher.read_csv(url, nrows=2)
+
+
+def _read_csv_head(url, nrows, probe=None):
+    '''
+    Read the first rows of the remote CSV
+    '''
+    if probe is None:
+        probe = cfg.DETECT_PROBE_MODE
+
+    if probe:
+        return ds_fetcher.read_csv_head(url, nrows)
+    else:
+        return ds_fetcher.read_csv(url, nrows=nrows)
+
+
+def detect_ds_jhucci_vax(parse_date=None, probe=None):
     '''
     Detect the data source of JHU CCI Vaccination
     '''
@@ -31,15 +110,9 @@ def detect_ds_jhucci_vax(parse_date=None):
     print('* running %s for %s' % (sys._getframe().f_code.co_name, parse_date))
     
     try:
-        df = pd.read_csv(cfg.DS_JHUCCI_VAX_USA)
+        latest_date, cnt, sample = _get_date_stats(cfg.DS_JHUCCI_VAX_USA, dt, probe)
 
-        # convert date format
-        df['date'] = pd.to_datetime(df['date'])
-        df['date'] = df['date'].apply(lambda v: v.strftime('%Y-%m-%d'))
-
-        latest_date = df['date'].max()
         # check
-        cnt = sum(df['date']==dt)
         if cnt > 0:
             # which means at least 1 state has new data
             flag_jhucci = True
@@ -51,9 +124,10 @@ def detect_ds_jhucci_vax(parse_date=None):
             'ds': 'JHU CCI VAX',
             'lvtp': 'USA/VAX',
             'check_date': dt,
-            'errmsg': 'Found %s' % cnt,
+            'errmsg': _fmt_found(cnt, sample),
             'latest_date': latest_date,
-            'flag': flag_jhucci
+            'flag': flag_jhucci,
+            'sample': sample
         }
     
     except Exception as err:
@@ -85,7 +159,7 @@ def detect_ds_cdcvac(parse_date=None):
     print('* running %s for %s' % (sys._getframe().f_code.co_name, parse_date))
     
     try:
-        r = requests.get(cfg.DS_CDCVAC_STATE)
+        r = ds_fetcher.get(cfg.DS_CDCVAC_STATE)
         j = r.json()
         dt_data = j['vaccination_data'][0]['Date']
         ret = {
@@ -107,7 +181,7 @@ def detect_ds_cdcvac(parse_date=None):
     return ret
 
 
-def detect_ds_jhu_usa(parse_date=None):
+def detect_ds_jhu_usa(parse_date=None, probe=None):
     '''
     Detect the data source of John Hopkins
     '''
@@ -124,7 +198,7 @@ def detect_ds_jhu_usa(parse_date=None):
     print('* running %s for %s' % (sys._getframe().f_code.co_name, parse_date))
 
     try:
-        df = pd.read_csv(cfg.DS_JHU_WORLD_DAILY % dt_fn, nrows=2)
+        _head_or_read(cfg.DS_JHU_WORLD_DAILY % dt_fn, probe)
         flag_covid = True
         ret = {
             'success': True,
@@ -149,7 +223,7 @@ def detect_ds_jhu_usa(parse_date=None):
     return ret
 
 
-def detect_ds_jhu_state(parse_date=None):
+def detect_ds_jhu_state(parse_date=None, probe=None):
     '''
     Detect the data source of John Hopkins state level
     '''
@@ -166,7 +240,7 @@ def detect_ds_jhu_state(parse_date=None):
     print('* running %s for %s' % (sys._getframe().f_code.co_name, parse_date))
     
     try:
-        df = pd.read_csv(cfg.DS_JHU_STATE_DAILY % dt_fn, nrows=2)
+        _head_or_read(cfg.DS_JHU_STATE_DAILY % dt_fn, probe)
         flag_covid = True
         ret = {
             'success': True,
@@ -191,7 +265,7 @@ def detect_ds_jhu_state(parse_date=None):
     return ret
 
 
-def detect_ds_jhu_ts_world(parse_date=None):
+def detect_ds_jhu_ts_world(parse_date=None, probe=None):
     '''
     Detect the data source of John Hopkins time series data
     '''
@@ -208,7 +282,7 @@ def detect_ds_jhu_ts_world(parse_date=None):
     print('* running %s for %s' % (sys._getframe().f_code.co_name, parse_date))
     
     try:
-        df = pd.read_csv(cfg.DS_JHU_WORLD_TS_CONFIRMED, nrows=2)
+        df = _read_csv_head(cfg.DS_JHU_WORLD_TS_CONFIRMED, 2, probe)
         flag_covid = dt_col in df.columns
         ret = {
             'success': True,
@@ -233,7 +307,7 @@ def detect_ds_jhu_ts_world(parse_date=None):
     return ret
 
 
-def detect_ds_cdcpvi(parse_date=None):
+def detect_ds_cdcpvi(parse_date=None, probe=None):
     '''
     Detect the data source of CDC
     '''
@@ -250,7 +324,7 @@ def detect_ds_cdcpvi(parse_date=None):
     print('* running %s for %s' % (sys._getframe().f_code.co_name, parse_date))
     
     try:
-        df = pd.read_csv(cfg.DS_CDCPVI_RAW_DATA % dt_fn, nrows=2)
+        _head_or_read(cfg.DS_CDCPVI_RAW_DATA % dt_fn, probe)
         flag_covid = True
         ret = {
             'success': True,
@@ -275,7 +349,7 @@ def detect_ds_cdcpvi(parse_date=None):
     return ret
 
 
-def detect_ds_usafacts_covid(parse_date=None):
+def detect_ds_usafacts_covid(parse_date=None, probe=None):
     '''
     Detect data source USAFacts updates on cases
     '''
@@ -292,7 +366,7 @@ def detect_ds_usafacts_covid(parse_date=None):
     print('* running %s for %s' % (sys._getframe().f_code.co_name, parse_date))
     
     try:
-        covid_data = pd.read_csv(cfg.DS_USAFACTS_CONFIRM, nrows=2)
+        covid_data = _read_csv_head(cfg.DS_USAFACTS_CONFIRM, 2, probe)
         
         # get the latest data
         flag = parse_date in covid_data.columns
@@ -320,7 +394,7 @@ def detect_ds_usafacts_covid(parse_date=None):
     return ret
 
 
-def detect_ds_usafacts_death(parse_date=None):
+def detect_ds_usafacts_death(parse_date=None, probe=None):
     '''
     Detect data source USAFacts updates on deaths
     '''
@@ -337,7 +411,7 @@ def detect_ds_usafacts_death(parse_date=None):
     print('* running %s for %s' % (sys._getframe().f_code.co_name, parse_date))
     
     try:
-        df = pd.read_csv(cfg.DS_USAFACTS_DEATH, nrows=2)
+        df = _read_csv_head(cfg.DS_USAFACTS_DEATH, 2, probe)
         
         # get the latest data
         flag = parse_date in df.columns
@@ -365,7 +439,7 @@ def detect_ds_usafacts_death(parse_date=None):
     return ret
 
 
-def detect_ds_covidtracking_state(parse_date=None):
+def detect_ds_covidtracking_state(parse_date=None, probe=None):
     '''
     Detect data source COVID-19 Tracking updates of states
     '''
@@ -381,7 +455,7 @@ def detect_ds_covidtracking_state(parse_date=None):
     
     # get the latest data, just first two rows
     try:
-        df = pd.read_csv(cfg.DS_COVIDTRACKING_STATE, nrows=2)
+        df = _read_csv_head(cfg.DS_COVIDTRACKING_STATE, 2, probe)
 
         latest_date = '%s' % df.date.unique().max()
         d_latest_date = datetime.datetime.strptime(latest_date, '%Y-%m-%d')
@@ -410,7 +484,7 @@ def detect_ds_covidtracking_state(parse_date=None):
     return ret
 
 
-def detect_ds_covidtracking_usa(parse_date=None):
+def detect_ds_covidtracking_usa(parse_date=None, probe=None):
     '''
     Detect data source COVID-19 Tracking updates of USA
     '''
@@ -426,7 +500,7 @@ def detect_ds_covidtracking_usa(parse_date=None):
     
     # get the latest data, just first two rows
     try:
-        df = pd.read_csv(cfg.DS_COVIDTRACKING_USA, nrows=2)
+        df = _read_csv_head(cfg.DS_COVIDTRACKING_USA, 2, probe)
 
         latest_date = '%s' % df.date.unique().max()
         d_latest_date = datetime.datetime.strptime(latest_date, '%Y-%m-%d')
@@ -455,7 +529,7 @@ def detect_ds_covidtracking_usa(parse_date=None):
     return ret
 
 
-def detect_ds_actnow_county(parse_date=None):
+def detect_ds_actnow_county(parse_date=None, probe=None):
     '''
     Detect data source COVID Act Now updates of USA County
     '''
@@ -472,11 +546,10 @@ def detect_ds_actnow_county(parse_date=None):
 
     # get the TS data from COVID
     try:
-        df = pd.read_csv(cfg.DS_ACTNOW_TS_COUNTY)
+        latest_date, n_rows, sample = _get_date_stats(
+            cfg.DS_ACTNOW_TS_COUNTY, parse_date, probe)
 
         # check if the date row is available
-        n_rows = (df.date == parse_date).sum()
-        latest_date = df.date.max()
 
         if n_rows == 0:
             # this condition means the target date is not available
@@ -488,6 +561,7 @@ def detect_ds_actnow_county(parse_date=None):
                 'errmsg': 'Not available',
                 'latest_date': latest_date,
                 'flag': False,
+                'sample': sample,
             }
         else:
             ret = {
@@ -495,9 +569,10 @@ def detect_ds_actnow_county(parse_date=None):
                 'ds': 'COVID Act Now',
                 'lvtp': 'County/ALL',
                 'check_date': parse_date,
-                'errmsg': 'Found %s' % n_rows,
+                'errmsg': _fmt_found(n_rows, sample),
                 'latest_date': latest_date,
                 'flag': True,
+                'sample': sample,
             }
 
     except Exception as err:
@@ -531,7 +606,7 @@ def detect_ds_actnow_state(parse_date=None):
    
     # get the TS data from COVID
     try:
-        df = pd.read_csv(cfg.DS_ACTNOW_TS_STATE)
+        df = ds_fetcher.read_csv(cfg.DS_ACTNOW_TS_STATE)
 
         # check if the date row is available
         n_rows = (df.date == parse_date).sum()
@@ -588,7 +663,7 @@ def detect_ds_actnow_state(parse_date=None):
     return ret
 
 
-def detect_ds_nytimes_usa(parse_date=None):
+def detect_ds_nytimes_usa(parse_date=None, probe=None):
     '''
     Detect data source NYTimes updates of USA
     '''
@@ -607,10 +682,9 @@ def detect_ds_nytimes_usa(parse_date=None):
     
     # get the TS data from COVID
     try:
-        df = pd.read_csv(cfg.DS_NYTIMES_LATEST_USA)
+        latest_date, _, sample = _get_date_stats(cfg.DS_NYTIMES_LATEST_USA, parse_date, probe)
 
         # check if the date row is available
-        latest_date = df.date.max()
         latest_dt = datetime.datetime.strptime(latest_date, '%Y-%m-%d')
         if latest_dt >= yesterday:
             ret = {
@@ -621,6 +695,7 @@ def detect_ds_nytimes_usa(parse_date=None):
                 'errmsg': 'OK',
                 'latest_date': latest_date,
                 'flag': True,
+                'sample': sample,
             }
         else:
             ret = {
@@ -631,6 +706,7 @@ def detect_ds_nytimes_usa(parse_date=None):
                 'errmsg': 'Not available',
                 'latest_date': latest_date,
                 'flag': False,
+                'sample': sample,
             }
                 
     except Exception as err:
@@ -648,7 +724,7 @@ def detect_ds_nytimes_usa(parse_date=None):
     return ret
 
 
-def detect_ds_nytimes_state(parse_date=None):
+def detect_ds_nytimes_state(parse_date=None, probe=None):
     '''
     Detect data source NY Times updates of states
     '''
@@ -667,10 +743,9 @@ def detect_ds_nytimes_state(parse_date=None):
 
     # get the TS data from COVID
     try:
-        df = pd.read_csv(cfg.DS_NYTIMES_LATEST_STATE)
+        latest_date, _, sample = _get_date_stats(cfg.DS_NYTIMES_LATEST_STATE, parse_date, probe)
 
         # check if the date row is available
-        latest_date = df.date.max()
         latest_dt = datetime.datetime.strptime(latest_date, '%Y-%m-%d')
         if latest_dt >= yesterday:
             ret = {
@@ -681,6 +756,7 @@ def detect_ds_nytimes_state(parse_date=None):
                 'errmsg': 'OK',
                 'latest_date': latest_date,
                 'flag': True,
+                'sample': sample,
             }
         else:
             ret = {
@@ -691,6 +767,7 @@ def detect_ds_nytimes_state(parse_date=None):
                 'errmsg': 'Not available',
                 'latest_date': latest_date,
                 'flag': False,
+                'sample': sample,
             }
                 
     except Exception as err:
@@ -708,7 +785,7 @@ def detect_ds_nytimes_state(parse_date=None):
     return ret
 
 
-def detect_ds_nytimes_county(parse_date=None):
+def detect_ds_nytimes_county(parse_date=None, probe=None):
     '''
     Detect data source NY Times updates of counties
     '''
@@ -727,10 +804,9 @@ def detect_ds_nytimes_county(parse_date=None):
 
     # get the TS data from COVID
     try:
-        df = pd.read_csv(cfg.DS_NYTIMES_LATEST_COUNTY)
+        latest_date, _, sample = _get_date_stats(cfg.DS_NYTIMES_LATEST_COUNTY, parse_date, probe)
 
         # check if the date row is available
-        latest_date = df.date.max()
         latest_dt = datetime.datetime.strptime(latest_date, '%Y-%m-%d')
         if latest_dt >= yesterday:
             ret = {
@@ -741,6 +817,7 @@ def detect_ds_nytimes_county(parse_date=None):
                 'errmsg': 'OK',
                 'latest_date': latest_date,
                 'flag': True,
+                'sample': sample,
             }
         else:
             ret = {
@@ -751,6 +828,7 @@ def detect_ds_nytimes_county(parse_date=None):
                 'errmsg': 'Not available',
                 'latest_date': latest_date,
                 'flag': False,
+                'sample': sample,
             }
                 
     except Exception as err:
@@ -768,7 +846,7 @@ def detect_ds_nytimes_county(parse_date=None):
     return ret
 
 
-def detect_ds_owidvac_world(parse_date=None):
+def detect_ds_owidvac_world(parse_date=None, probe=None):
     '''
     Detect data source Our World in Data Vaccination updates of countries
     '''
@@ -787,25 +865,37 @@ def detect_ds_owidvac_world(parse_date=None):
 
     # get the TS data from COVID
     try:
-        df = pd.read_csv(cfg.DS_OWIDVAC_WORLD)
+        if probe is None:
+            probe = cfg.DETECT_PROBE_MODE
+
+        if probe:
+            # a sample only has the countries in the part which is read
+            latest_date, n_found, sample = _get_date_stats(
+                cfg.DS_OWIDVAC_WORLD, parse_date, probe)
+            errmsg = _fmt_found(n_found, sample)
+        else:
+            df = ds_fetcher.read_csv(cfg.DS_OWIDVAC_WORLD)
+            latest_date = df.date.max()
+            sample = None
+
+            # the n 
+            n_countries = len(df.iso_code.unique())
+            n_has_latest = df.loc[df.date == parse_date, 'total_vaccinations'].count()
+            errmsg = 'Found %s/%s' % (n_has_latest, n_countries)
 
         # check if the date row is available
-        latest_date = df.date.max()
         latest_dt = datetime.datetime.strptime(latest_date, '%Y-%m-%d')
 
-        # the n 
-        n_countries = len(df.iso_code.unique())
-        n_has_latest = df.loc[df.date == parse_date, 'total_vaccinations'].count()
-
         if latest_dt >= yesterday:
             ret = {
                 'success': True,
                 'ds': 'OWID VAC',
                 'lvtp': 'WORLD/VAX',
                 'check_date': parse_date,
-                'errmsg': 'Found %s/%s' % (n_has_latest, n_countries),
+                'errmsg': errmsg,
                 'latest_date': latest_date,
                 'flag': True,
+                'sample': sample,
             }
         else:
             ret = {
@@ -816,6 +906,7 @@ def detect_ds_owidvac_world(parse_date=None):
                 'errmsg': 'Not available',
                 'latest_date': latest_date,
                 'flag': False,
+                'sample': sample,
             }
                 
     except Exception as err:
@@ -833,6 +924,116 @@ def detect_ds_owidvac_world(parse_date=None):
     return ret
 
 
+# the detectors for the pipeline, the required ones must be updated
+# before downloading. The group is the --ds choice of the command line.
+DETECTORS = [
+    {'name': 'jhu_usa', 'group': 'jhu', 'func': detect_ds_jhu_usa, 'required': True},
+    {'name': 'jhu_state', 'group': 'jhu', 'func': detect_ds_jhu_state, 'required': True},
+    {'name': 'jhu_ts_world', 'group': 'jhu', 'func': detect_ds_jhu_ts_world, 'required': True},
+    {'name': 'cdcpvi', 'group': 'cdcpvi', 'func': detect_ds_cdcpvi, 'required': True},
+    {'name': 'actnow_state', 'group': 'actnow', 'func': detect_ds_actnow_state, 'required': True},
+    {'name': 'actnow_county', 'group': 'actnow', 'func': detect_ds_actnow_county, 'required': True},
+    {'name': 'owidvac_world', 'group': 'owidvac', 'func': detect_ds_owidvac_world, 'required': True},
+
+    # the followings are not required
+    {'name': 'jhucci_vax', 'group': 'jhucci_vax', 'func': detect_ds_jhucci_vax, 'required': False},
+    {'name': 'covidtracking_state', 'group': 'covidtracking', 'func': detect_ds_covidtracking_state, 'required': False},
+    {'name': 'covidtracking_usa', 'group': 'covidtracking', 'func': detect_ds_covidtracking_usa, 'required': False},
+    {'name': 'usafacts_covid', 'group': 'usafacts', 'func': detect_ds_usafacts_covid, 'required': False},
+    {'name': 'usafacts_death', 'group': 'usafacts', 'func': detect_ds_usafacts_death, 'required': False},
+    {'name': 'nytimes_usa', 'group': 'nytimes', 'func': detect_ds_nytimes_usa, 'required': False},
+    {'name': 'nytimes_state', 'group': 'nytimes', 'func': detect_ds_nytimes_state, 'required': False},
+    {'name': 'nytimes_county', 'group': 'nytimes', 'func': detect_ds_nytimes_county, 'required': False},
+]
+
+
+def _run_timed(func, parse_date, deadline=None):
+    '''
+    Run the detector and get the seconds it takes
+
+    The requests of the detector stop at the deadline, so the thread ends
+    even if the result is not waited for after the timeout.
+    '''
+    t0 = time.time()
+    with ds_fetcher.deadline(deadline):
+        ret = func(parse_date)
+
+    return ret, time.time() - t0
+
+
+def run_detectors(parse_date=None, groups=None, max_workers=None):
+    '''
+    Run the detectors concurrently
+
+    Each detector has its own timeout, cfg.DETECT_TIMEOUTS or the default
+    cfg.DETECT_TIMEOUT, counted from the start of the run. A detector
+    which doesn't finish in time is reported as not updated, and the 
+    others are not delayed by it. Its requests stop at the timeout, so its
+    thread ends soon after it.
+
+    Args:
+        parse_date: the YYYY-MM-DD date to detect, default yesterday
+        groups: the list of groups to run, default all the DETECTORS
+        max_workers: the number of threads, default one for each detector
+
+    Return:
+        an OrderedDict of name to DetectResult in the order of DETECTORS
+    '''
+    detectors = [ d for d in DETECTORS if groups is None or d['group'] in groups ]
+    if max_workers is None:
+        max_workers = max(1, len(detectors))
+
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix='detector'
+    )
+    t0 = time.time()
+    deadlines = [
+        t0 + cfg.DETECT_TIMEOUTS.get(d['name'], cfg.DETECT_TIMEOUT)
+        for d in detectors
+    ]
+    futures = [ 
+        executor.submit(_run_timed, d['func'], parse_date, deadline)
+        for d, deadline in zip(detectors, deadlines)
+    ]
+
+    rs = OrderedDict()
+    for d, future, deadline in zip(detectors, futures, deadlines):
+        try:
+            ret, elapsed = future.result(timeout=max(0, deadline - time.time()))
+        except TimeoutError:
+            ret = { 'errmsg': 'Timeout' }
+            elapsed = time.time() - t0
+        except Exception as err:
+            ret = { 'errmsg': 'Err: %s' % err }
+            elapsed = time.time() - t0
+
+        rs[d['name']] = DetectResult(
+            name=d['name'],
+            ds=ret.get('ds', d['name']),
+            lvtp=ret.get('lvtp', 'NA'),
+            check_date=ret.get('check_date', parse_date),
+            success=ret.get('success', False),
+            flag=ret.get('flag', False),
+            latest_date=ret.get('latest_date', 'NA'),
+            errmsg=ret['errmsg'],
+            required=d['required'],
+            elapsed=elapsed,
+            sample=ret.get('sample')
+        )
+
+    # don't wait for the timeout ones, they end at their deadlines
+    executor.shutdown(wait=False)
+
+    return rs
+
+
+def get_not_ready(rs):
+    '''
+    Get the names of the required data sources which are not updated
+    '''
+    return [ r.name for r in rs.values() if r.required and not r.flag ]
+
+
 def _c(v):
     if v:
         return colored('%s' % v, 'white', 'on_green', attrs=['bold'])
@@ -843,24 +1044,44 @@ def _c(v):
 def show_detect_rs(date, *argv):
     '''
     Show the results
+
+    The last date with * is of a sample, the probe has found the target
+    date in the tail or head of the file and stopped there
+
+    Args:
+        date: the target date
+        argv: the results of run_detectors, or the returns of detectors
     '''
     table = PrettyTable([
-        'Data Source', 'Level/Type', 'Target Date', 'Is Updated', 'Last Date', 'Other'
+        'Data Source', 'Level/Type', 'Target Date', 'Is Updated', 'Last Date', 'Time', 'Other'
     ])
 
-    for ret in argv:
+    rets = []
+    for arg in argv:
+        if isinstance(arg, OrderedDict):
+            # the results of run_detectors
+            rets += [ r._asdict() for r in arg.values() ]
+        else:
+            rets.append(arg)
+
+    for ret in rets:
         # each ret is a return from
         table.add_row([
             ret['ds'], 
             ret['lvtp'], 
             date, 
             _c(ret['flag']), 
-            ret['latest_date'], 
+            '%s*' % ret['latest_date'] if ret.get('sample') else ret['latest_date'], 
+            '%.1fs' % ret['elapsed'] if 'elapsed' in ret else 'NA',
             ret['errmsg']
         ])
     
     print(table)
 
+    if any([ ret.get('sample') for ret in rets ]):
+        print('* the date is found in the tail or head of the file with *,'
+            ' the last date and the rows found are only of that part')
+
 
 if __name__ == "__main__":
     today = datetime.datetime.today()
@@ -891,53 +1112,9 @@ if __name__ == "__main__":
         date = args.date
 
     # the result
-    rets = []
-    if 'all' == args.ds or 'jhu' in args.ds:
-        ret_jhu = detect_ds_jhu_usa(parse_date)
-        rets.append(ret_jhu)
-        ret = detect_ds_jhu_state(parse_date)
-        rets.append(ret)
-        ret = detect_ds_jhu_ts_world(parse_date)
-        rets.append(ret)
-
-    if 'all' == args.ds or 'jhucci_vax' in args.ds:
-        ret = detect_ds_jhucci_vax(parse_date)
-        rets.append(ret)
-    
-    if 'all' == args.ds or 'usafacts' in args.ds:
-        ret = detect_ds_usafacts_covid(parse_date)
-        rets.append(ret)
-        ret = detect_ds_usafacts_death(parse_date)
-        rets.append(ret)
-    
-    if 'all' == args.ds or 'cdcpvi' in args.ds:
-        ret_cdcpvi = detect_ds_cdcpvi(parse_date)
-        rets.append(ret_cdcpvi)
-
-    if 'all' == args.ds or 'covidtracking' in args.ds:
-        ret = detect_ds_covidtracking_state(parse_date)
-        rets.append(ret)
-        ret = detect_ds_covidtracking_usa(parse_date)
-        rets.append(ret)
-
-    if 'all' == args.ds or 'actnow' in args.ds:
-        ret = detect_ds_actnow_state(parse_date)
-        rets.append(ret)
-        ret = detect_ds_actnow_county(parse_date)
-        rets.append(ret)
-        
-    if 'all' == args.ds or 'nytimes' in args.ds:
-        ret = detect_ds_nytimes_usa(parse_date)
-        rets.append(ret)
-        ret = detect_ds_nytimes_state(parse_date)
-        rets.append(ret)
-        ret = detect_ds_nytimes_county(parse_date)
-        rets.append(ret)
-
-    if 'all' == args.ds or 'owidvac' in args.ds:
-        ret = detect_ds_owidvac_world(parse_date)
-        rets.append(ret)
+    groups = None if args.ds == 'all' else [args.ds]
+    rs = run_detectors(parse_date, groups)
         
     print('* the detect results of %s are shown in the following table:' % (date))
-    show_detect_rs(date, *rets)
+    show_detect_rs(date, rs)
     
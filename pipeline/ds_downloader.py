@@ -19,15 +19,16 @@ import datetime
 from datetime import timedelta
 import argparse
 
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
-import requests
-
-import wget
 
 from timeloop import Timeloop
 
 import ds_config as cfg
+import ds_store
+import ds_util
+import ds_fetcher
 
 import logging
 logging.basicConfig(
@@ -51,6 +52,15 @@ def _int(v):
     except:
         return 0
 
+
+def _int_arr(s):
+    '''
+    convert a series to integer as the _int, the invalid values are 0
+    '''
+    v = pd.to_numeric(s, errors='coerce')
+    v = v.where(np.isfinite(v), 0)
+    return v.astype(np.int64)
+
 def download_county_data_from_usafact(parse_date=None):
     '''
     Download COVID-19 case data and death data from USAFacts
@@ -71,10 +81,10 @@ def download_county_data_from_usafact(parse_date=None):
     # %s
     ###############################################################
     """ % (cfg.DS_USAFACTS_CONFIRM, cfg.DS_USAFACTS_DEATH))
-    covid_data = pd.read_csv(cfg.DS_USAFACTS_CONFIRM)
+    covid_data = ds_fetcher.read_csv(cfg.DS_USAFACTS_CONFIRM)
     print('* loaded USAFACT covid confirmed data')
 
-    death_data = pd.read_csv(cfg.DS_USAFACTS_DEATH)
+    death_data = ds_fetcher.read_csv(cfg.DS_USAFACTS_DEATH)
     print('* loaded USAFACT covid death data')
 
     # 07/01/2020: fix column name error!!!
@@ -186,7 +196,7 @@ def download_state_data_from_covidtracking(parse_date=None):
     # Download State-level Data from %s
     ###############################################################
     """ % cfg.DS_COVIDTRACKING_STATE)
-    state_data = pd.read_csv(cfg.DS_COVIDTRACKING_STATE)
+    state_data = ds_fetcher.read_csv(cfg.DS_COVIDTRACKING_STATE)
 
     # before saving, make sure the foler exsits
     if not os.path.exists(cfg.FOLDER_SRC_COVIDTRACKING):
@@ -221,7 +231,7 @@ def download_usa_data_from_covidtracking(parse_date=None):
     # Download USA-level Data from %s
     ###############################################################
     """ % cfg.DS_COVIDTRACKING_USA)
-    usa_data = pd.read_csv(cfg.DS_COVIDTRACKING_USA)
+    usa_data = ds_fetcher.read_csv(cfg.DS_COVIDTRACKING_USA)
 
     # before saving, make sure the foler exsits
     if not os.path.exists(cfg.FOLDER_SRC_COVIDTRACKING):
@@ -267,25 +277,75 @@ def _download_state_raw_data_from_jhu(parse_date=None):
     # create the fn for save
     save_raw_fn = cfg.FN_SAVE_JHU_STATE_RAW_DATA % dt
 
-    # check if exists
-    if os.path.exists(save_raw_fn):
-        os.remove(save_raw_fn)
-        print('* removed %s data exists %s' % (dt, save_raw_fn))
+    # download again only if modified since the last download
+    if ds_fetcher.download_cached(url_raw, save_raw_fn):
+        print('* done downloading %s to %s' % (dt, save_raw_fn))
+    else:
+        print('* not modified %s data %s' % (dt, save_raw_fn))
 
-    # else:
-    #     wget.download(url_raw, save_raw_fn)
-    #     print('* done downloading %s to %s' % (dt, save_raw_fn))
+    return dt
 
-    # 2021-04-25: no need to check, just download
-    wget.download(url_raw, save_raw_fn)
-    print('* done downloading %s to %s' % (dt, save_raw_fn))
 
-    return dt
+def _get_state_raw_fns_from_jhu(dt):
+    '''
+    Get the state raw file name of JHU, download it if not exist
+    '''
+    raw_fn = cfg.FN_SAVE_JHU_STATE_RAW_DATA % dt
+
+    if os.path.exists(raw_fn):
+        # if exists, OK
+        pass
+    else:
+        # if not exist, need to download from data source
+        _download_state_raw_data_from_jhu(dt)
 
+    return [raw_fn]
 
-def download_state_data_from_jhu(parse_date=None):
+
+def _normalize_state_raw_data_from_jhu(dt, f2a_dict):
+    '''
+    Normalize the state raw data of JHU on the given date
+    '''
+    raw_fn = cfg.FN_SAVE_JHU_STATE_RAW_DATA % dt
+
+    # get the data
+    df_raw = pd.read_csv(raw_fn)
+
+    # get the selected columns since other columns are not required
+    if 'Total_Test_Results' not in df_raw.columns:
+        # the old data may not have this column
+        df_raw['Total_Test_Results'] = None
+
+    dft = df_raw[['FIPS', 'Confirmed', 'Deaths', 'Recovered', 'Total_Test_Results']].copy()
+
+    # rename the columns to make it easier for parsing in the next stage
+    dft.rename(columns={
+        'Confirmed': 'cases',
+        'Deaths': 'deaths',
+        'Recovered': 'recovered',
+        'Total_Test_Results': 'totalTestResults'
+    }, inplace=True)
+
+    # make sure the data types
+    for col in ['FIPS', 'cases', 'deaths', 'recovered', 'totalTestResults']:
+        dft[col] = _int_arr(dft[col])
+
+    dft['state'] = dft['FIPS'].map(f2a_dict)
+
+    # add a date column
+    dft['date'] = dt
+
+    return dft
+
+
+def download_state_data_from_jhu(parse_date=None, incremental=None):
     '''
     Get the state data from JHU and merge
+
+    Args:
+        parse_date: YYYY-MM-DD format date string
+        incremental: True to normalize only the new or changed days and
+            reuse the fragments of other days, default cfg.STORE_INCREMENTAL
     '''
     if parse_date is None:
         today = datetime.datetime.today()
@@ -295,6 +355,9 @@ def download_state_data_from_jhu(parse_date=None):
     else:
         yesterday = datetime.datetime.strptime(parse_date, '%Y-%m-%d')
         dt = parse_date
+
+    if incremental is None:
+        incremental = cfg.STORE_INCREMENTAL
     
     # before saving, make sure the foler exsits
     if not os.path.exists(cfg.FOLDER_SRC_JHU):
@@ -305,6 +368,7 @@ def download_state_data_from_jhu(parse_date=None):
 
     # merge to produce the data file
     dates = pd.date_range(cfg.FIRST_DATE_JHU, parse_date)
+    date_vals = [ date.strftime("%Y-%m-%d") for date in dates ]
 
     # fips2abbr
     df_geo = pd.read_csv(cfg.FN_STATE_GEO)
@@ -315,54 +379,39 @@ def download_state_data_from_jhu(parse_date=None):
     f2a_dict[999]   = 'GP' # Grand Princess
     f2a_dict[99999] = 'GP' # Grand Princess
 
-    dfs = []
-    for date in tqdm(dates):
-        dt = date.strftime("%Y-%m-%d")
-        # check if the data file exists
-        raw_fn = cfg.FN_SAVE_JHU_STATE_RAW_DATA % dt
-
-        if os.path.exists(raw_fn):
-            # if both exist, OK
-            pass
-        else:
-            # if not exist, need to download from data source
-            _download_state_raw_data_from_jhu(dt)
-        
-        # get the data
-        df_raw = pd.read_csv(raw_fn)
-
-        # get the selected columns since other columns are not required
-        if 'Total_Test_Results' not in df_raw.columns:
-            # the old data may not have this column
-            df_raw['Total_Test_Results'] = None
-
-        dft = df_raw[['FIPS', 'Confirmed', 'Deaths', 'Recovered', 'Total_Test_Results']]
-        dft['state'] = dft['FIPS'].apply(lambda v: f2a_dict[_int(v)])
-
-        # rename the columns to make it easier for parsing in the next stage
-        dft.rename(columns={
-            'Confirmed': 'cases',
-            'Deaths': 'deaths',
-            'Recovered': 'recovered',
-            'Total_Test_Results': 'totalTestResults'
-        }, inplace=True)
-
-        # add a date column
-        dft['date'] = dt
-
-        # make sure the data types
-        dft['FIPS'] = dft['FIPS'].apply(lambda v: _int(v))
-        dft['cases'] = dft['cases'].apply(lambda v: _int(v))
-        dft['deaths'] = dft['deaths'].apply(lambda v: _int(v))
-        dft['recovered'] = dft['recovered'].apply(lambda v: _int(v))
-        dft['totalTestResults'] = dft['totalTestResults'].apply(lambda v: _int(v))
-
-        # put this data into 
-        dfs.append(dft)
-    
-    df_all = pd.concat(dfs, ignore_index=True)
+    # download the missing days in parallel
+    missing_dates = [ dt for dt in date_vals 
+        if not os.path.exists(cfg.FN_SAVE_JHU_STATE_RAW_DATA % dt) ]
+    if len(missing_dates) > 0:
+        print('* downloading %s missing days' % len(missing_dates))
+        ds_fetcher.run_parallel([ 
+            (_download_state_raw_data_from_jhu, (dt, )) 
+            for dt in missing_dates 
+        ])
+
+    if incremental:
+        df_all, n_parsed = ds_store.build_history(
+            cfg.FOLDER_SRC_JHU_FRAG,
+            date_vals,
+            _get_state_raw_fns_from_jhu,
+            lambda dt: _normalize_state_raw_data_from_jhu(dt, f2a_dict)
+        )
+        print('* normalized %s/%s new or changed days' % (n_parsed, len(date_vals)))
+
+        full_save_all_fn = cfg.FN_SAVE_JHU_STATE_ALL_DATA % parse_date
+        if n_parsed == 0 and ds_store.exists(full_save_all_fn):
+            print('* no change in %s state data %s' % (parse_date, full_save_all_fn))
+            return parse_date
+
+    else:
+        dfs = []
+        for dt in tqdm(date_vals):
+            _get_state_raw_fns_from_jhu(dt)
+            dfs.append(_normalize_state_raw_data_from_jhu(dt, f2a_dict))
+        df_all = pd.concat(dfs, ignore_index=True)
+
     full_save_all_fn = cfg.FN_SAVE_JHU_STATE_ALL_DATA % parse_date
-    df_all.to_csv(full_save_all_fn, index=False)
+    ds_store.save_df(df_all, full_save_all_fn)
     print('* merged %s state data to %s' % (parse_date, full_save_all_fn))
 
     return parse_date
@@ -388,32 +437,20 @@ def download_world_ts_data_from_jhu(parse_date=None):
     url_covid = cfg.DS_JHU_WORLD_TS_CONFIRMED
     fn_covid = cfg.FN_SAVE_JHU_WORLD_TS_COVID_DATA % parse_date
 
-    # # check if exists
-    if os.path.exists(fn_covid):
-        os.remove(fn_covid)
-        print('* removed %s data exists %s' % (parse_date, fn_covid))
-    # else:
-    #     wget.download(url_covid, fn_covid)
-    #     print('* done downloading %s to %s' % (parse_date, fn_covid))
-
-    # 2021-04-25: just download directly
-    wget.download(url_covid, fn_covid)
-    print('* done downloading %s to %s' % (parse_date, fn_covid))
+    # download again only if modified since the last download
+    if ds_fetcher.download_cached(url_covid, fn_covid):
+        print('* done downloading %s to %s' % (parse_date, fn_covid))
+    else:
+        print('* not modified %s data %s' % (parse_date, fn_covid))
 
     url_death = cfg.DS_JHU_WORLD_TS_DEATH
     fn_death = cfg.FN_SAVE_JHU_WORLD_TS_DEATH_DATA % parse_date
 
-    # check if exists
-    if os.path.exists(fn_death):
-        os.remove(fn_death)
-        print('* removed %s data exists %s' % (parse_date, fn_death))
-    # else:
-    #     wget.download(url_death, fn_death)
-    #     print('* done downloading %s to %s' % (parse_date, fn_death))
-
-    # 2021-04-25: just download directly
-    wget.download(url_death, fn_death)
-    print('* done downloading %s to %s' % (parse_date, fn_death))
+    # download again only if modified since the last download
+    if ds_fetcher.download_cached(url_death, fn_death):
+        print('* done downloading %s to %s' % (parse_date, fn_death))
+    else:
+        print('* not modified %s data %s' % (parse_date, fn_death))
 
     return parse_date
 
@@ -448,13 +485,11 @@ def _download_allusa_raw_and_rst_data_from_cdcpvi(parse_date=None):
     # create the fn for save
     save_raw_fn = cfg.FN_SAVE_CDCPVI_USA_RAW_DATA % parse_date
 
-    # check if exists
-    if os.path.exists(save_raw_fn):
-        os.remove(save_raw_fn)
-        print('* removed %s data exists %s' % (parse_date, save_raw_fn))
-    
-    wget.download(url_raw, save_raw_fn)
-    print('* done downloading %s to %s' % (parse_date, save_raw_fn))
+    # download again only if modified since the last download
+    if ds_fetcher.download_cached(url_raw, save_raw_fn):
+        print('* done downloading %s to %s' % (parse_date, save_raw_fn))
+    else:
+        print('* not modified %s data %s' % (parse_date, save_raw_fn))
 
     # generate the URL for downloading raw pvi
     url_rst = cfg.DS_CDCPVI_RST_DATA % date_for_src
@@ -462,30 +497,88 @@ def _download_allusa_raw_and_rst_data_from_cdcpvi(parse_date=None):
     # create the fn for save
     save_rst_fn = cfg.FN_SAVE_CDCPVI_USA_RST_DATA % parse_date
 
-    # check if exists
-    if os.path.exists(save_rst_fn):
-        # remove the existed file
-        os.remove(save_rst_fn)
-        print('* removed %s data %s' % (parse_date, save_rst_fn))
-    # else:
-    #     wget.download(url_rst, save_rst_fn)
-    #     print('* done downloading %s to %s' % (parse_date, save_rst_fn))
-
-    # 2021-04-25: just download
-    wget.download(url_rst, save_rst_fn)
-    print('* done downloading %s to %s' % (parse_date, save_rst_fn))
+    # download again only if modified since the last download
+    if ds_fetcher.download_cached(url_rst, save_rst_fn):
+        print('* done downloading %s to %s' % (parse_date, save_rst_fn))
+    else:
+        print('* not modified %s data %s' % (parse_date, save_rst_fn))
 
     return parse_date
 
 
-def download_allusa_data_from_cdcpvi(parse_date=None):
+def _get_allusa_raw_fns_from_cdcpvi(dt):
+    '''
+    Get the raw and rst file names of CDC PVI, download them if not exist
+    '''
+    raw_fn = cfg.FN_SAVE_CDCPVI_USA_RAW_DATA % dt
+    rst_fn = cfg.FN_SAVE_CDCPVI_USA_RST_DATA % dt
+
+    if os.path.exists(raw_fn) and os.path.exists(rst_fn):
+        # if both exist, OK
+        pass
+    else:
+        # if not exist, need to download from data source
+        _download_allusa_raw_and_rst_data_from_cdcpvi(dt)
+
+    return [raw_fn, rst_fn]
+
+
+def _merge_allusa_raw_and_rst_data_from_cdcpvi(dt):
+    '''
+    Merge the raw and rst data of CDC PVI on the given date
+    '''
+    raw_fn = cfg.FN_SAVE_CDCPVI_USA_RAW_DATA % dt
+    rst_fn = cfg.FN_SAVE_CDCPVI_USA_RST_DATA % dt
+
+    # get the data
+    df_raw = pd.read_csv(raw_fn, skiprows=12)
+    df_rst = pd.read_csv(rst_fn)
+
+    # get the selected columns since other columns are not required
+    dft_raw = df_raw[['casrn', 'name', 'Cases', 'Deaths']]
+    dft_rst = df_rst[['ToxPi Score', 'Name']]
+
+    # merge!
+    dft = pd.merge(dft_raw, dft_rst, how='inner', 
+            left_on="name", right_on='Name')
+
+    # rename the columns to make it easier for parsing in the next stage
+    dft.rename(columns={
+        'casrn': 'countyFIPS',
+        'ToxPi Score': 'pvi',
+        'Cases': 'cases',
+        'Deaths': 'deaths',
+    }, inplace=True)
+
+    # remove the name, just need the fips
+    del dft['name']
+    del dft['Name']
+
+    # add a date column
+    dft['date'] = dt
+
+    # reduce the digits in pvi
+    dft['pvi'] = dft['pvi'].round(4)
+
+    return dft
+
+
+def download_allusa_data_from_cdcpvi(parse_date=None, incremental=None):
     '''
     Get the data from CDC PVI
+
+    Args:
+        parse_date: YYYY-MM-DD format date string
+        incremental: True to merge only the new or changed days and reuse
+            the fragments of other days, default cfg.STORE_INCREMENTAL
     '''
     if parse_date == None:
         today = datetime.datetime.today()
         yesterday = today - datetime.timedelta(days=1)
         parse_date = yesterday.strftime('%Y-%m-%d')
+
+    if incremental is None:
+        incremental = cfg.STORE_INCREMENTAL
     
     print("""
     ###############################################################
@@ -502,57 +595,42 @@ def download_allusa_data_from_cdcpvi(parse_date=None):
 
     # merge to produce the data
     dates = pd.date_range(cfg.FIRST_DATE, parse_date)
+    date_vals = [ date.strftime("%Y-%m-%d") for date in dates ]
+
+    # download the missing days in parallel
+    missing_dates = [ dt for dt in date_vals 
+        if not os.path.exists(cfg.FN_SAVE_CDCPVI_USA_RAW_DATA % dt) or 
+           not os.path.exists(cfg.FN_SAVE_CDCPVI_USA_RST_DATA % dt) ]
+    if len(missing_dates) > 0:
+        print('* downloading %s missing days' % len(missing_dates))
+        ds_fetcher.run_parallel([ 
+            (_download_allusa_raw_and_rst_data_from_cdcpvi, (dt, )) 
+            for dt in missing_dates 
+        ])
+
+    if incremental:
+        df_all, n_parsed = ds_store.build_history(
+            cfg.FOLDER_SRC_CDCPVI_FRAG,
+            date_vals,
+            _get_allusa_raw_fns_from_cdcpvi,
+            _merge_allusa_raw_and_rst_data_from_cdcpvi
+        )
+        print('* merged %s/%s new or changed days' % (n_parsed, len(date_vals)))
+
+        full_save_all_fn = cfg.FN_SAVE_CDCPVI_USA_ALL_DATA % parse_date
+        if n_parsed == 0 and ds_store.exists(full_save_all_fn):
+            print('* no change in %s all usa data %s' % (parse_date, full_save_all_fn))
+            return parse_date
+
+    else:
+        dfs = []
+        for dt in tqdm(date_vals):
+            _get_allusa_raw_fns_from_cdcpvi(dt)
+            dfs.append(_merge_allusa_raw_and_rst_data_from_cdcpvi(dt))
+        df_all = pd.concat(dfs, ignore_index=True)
 
-    dfs = []
-    for date in tqdm(dates):
-        dt = date.strftime("%Y-%m-%d")
-        # check if the data file exists
-        raw_fn = cfg.FN_SAVE_CDCPVI_USA_RAW_DATA % dt
-        rst_fn = cfg.FN_SAVE_CDCPVI_USA_RST_DATA % dt
-
-        if os.path.exists(raw_fn) and os.path.exists(rst_fn):
-            # if both exist, OK
-            pass
-        else:
-            # if not exist, need to download from data source
-            _download_allusa_raw_and_rst_data_from_cdcpvi(dt)
-        
-        # get the data
-        df_raw = pd.read_csv(raw_fn, skiprows=12)
-        df_rst = pd.read_csv(rst_fn)
-
-        # get the selected columns since other columns are not required
-        dft_raw = df_raw[['casrn', 'name', 'Cases', 'Deaths']]
-        dft_rst = df_rst[['ToxPi Score', 'Name']]
-
-        # merge!
-        dft = pd.merge(dft_raw, dft_rst, how='inner', 
-                left_on="name", right_on='Name')
-
-        # rename the columns to make it easier for parsing in the next stage
-        dft.rename(columns={
-            'casrn': 'countyFIPS',
-            'ToxPi Score': 'pvi',
-            'Cases': 'cases',
-            'Deaths': 'deaths',
-        }, inplace=True)
-
-        # remove the name, just need the fips
-        del dft['name']
-        del dft['Name']
-
-        # add a date column
-        dft['date'] = dt
-
-        # reduce the digits in pvi
-        dft['pvi'] = dft['pvi'].round(4)
-
-        # put this data into 
-        dfs.append(dft)
-    
-    df_all = pd.concat(dfs, ignore_index=True)
     full_save_all_fn = cfg.FN_SAVE_CDCPVI_USA_ALL_DATA % parse_date
-    df_all.to_csv(full_save_all_fn, index=False)
+    ds_store.save_df(df_all, full_save_all_fn)
     print('* merged %s all usa data to %s' % (parse_date, full_save_all_fn))
 
     return parse_date
@@ -582,7 +660,7 @@ def download_current_state_vac_data_from_cdvvac(parse_date=None):
         dt = parse_date
 
     # load the latest data
-    r = requests.get(cfg.DS_CDCVAC_STATE)
+    r = ds_fetcher.get(cfg.DS_CDCVAC_STATE)
     j = r.json()
     dt_data = j['vaccination_data'][0]['Date']
 
@@ -641,7 +719,7 @@ def download_usa_vax_data_from_jhucci(parse_date=None):
         dt = parse_date
 
     try:
-        df = pd.read_csv(cfg.DS_JHUCCI_VAX_USA)
+        df = ds_fetcher.read_csv(cfg.DS_JHUCCI_VAX_USA)
 
         # convert date format
         df['date'] = pd.to_datetime(df['date'])
@@ -675,30 +753,30 @@ def download_world_vax_data_from_owidvac(parse_date=None):
         dt = parse_date
 
     try:
-        df = pd.read_csv(cfg.DS_OWIDVAC_WORLD)
+        df = ds_fetcher.read_csv(cfg.DS_OWIDVAC_WORLD)
 
         # fill the missing dates for each country
         countries = df.iso_code.unique().tolist()
         date_vals = df.date.unique().tolist()
         date_vals.sort()
         
-        cnt = 0
+        # all the (country, date) pairs on the calendar, and the missing
+        # ones are appended as empty rows in the same order as before
         print('* fixing missing dates in country data ...')
-        for country in tqdm(countries):
-            for date_val in date_vals:
-                is_date_data_available = df.loc[(df.iso_code == country) & (df.date == date_val), 'date'].count()
-
-                if is_date_data_available == 0:
-                    # which means no available 
-                    df = df.append({'date': date_val, 'iso_code': country}, ignore_index=True)
-                    cnt += 1
+        full_index = pd.MultiIndex.from_product(
+            [countries, date_vals], names=['iso_code', 'date']
+        )
+        existing = pd.MultiIndex.from_frame(df[['iso_code', 'date']])
+        df_missing = full_index[~full_index.isin(existing)].to_frame(index=False)
+        df = pd.concat([df, df_missing], ignore_index=True)
+        cnt = len(df_missing)
         
         # save the JSON file
         if not os.path.exists(cfg.FOLDER_SRC_OWIDVAC):
             os.makedirs(cfg.FOLDER_SRC_OWIDVAC, exist_ok=True)
             
         full_fn = cfg.FN_SAVE_OWIDVAC_WORLD_VAC_DATA % dt
-        df.to_csv(full_fn, index=False)
+        ds_store.save_df(df, full_fn)
         print('* saved %s owid vac data (added %s records) to %s' % (parse_date, cnt, full_fn))
 
         return parse_date
@@ -726,19 +804,14 @@ def download_state_data_from_actnow(parse_date=None):
     # Download State-level Data from %s
     ###############################################################
     """ % cfg.DS_ACTNOW_TS_STATE)
-    df = pd.read_csv(cfg.DS_ACTNOW_TS_STATE)
+    df = ds_fetcher.read_csv(cfg.DS_ACTNOW_TS_STATE)
 
     # since we download the parse_date
     # the data must be available for most of the regions
     states = df.state.unique().tolist()
 
-    for state in tqdm(states):
-        # need to fill the nan values for cases
-        df.loc[df.state == state, 'actuals.cases'] = df.loc[df.state == state, 'actuals.cases'].fillna(method='ffill').fillna(0)
-        # fill the nan values for deaths
-        df.loc[df.state == state, 'actuals.deaths'] = df.loc[df.state == state, 'actuals.deaths'].fillna(method='ffill').fillna(0)
-        # fill the nan values for vaccination
-        df.loc[df.state == state, 'actuals.vaccinationsCompleted'] = df.loc[df.state == state, 'actuals.vaccinationsCompleted'].fillna(method='ffill').fillna(0)
+    # fill the nan values of cases, deaths and vaccination for all states
+    ds_util.ffill_by_group(df, 'state', cfg.ACTNOW_FFILL_COLUMNS)
     print('* fixed the missing for %s states' % (len(states)))
 
     # create the folder if not exist
@@ -747,7 +820,7 @@ def download_state_data_from_actnow(parse_date=None):
 
     # save the data
     full_save_fn = cfg.FN_SAVE_ACTNOW_STATE_DATA % parse_date
-    df.to_csv(full_save_fn, index=False)
+    ds_store.save_df(df, full_save_fn)
     print('* saved %s COVID Act Now state data to %s' % (parse_date, full_save_fn))
 
 
@@ -770,14 +843,18 @@ def download_county_data_from_actnow(parse_date=None):
     # Download County-level Data from %s
     ###############################################################
     """ % cfg.DS_ACTNOW_TS_COUNTY)
-    df = pd.read_csv(cfg.DS_ACTNOW_TS_COUNTY)
+    df = ds_fetcher.read_csv(cfg.DS_ACTNOW_TS_COUNTY)
 
     # the raw county data is too large ... just keep the needed columns
     df = df[[
         'fips', 'state', 'date',
         'actuals.cases', 'actuals.deaths',
         'actuals.vaccinationsInitiated', 'actuals.vaccinationsCompleted',
-    ]]
+    ]].copy()
+
+    # fill the nan values of each county
+    ds_util.ffill_by_group(df, 'fips', cfg.ACTNOW_FFILL_COLUMNS)
+    print('* fixed the missing for %s counties' % (df.fips.nunique()))
 
     # create the folder if not exist
     if not os.path.exists(cfg.FOLDER_SRC_ACTNOW):
@@ -785,7 +862,7 @@ def download_county_data_from_actnow(parse_date=None):
 
     # save the data
     full_save_fn = cfg.FN_SAVE_ACTNOW_COUNTY_DATA % parse_date
-    df.to_csv(full_save_fn, index=False)
+    ds_store.save_df(df, full_save_fn)
     print('* saved %s COVID Act Now county data to %s' % (parse_date, full_save_fn))
 
 
@@ -808,7 +885,7 @@ def download_usa_data_from_nytimes(parse_date=None):
     # Download USA-level Data from %s
     ###############################################################
     """ % cfg.DS_NYTIMES_TS_USA)
-    df = pd.read_csv(cfg.DS_NYTIMES_TS_USA)
+    df = ds_fetcher.read_csv(cfg.DS_NYTIMES_TS_USA)
 
     # since we download the parse_date
     # create the folder if not exist
@@ -840,7 +917,7 @@ def download_state_data_from_nytimes(parse_date=None):
     # Download State-level Data from %s
     ###############################################################
     """ % cfg.DS_NYTIMES_TS_STATE)
-    df = pd.read_csv(cfg.DS_NYTIMES_TS_STATE)
+    df = ds_fetcher.read_csv(cfg.DS_NYTIMES_TS_STATE)
 
     # since we download the parse_date
     # create the folder if not exist
@@ -872,7 +949,7 @@ def download_county_data_from_nytimes(parse_date=None):
     # Download County-level Data from %s
     ###############################################################
     """ % cfg.DS_NYTIMES_TS_COUNTY)
-    df = pd.read_csv(cfg.DS_NYTIMES_TS_COUNTY)
+    df = ds_fetcher.read_csv(cfg.DS_NYTIMES_TS_COUNTY)
 
     # since we download the parse_date
     # create the folder if not exist
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+The download manager for the data sources
+
+All the HTTP requests share one keep-alive session with retries and backoff,
+and the number of concurrent requests to each host is limited. The
+independent downloads can be run in a thread pool by run_parallel.
+
+For the source files which are downloaded again and again, download_cached
+keeps the ETag and Last-Modified of each file in a sidecar JSON and sends a
+conditional GET, so the unchanged file is not downloaded or written again.
+
+For the detectors, probe_csv_dates checks the dates in a remote CSV without
+downloading it. It reuses the last result when the ETag is not changed, and
+reads only the head and tail of the file by HTTP Range. When the target
+date is not in the tail, or the server doesn't support Range, it scans the
+stream, which stops at the target date. The result tells whether it's of
+the whole file or a sample. The read_csv_head reads only the first rows in
+the same way.
+
+A thread can set a deadline of its requests, e.g., a detector which is
+not waited for after its timeout. The timeout of each request is cut to the
+time left, and the streams and the retries stop at the deadline, so the
+thread ends soon after it.
+
+The URLs are all from ds_config, so a local HTTP server can stand in for the
+data sources by changing the cfg.DS_* values.
+'''
+import io
+import os
+import re
+import csv
+import json
+import time
+import threading
+import contextlib
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import ds_config as cfg
+
+import logging
+logger = logging.getLogger("Fetcher")
+logger.setLevel(logging.INFO)
+
+
+# the shared session and the per-host semaphores
+_session = None
+_host_sems = {}
+_lock = threading.Lock()
+
+# the last probe result of each URL
+_probe_cache = {}
+
+# the deadline of the requests in each thread
+_local = threading.local()
+
+
+class DeadlineError(requests.exceptions.Timeout):
+    '''
+    The deadline of the requests in the thread is passed
+    '''
+    pass
+
+
+@contextlib.contextmanager
+def deadline(t):
+    '''
+    Set the deadline of the requests in this thread
+
+    Args:
+        t: the time.time() of the deadline, None for no deadline
+    '''
+    prev = getattr(_local, 'deadline', None)
+    _local.deadline = t
+    try:
+        yield
+    finally:
+        _local.deadline = prev
+
+
+def _get_time_left():
+    '''
+    Get the seconds left before the deadline, None if no deadline
+    '''
+    t = getattr(_local, 'deadline', None)
+    return None if t is None else t - time.time()
+
+
+def _check_deadline():
+    '''
+    Raise DeadlineError if the deadline is passed
+    '''
+    left = _get_time_left()
+    if left is not None and left <= 0:
+        raise DeadlineError('Deadline exceeded')
+
+
+def _get_timeout():
+    '''
+    Get the timeout of a request, cfg.FETCH_TIMEOUT or the time left
+    '''
+    _check_deadline()
+    left = _get_time_left()
+
+    return cfg.FETCH_TIMEOUT if left is None else min(cfg.FETCH_TIMEOUT, left)
+
+
+class _Retry(Retry):
+    '''
+    The retries which stop at the deadline of the thread
+    '''
+    def is_exhausted(self):
+        left = _get_time_left()
+        return super().is_exhausted() or (left is not None and left <= 0)
+
+    def get_backoff_time(self):
+        left = _get_time_left()
+        backoff = super().get_backoff_time()
+        return backoff if left is None else max(0, min(backoff, left))
+
+
+def get_session():
+    '''
+    Get the shared session, create it for the first time
+    '''
+    global _session
+    with _lock:
+        if _session is None:
+            retry = _Retry(
+                total=cfg.FETCH_RETRIES,
+                backoff_factor=cfg.FETCH_BACKOFF_FACTOR,
+                status_forcelist=cfg.FETCH_RETRY_STATUS,
+            )
+            adapter = HTTPAdapter(
+                max_retries=retry,
+                pool_connections=cfg.FETCH_MAX_WORKERS,
+                pool_maxsize=cfg.FETCH_MAX_WORKERS
+            )
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+
+    return _session
+
+
+def _get_host_sem(url):
+    '''
+    Get the semaphore for limiting the concurrent requests to the host
+    '''
+    host = urlparse(url).netloc
+    with _lock:
+        if host not in _host_sems:
+            _host_sems[host] = threading.BoundedSemaphore(cfg.FETCH_MAX_PER_HOST)
+
+    return _host_sems[host]
+
+
+def request(method, url, **kwargs):
+    '''
+    Send a request with the shared session
+
+    Args:
+        method: the HTTP method, e.g., GET or HEAD
+        url: the URL
+        kwargs: the other arguments for requests, e.g., headers
+
+    Return:
+        the response, raise HTTPError for 4xx and 5xx
+    '''
+    kwargs.setdefault('timeout', _get_timeout())
+    with _get_host_sem(url):
+        r = get_session().request(method, url, **kwargs)
+        r.raise_for_status()
+
+    return r
+
+
+def get(url, **kwargs):
+    '''
+    GET the URL, the same as requests.get
+    '''
+    return request('GET', url, **kwargs)
+
+
+def download(url, fn):
+    '''
+    Download the URL to the file, like wget.download
+
+    The content is written to a temp file and then renamed,
+    so that a failed download doesn't leave a broken file.
+
+    Return:
+        the file name
+    '''
+    fn_tmp = fn + '.tmp'
+    with _get_host_sem(url):
+        with get_session().get(url, stream=True, timeout=_get_timeout()) as r:
+            r.raise_for_status()
+            with open(fn_tmp, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=cfg.FETCH_CHUNK_SIZE):
+                    _check_deadline()
+                    f.write(chunk)
+
+    os.replace(fn_tmp, fn)
+
+    return fn
+
+
+def _get_meta_fn(fn):
+    '''
+    Get the sidecar file name of the cache meta of the given file
+    '''
+    return fn + cfg.FETCH_META_SUFFIX
+
+
+def download_cached(url, fn):
+    '''
+    Download the URL to the file if it's modified since last download
+
+    The ETag and Last-Modified of the last download are sent as
+    If-None-Match and If-Modified-Since. When the server replies 304,
+    the local file is kept as is.
+
+    Return:
+        True if the file is downloaded, False if it's not modified
+    '''
+    fn_meta = _get_meta_fn(fn)
+    meta = None
+    if os.path.exists(fn) and os.path.exists(fn_meta):
+        with open(fn_meta) as f:
+            meta = json.load(f)
+        # the cache is for another URL
+        if meta.get('url') != url:
+            meta = None
+
+    headers = {}
+    if meta is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    fn_tmp = fn + '.tmp'
+    with _get_host_sem(url):
+        with get_session().get(url, headers=headers, stream=True, 
+            timeout=_get_timeout()) as r:
+            if r.status_code == 304:
+                return False
+
+            r.raise_for_status()
+            with open(fn_tmp, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=cfg.FETCH_CHUNK_SIZE):
+                    _check_deadline()
+                    f.write(chunk)
+
+            meta = {
+                'url': url,
+                'etag': r.headers.get('ETag'),
+                'last_modified': r.headers.get('Last-Modified'),
+            }
+
+    os.replace(fn_tmp, fn)
+    with open(fn_meta, 'w') as f:
+        json.dump(meta, f)
+
+    return True
+
+
+def _read_content(r):
+    '''
+    Read the content of the streamed response, stop at the deadline
+    '''
+    chunks = []
+    for chunk in r.iter_content(chunk_size=cfg.FETCH_CHUNK_SIZE):
+        _check_deadline()
+        chunks.append(chunk)
+
+    return b''.join(chunks)
+
+
+def _parse_csv_lines(lines, names, date_col):
+    '''
+    Parse the date column of the CSV lines to YYYY-MM-DD
+    '''
+    if len(lines) == 0:
+        return []
+
+    df = pd.read_csv(
+        io.StringIO('\n'.join(lines)), 
+        names=names, header=None, usecols=[date_col], dtype=str
+    )
+    dates = pd.to_datetime(df[date_col], errors='coerce').dropna()
+
+    return dates.dt.strftime('%Y-%m-%d').tolist()
+
+
+def _read_range(url, start, end=None):
+    '''
+    Read a range of bytes
+
+    Args:
+        start: the first byte, or the last -start bytes if negative
+        end: the last byte, None for the end of the file
+
+    Return:
+        the text and True if the range is the whole file, or (None, False)
+        if the server doesn't support Range. The text is decoded ignoring
+        the characters cut at both ends, so the whole file is decided by
+        the Content-Range or the bytes, not the text
+    '''
+    rng = 'bytes=%s-%s' % (start, '' if end is None else end) \
+        if start >= 0 else 'bytes=%s' % start
+    with _get_host_sem(url):
+        with get_session().get(url, headers={'Range': rng}, stream=True,
+            timeout=_get_timeout()) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                return None, False
+            data = _read_content(r)
+            content_range = r.headers.get('Content-Range', '')
+
+    # e.g., bytes 0-4095/8192
+    m = re.match(r'bytes (\d+)-(\d+)/(\d+)$', content_range.strip())
+    if m is not None:
+        whole = int(m.group(1)) == 0 and int(m.group(2)) + 1 >= int(m.group(3))
+    elif start < 0:
+        whole = len(data) < -start
+    else:
+        whole = start == 0 and end is not None and len(data) < end - start + 1
+
+    return data.decode('utf8', errors='ignore'), whole
+
+
+def _scan_stream(url, date_col, parse_date, stop=True):
+    '''
+    Scan the CSV stream in batches
+
+    Args:
+        stop: True to stop at the first batch of parse_date
+
+    Return:
+        the latest date, the number of rows of parse_date, and True if the
+        whole file is scanned
+    '''
+    latest_date = None
+    n_found = 0
+    complete = True
+    with _get_host_sem(url):
+        with get_session().get(url, stream=True, timeout=_get_timeout()) as r:
+            r.raise_for_status()
+            # the lines are bytes if the server doesn't send the charset
+            r.encoding = r.encoding or 'utf8'
+            it = r.iter_lines(decode_unicode=True)
+            names = next(csv.reader([next(it)]))
+
+            lines = []
+            for line in it:
+                _check_deadline()
+                lines.append(line)
+                if len(lines) < cfg.PROBE_SCAN_LINES:
+                    continue
+
+                dates = _parse_csv_lines(lines, names, date_col)
+                lines = []
+                if len(dates) > 0:
+                    latest_date = max(dates + ([latest_date] if latest_date else []))
+                n_found += dates.count(parse_date)
+                if stop and n_found > 0:
+                    complete = False
+                    break
+
+            # the last batch
+            dates = _parse_csv_lines(lines, names, date_col)
+            if len(dates) > 0:
+                latest_date = max(dates + ([latest_date] if latest_date else []))
+            n_found += dates.count(parse_date)
+
+    return latest_date, n_found, complete
+
+
+def probe_csv_dates(url, date_col, parse_date):
+    '''
+    Probe the dates in a remote CSV without downloading the whole file
+
+    The CSV is usually sorted by region then date, so the tail is a sample
+    of the last region. When parse_date is in the tail, the file has it,
+    and the probe stops there. Otherwise, the other regions may still have
+    it, so the whole file is scanned as a stream. When the server doesn't
+    support Range, the stream stops at the first batch of parse_date.
+
+    So whether the file has parse_date, or any date after it, is the same
+    as reading the whole file. But the latest date and the rows of a sample
+    are only of the part which is read, they are the lower bounds of the
+    whole file. The result is reused when the ETag or Last-Modified of the
+    URL is not changed.
+
+    Args:
+        url: the URL of the CSV
+        date_col: the column name of the date
+        parse_date: the YYYY-MM-DD date to find
+
+    Return:
+        a dict of:
+        - latest_date: the latest date in the part which is read
+        - n_found: the number of rows of parse_date in the part
+        - sample: None if the whole file is read, otherwise `tail` or
+          `head`, the part which is read
+        - method: cache, range, stream or scan
+    '''
+    # check if changed since last probe
+    r = request('HEAD', url, allow_redirects=True)
+    version = r.headers.get('ETag') or r.headers.get('Last-Modified')
+    key = (url, date_col, parse_date)
+    with _lock:
+        cached = _probe_cache.get(key)
+    if version is not None and cached is not None and cached['version'] == version:
+        return dict(cached['ret'], method='cache')
+
+    # read the head for the column names, then the tail
+    head, _ = _read_range(url, 0, cfg.PROBE_HEAD_BYTES - 1)
+    tail = None
+    if head is not None:
+        tail, tail_whole = _read_range(url, -cfg.PROBE_TAIL_BYTES)
+
+    ret = None
+    if tail is not None:
+        names = next(csv.reader([head.splitlines()[0]]))
+        # the first line is the header if the file is smaller than the
+        # tail, otherwise it may be cut
+        lines = tail.splitlines()[1:]
+        sample = None if tail_whole else 'tail'
+        dates = _parse_csv_lines(lines, names, date_col)
+
+        # not found in the tail doesn't mean not in the file
+        if sample is None or dates.count(parse_date) > 0:
+            ret = {
+                'latest_date': max(dates) if len(dates) > 0 else None,
+                'n_found': dates.count(parse_date),
+                'sample': sample,
+                'method': 'range'
+            }
+
+    if ret is None:
+        # scan the whole file if the tail is not enough
+        latest_date, n_found, complete = _scan_stream(
+            url, date_col, parse_date, stop=tail is None
+        )
+        ret = {
+            'latest_date': latest_date,
+            'n_found': n_found,
+            'sample': None if complete else 'head',
+            'method': 'stream' if tail is None else 'scan'
+        }
+
+    if version is not None:
+        with _lock:
+            _probe_cache[key] = dict(version=version, ret=ret)
+
+    return ret
+
+
+def read_csv_head(url, nrows):
+    '''
+    Read the first rows of the remote CSV without downloading the whole file
+
+    The head is read by HTTP Range, or streamed line by line when the
+    server doesn't support Range.
+    '''
+    head, head_whole = _read_range(url, 0, cfg.PROBE_HEAD_BYTES - 1)
+    if head is not None:
+        lines = head.splitlines()
+        # the last line may be cut
+        if not head_whole:
+            lines = lines[:-1]
+    else:
+        lines = []
+        with _get_host_sem(url):
+            with get_session().get(url, stream=True, timeout=_get_timeout()) as r:
+                r.raise_for_status()
+                r.encoding = r.encoding or 'utf8'
+                for line in r.iter_lines(decode_unicode=True):
+                    _check_deadline()
+                    lines.append(line)
+                    if len(lines) > nrows:
+                        break
+
+    return pd.read_csv(io.StringIO('\n'.join(lines[:nrows + 1])))
+
+
+def read_csv(url, **kwargs):
+    '''
+    Read the CSV from the URL with the shared session
+    '''
+    with _get_host_sem(url):
+        with get_session().get(url, stream=True, timeout=_get_timeout()) as r:
+            r.raise_for_status()
+            content = _read_content(r)
+
+    return pd.read_csv(io.BytesIO(content), **kwargs)
+
+
+def run_parallel(tasks, max_workers=None):
+    '''
+    Run the independent tasks in a thread pool
+
+    Args:
+        tasks: a list of (func, args) tuples
+        max_workers: the number of threads, default cfg.FETCH_MAX_WORKERS
+
+    Return:
+        the list of results in the same order of tasks,
+        the first exception is raised after all tasks are finished
+    '''
+    if max_workers is None:
+        max_workers = cfg.FETCH_MAX_WORKERS
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [ executor.submit(func, *args) for func, args in tasks ]
+
+    rets = []
+    for future in futures:
+        rets.append(future.result())
+
+    return rets
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+The JSON serializer for the parsers and the merger
+
+The stdlib encoder calls NpEncoder.default for every NumPy scalar, which is
+slow for the history files with thousands of values. When orjson is
+installed, it's used with OPT_SERIALIZE_NUMPY, which encodes the NumPy
+arrays and scalars natively. Otherwise, the stdlib encoder with NpEncoder
+is used.
+
+Both backends write compact UTF-8 JSON without spaces, and NaN and
+infinity as null, since orjson can't write them in other ways. The only
+difference left is the format of some floats, e.g., 1e-07 by stdlib and
+1e-7 by orjson, so the parsed values are the same, but the bytes (and the
+hashes of the files) may change with the backend. The backend can be set
+by cfg.JSON_BACKEND: auto, orjson or stdlib.
+'''
+import math
+import json
+
+import numpy as np
+
+import ds_config as cfg
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class NpEncoder(json.JSONEncoder):
+    '''
+    The stdlib encoder for the NumPy data types
+    '''
+    def default(self, obj):
+        return _default(obj)
+
+
+def _default(obj):
+    '''
+    Convert the NumPy object which is not supported by the encoder
+    '''
+    if isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.bool_):
+        return bool(obj)
+    elif isinstance(obj, np.complexfloating):
+        return {'real': obj.real, 'imag': obj.imag}
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, np.void):
+        return None
+    else:
+        raise TypeError('Object of type %s is not JSON serializable' %
+            type(obj).__name__)
+
+
+def _nan_to_none(obj):
+    '''
+    Replace NaN and infinity with None, as orjson writes them
+    '''
+    if isinstance(obj, dict):
+        return { k: _nan_to_none(v) for k, v in obj.items() }
+    elif isinstance(obj, (list, tuple)):
+        return [ _nan_to_none(v) for v in obj ]
+    elif isinstance(obj, np.ndarray):
+        return _nan_to_none(obj.tolist())
+    elif isinstance(obj, (float, np.floating)):
+        return obj if math.isfinite(obj) else None
+
+    return obj
+
+
+def get_backend():
+    '''
+    Get the name of the backend, orjson or stdlib
+    '''
+    if cfg.JSON_BACKEND == 'stdlib' or orjson is None:
+        return 'stdlib'
+
+    return 'orjson'
+
+
+def dumps_bytes(obj):
+    '''
+    Serialize the object to UTF-8 JSON bytes
+    '''
+    if get_backend() == 'orjson':
+        return orjson.dumps(
+            obj,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+
+    return dumps(obj).encode('utf8')
+
+
+def dumps(obj):
+    '''
+    Serialize the object to JSON text
+    '''
+    if get_backend() == 'orjson':
+        return dumps_bytes(obj).decode('utf8')
+
+    return json.dumps(
+        _nan_to_none(obj),
+        cls=NpEncoder,
+        separators=(',', ':'),
+        ensure_ascii=False,
+        allow_nan=False
+    )
+
+
+def dump(obj, fp):
+    '''
+    Serialize the object to the text file object
+    '''
+    fp.write(dumps(obj))
+
+
+def dump_file(obj, fn):
+    '''
+    Serialize the object to the file
+    '''
+    with open(fn, 'wb') as fp:
+        fp.write(dumps_bytes(obj))
+
+
+def loads(s):
+    '''
+    Load the JSON text or bytes
+
+    The files written by the old stdlib encoder may contain NaN, which
+    orjson doesn't accept, so they are loaded by the stdlib decoder.
+    '''
+    if get_backend() == 'orjson':
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(s)
+
+
+def load_file(fn):
+    '''
+    Load the JSON file
+    '''
+    with open(fn, 'rb') as fp:
+        return loads(fp.read())
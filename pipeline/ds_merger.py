@@ -8,10 +8,10 @@
 #
 #%% load packages
 import os
-import json
-import pathlib
+import shutil
 import datetime
 import argparse
+import multiprocessing
 
 import pandas as pd
 print('* loaded packages!')
@@ -19,15 +19,172 @@ print('* loaded packages!')
 from tqdm import tqdm
 
 import ds_config as cfg
+import ds_records
+import ds_json
+import ds_compact
+import ds_delta
+import ds_precompress
+import ds_publish
 
 ###############################################################################
 # The V2 functions
 ###############################################################################
 
 #%% main functions
-def merge_states_v2(parse_date=None):
+def get_merge_index(parse_date):
+    '''
+    Get the shared index of the parsed records for all the merges
+
+    The names of the records are grouped by the prefix in one pass, so the
+    merges don't scan all the records for each state. And the shared
+    documents, e.g., WORLD-USA and the states, are loaded only once.
+
+    Return:
+        a dict of:
+        - records: the name -> JSON text from ds_records.get_index
+        - states: the list of state names, e.g., USA-AL
+        - counties: the state FIPS -> list of county names, e.g., USA-01001
+        - countries: the list of country names, e.g., WORLD-USA
+        - mchrrs: the list of MCHRR names
+        - docs: the cache of the loaded shared documents
+        - last_update: the (date, date_str) of last update for all outputs
+    '''
+    records = ds_records.get_index(parse_date)
+    today = datetime.datetime.today()
+    mi = {
+        'records': records,
+        'states': [],
+        'counties': {},
+        'countries': [],
+        'mchrrs': [],
+        'docs': {},
+        'last_update': (
+            today.strftime('%Y-%m-%d'),
+            today.strftime('%b %-d, %Y')
+        )
+    }
+
+    for name in records:
+        if name.startswith('WORLD-'):
+            mi['countries'].append(name)
+        elif name.startswith('MCHRR-'):
+            mi['mchrrs'].append(name)
+        elif name.startswith('USA-') and name[4:].isdigit():
+            mi['counties'].setdefault(name[4:6], []).append(name)
+        elif name.startswith('USA-'):
+            mi['states'].append(name)
+
+    print('* found %s records, %s states, %s counties, %s countries, %s mchrrs' % (
+        len(records), 
+        len(mi['states']),
+        sum([ len(v) for v in mi['counties'].values() ]),
+        len(mi['countries']),
+        len(mi['mchrrs'])
+    ))
+
+    return mi
+
+
+def _load_doc(mi, name):
+    '''
+    Load the shared document once, a shallow copy without dates is returned
+
+    Return:
+        the document without dates, and the dates
+    '''
+    if name not in mi['docs']:
+        mi['docs'][name] = ds_records.load(mi['records'], name)
+
+    tmp = dict(mi['docs'][name])
+    dates = tmp.pop('dates')
+
+    return tmp, dates
+
+
+def get_output_folder():
+    '''
+    Get the folder of the merged files, the staging folder if published later
+    '''
+    if cfg.PUBLISH_STAGING:
+        return cfg.FOLDER_RST_V2_STAGING
+
+    return cfg.FOLDER_RST_V2
+
+
+def clear_output_folder():
+    '''
+    Empty the staging folder before merging, so the files left by a failed
+    run are not published with this run
+    '''
+    if not cfg.PUBLISH_STAGING:
+        return
+
+    if os.path.exists(cfg.FOLDER_RST_V2_STAGING):
+        shutil.rmtree(cfg.FOLDER_RST_V2_STAGING)
+        print('* cleared staging folder %s' % cfg.FOLDER_RST_V2_STAGING)
+    os.makedirs(cfg.FOLDER_RST_V2_STAGING, exist_ok=True)
+
+
+def publish_output(parse_date):
+    '''
+    Precompress the merged files and publish them if staged
+    '''
+    if cfg.PRECOMPRESS_OUTPUT:
+        ds_precompress.compress_all([get_output_folder()])
+
+    if cfg.PUBLISH_STAGING:
+        ds_publish.publish(parse_date)
+
+
+def save_output(j, fn):
+    '''
+    Save the merged JSON, and the compact schema if cfg.OUTPUT_COMPACT,
+    and the delta of the last days if cfg.OUTPUT_DELTA
+    '''
+    ds_json.dump_file(j, fn)
+
+    if cfg.OUTPUT_COMPACT:
+        fn_compact = os.path.splitext(fn)[0] + cfg.FN_OUTPUT_COMPACT_SUFFIX
+        ds_json.dump_file(ds_compact.encode(j), fn_compact)
+
+    if cfg.OUTPUT_DELTA:
+        fn_delta = os.path.splitext(fn)[0] + cfg.FN_OUTPUT_DELTA_SUFFIX
+        ds_json.dump_file(ds_delta.make_delta(j, cfg.OUTPUT_DELTA_DAYS), fn_delta)
+
+
+def merge_all_v2(parse_date=None):
+    '''
+    Merge the state, USA, world and MCHRR JSON files on one shared index
+    '''
+    # get the date if it's None
+    today = datetime.datetime.today()
+    yesterday = today - datetime.timedelta(days=1)
+    if parse_date == None:
+        parse_date = yesterday.strftime('%Y-%m-%d')
+        print("* set parse_date=%s" % parse_date)
+
+    clear_output_folder()
+    mi = get_merge_index(parse_date)
+
+    merge_states_v2(parse_date, mi)
+    merge_usa_v2(parse_date, mi)
+    merge_world_v2(parse_date, mi)
+    merge_mchrr_v2(parse_date, mi)
+
+
+def merge_states_v2(parse_date=None, mi=None, n_workers=None):
     '''
     Merge state level JSON file v2
+
+    The states are independent, so they can be merged by a pool of
+    processes. Each state is merged by the same function in both modes,
+    and the output is the same as the serial loop.
+
+    Args:
+        parse_date: the YYYY-MM-DD date
+        mi: the shared index by get_merge_index, default a new one
+        n_workers: the number of processes, default MERGE_STATE_WORKERS,
+            1 for merging in serial
     '''
     # get the date if it's None
     today = datetime.datetime.today()
@@ -55,12 +212,20 @@ def merge_states_v2(parse_date=None):
         print('* NOT found %s' % folder_parsed_files)
         return
 
-    # get all the data files in the parsed folder
-    fns = os.listdir(folder_parsed_files)
-    print('* found %s files' % (
-        len(fns)
-    ))
-    
+    # get all the records of the parsers
+    if mi is None:
+        mi = get_merge_index(parse_date)
+
+    if n_workers is None:
+        n_workers = cfg.MERGE_STATE_WORKERS
+
+    # create folder if not exists
+    folder_output_json = get_output_folder()
+    if not os.path.exists(folder_output_json):
+        os.makedirs(folder_output_json, exist_ok=True)
+
+    # each task only has the records of this state
+    arguments_list = []
     for idx, row in dft.iterrows():
         FIPS = idx
         FIPS = '%s' % FIPS if FIPS > 9 else '0%s' % FIPS
@@ -68,77 +233,123 @@ def merge_states_v2(parse_date=None):
 
         if state == 'US': continue
 
-        j = {
-            "geo": "state",
-            "state": state,
-            "date": parse_date,
-            "county_data": {},
-            "dates": None,
-            "state_data": None,
-            "usa_data": None
-        }
-
-        # Now, fill the missing parts!
-        # add the county_data
-        cnt_counties = 0
-        for fn in fns:
-            if fn.startswith('USA-%s' % FIPS):
-                countyFIPS = fn[4:4+5]
-                tmp = json.load(open(os.path.join(folder_parsed_files, fn)))
-                del tmp['dates']
-                j['county_data'][countyFIPS] = tmp
-                cnt_counties += 1
-
-        # special rule for the 5 territories
-        # since we don't have the county level data
-        if state in ["AS", "GU", "MP", "PR", "VI"]:
-            # just set the FIPS as the first item
-            tFIPS = '%s001' % FIPS
-
-            # load the state-level data and reset the FIPS
-            tmp = json.load(open(os.path.join(folder_parsed_files, 'USA-%s.json' % state)))
-            del tmp['dates']
-            tmp['FIPS'] = tFIPS
+        arguments_list.append((
+            state,
+            FIPS,
+            [ (name, mi['records'][name]) for name in mi['counties'].get(FIPS, []) ],
+            mi['records']['USA-%s' % state]
+        ))
 
-            # put state-level data as the county-level data
-            j['county_data'][tFIPS] = tmp
+    initargs = (mi['records']['WORLD-USA'], parse_date, mi['last_update'])
+    if n_workers > 1:
+        with multiprocessing.Pool(
+            processes=n_workers,
+            initializer=_init_state_worker,
+            initargs=initargs) as pool:
+            rets = pool.starmap(_merge_state, arguments_list)
+    else:
+        _init_state_worker(*initargs)
+        rets = [ _merge_state(*args) for args in arguments_list ]
 
-        # add the state_data
-        tmp = json.load(open(os.path.join(folder_parsed_files, 'USA-%s.json' % state)))
+    for state, cnt_counties in rets:
+        print('* merged %s %s data with %s counties' % (parse_date, state, cnt_counties))
+
+    print('* merged all %s states data %s' % (len(dft), parse_date))
+
+
+def _init_state_worker(usa_text, parse_date, last_update):
+    '''
+    Load the shared USA data once for each worker
+    '''
+    global _g_state_merge
+    _g_state_merge = dict(
+        usa=ds_json.loads(usa_text),
+        parse_date=parse_date,
+        last_update=last_update
+    )
+
+
+def _merge_state(state, FIPS, counties, state_text):
+    '''
+    Merge and save the JSON file of one state
+
+    Args:
+        state: the state abbr, e.g., AL
+        FIPS: the 2-digit state FIPS
+        counties: the list of (name, JSON text) of the counties
+        state_text: the JSON text of the state
+
+    Return:
+        the state and the number of counties
+    '''
+    parse_date = _g_state_merge['parse_date']
+
+    j = {
+        "geo": "state",
+        "state": state,
+        "date": parse_date,
+        "county_data": {},
+        "dates": None,
+        "state_data": None,
+        "usa_data": None
+    }
+
+    # Now, fill the missing parts!
+    # add the county_data
+    cnt_counties = 0
+    for name, text in counties:
+        countyFIPS = name[4:4+5]
+        tmp = ds_json.loads(text)
         del tmp['dates']
-        j['state_data'] = tmp
+        j['county_data'][countyFIPS] = tmp
+        cnt_counties += 1
 
-        # add the usa_data
-        tmp = json.load(open(os.path.join(folder_parsed_files, 'WORLD-USA.json')))
-        dates = tmp['dates']
+    # special rule for the 5 territories
+    # since we don't have the county level data
+    if state in ["AS", "GU", "MP", "PR", "VI"]:
+        # just set the FIPS as the first item
+        tFIPS = '%s001' % FIPS
+
+        # load the state-level data and reset the FIPS
+        tmp = ds_json.loads(state_text)
         del tmp['dates']
-        j['usa_data'] = tmp
-        
-        # add the dates
-        j['dates'] = dates
+        tmp['FIPS'] = tFIPS
 
-        # add the last update
-        j['last_update_date'] = datetime.datetime.today().strftime('%Y-%m-%d')
-        j['last_update_date_str'] = datetime.datetime.today().strftime('%b %-d, %Y')
+        # put state-level data as the county-level data
+        j['county_data'][tFIPS] = tmp
 
-        # create folder if not exists
-        folder_output_json = cfg.FOLDER_RST_V2
-        if not os.path.exists(folder_output_json):
-            os.makedirs(folder_output_json, exist_ok=True)
+    # add the state_data
+    tmp = ds_json.loads(state_text)
+    del tmp['dates']
+    j['state_data'] = tmp
 
-        # save json for this county
-        fn_web_json = os.path.join(
-            folder_output_json, cfg.FN_OUTPUT_STATE % state
-        )
-        json.dump(j, open(fn_web_json, 'w'))
-        print('* merged %s %s data with %s counties' % (parse_date, state, cnt_counties))
+    # add the usa_data
+    tmp = dict(_g_state_merge['usa'])
+    dates = tmp.pop('dates')
+    j['usa_data'] = tmp
+    
+    # add the dates
+    j['dates'] = dates
 
-    print('* merged all %s states data %s' % (len(dft), parse_date))
+    # add the last update
+    j['last_update_date'], j['last_update_date_str'] = _g_state_merge['last_update']
+
+    # save json for this county
+    fn_web_json = os.path.join(
+        get_output_folder(), cfg.FN_OUTPUT_STATE % state
+    )
+    save_output(j, fn_web_json)
 
+    return state, cnt_counties
 
-def merge_usa_v2(parse_date=None):
+
+def merge_usa_v2(parse_date=None, mi=None):
     '''
     Merge the USA whole data v2
+
+    Args:
+        parse_date: the YYYY-MM-DD date
+        mi: the shared index by get_merge_index, default a new one
     '''
     # get the date if it's None
     today = datetime.datetime.today()
@@ -166,6 +377,10 @@ def merge_usa_v2(parse_date=None):
         print('* NOT found %s' % folder_parsed_files)
         return
 
+    # get all the records of the parsers
+    if mi is None:
+        mi = get_merge_index(parse_date)
+
     # create the output json
     j = {
         "geo": "country",
@@ -183,16 +398,12 @@ def merge_usa_v2(parse_date=None):
         j['states'].append(state)
 
         # add the state_data
-        tmp = json.load(open(os.path.join(folder_parsed_files, 'USA-%s.json' % state)))
-        del tmp['dates']
+        tmp, _ = _load_doc(mi, 'USA-%s' % state)
         
         j['state_data'][state] = tmp
 
     # add the usa_data
-    tmp = json.load(open(os.path.join(folder_parsed_files, 'WORLD-USA.json')))
-    dates = tmp['dates']
-
-    del tmp['dates']
+    tmp, dates = _load_doc(mi, 'WORLD-USA')
 
     # add the usa data
     j['usa_data'] = tmp
@@ -201,23 +412,26 @@ def merge_usa_v2(parse_date=None):
     j['dates'] = dates
 
     # add the last update
-    j['last_update_date'] = datetime.datetime.today().strftime('%Y-%m-%d')
-    j['last_update_date_str'] = datetime.datetime.today().strftime('%b %-d, %Y')
+    j['last_update_date'], j['last_update_date_str'] = mi['last_update']
 
     # create folder if not exists
-    folder_output_json = cfg.FOLDER_RST_V2
+    folder_output_json = get_output_folder()
     if not os.path.exists(folder_output_json):
         os.makedirs(folder_output_json, exist_ok=True)
 
     # save json for this county
     fn_web_json = os.path.join(folder_output_json, cfg.FN_OUTPUT_USA)
-    json.dump(j, open(fn_web_json, 'w'))
+    save_output(j, fn_web_json)
     print('* merged USA data %s to %s' % (parse_date, fn_web_json))
 
 
-def merge_world_v2(parse_date=None):
+def merge_world_v2(parse_date=None, mi=None):
     '''
     Merge the whole world data v2
+
+    Args:
+        parse_date: the YYYY-MM-DD date
+        mi: the shared index by get_merge_index, default a new one
     '''
     # get the date if it's None
     today = datetime.datetime.today()
@@ -241,8 +455,9 @@ def merge_world_v2(parse_date=None):
         print('* NOT found %s' % folder_parsed_files)
         return
 
-    # get all the data files in the parsed folder
-    fns = os.listdir(folder_parsed_files)    
+    # get all the records of the parsers
+    if mi is None:
+        mi = get_merge_index(parse_date)
 
     # create the output json
     j = {
@@ -251,12 +466,9 @@ def merge_world_v2(parse_date=None):
         "dates": [],
         "world_data": {}
     }
-    for fn in tqdm(fns):
-        if not fn.startswith('WORLD-'):
-            continue
-        
+    for name in tqdm(mi['countries']):
         # add the data of this country
-        tmp = json.load(open(os.path.join(folder_parsed_files, fn)))
+        tmp = ds_records.load(mi['records'], name)
         FIPS = tmp['FIPS']
         
         # use the date of USA
@@ -269,23 +481,26 @@ def merge_world_v2(parse_date=None):
         j['world_data'][FIPS] = tmp
 
     # add the last update
-    j['last_update_date'] = datetime.datetime.today().strftime('%Y-%m-%d')
-    j['last_update_date_str'] = datetime.datetime.today().strftime('%b %-d, %Y')
+    j['last_update_date'], j['last_update_date_str'] = mi['last_update']
 
     # create folder if not exists
-    folder_output_json = cfg.FOLDER_RST_V2
+    folder_output_json = get_output_folder()
     if not os.path.exists(folder_output_json):
         os.makedirs(folder_output_json, exist_ok=True)
 
     # save json for this county
     fn_web_json = os.path.join(folder_output_json, cfg.FN_OUTPUT_WORLD)
-    json.dump(j, open(fn_web_json, 'w'))
+    save_output(j, fn_web_json)
     print('* merged WORLD data %s to %s' % (parse_date, fn_web_json))
 
 
-def merge_mchrr_v2(parse_date=None):
+def merge_mchrr_v2(parse_date=None, mi=None):
     '''
     Merge the whole MCHRR data v2
+
+    Args:
+        parse_date: the YYYY-MM-DD date
+        mi: the shared index by get_merge_index, default a new one
     '''
     # get the date if it's None
     today = datetime.datetime.today()
@@ -309,8 +524,9 @@ def merge_mchrr_v2(parse_date=None):
         print('* NOT found %s' % folder_parsed_files)
         return
 
-    # get all the data files in the parsed folder
-    fns = os.listdir(folder_parsed_files)    
+    # get all the records of the parsers
+    if mi is None:
+        mi = get_merge_index(parse_date)
 
     # create the output json
     j = {
@@ -323,54 +539,44 @@ def merge_mchrr_v2(parse_date=None):
         "county_data": {}
     }
 
-    for fn in tqdm(fns):
-        if fn.startswith('MCHRR-'):
-            # add the data of this region
-            tmp = json.load(open(os.path.join(folder_parsed_files, fn)))
-            FIPS = tmp['FIPS']
-
-            # remove the dates
-            del tmp['dates']
-            
-            # add the state
-            j['mchrr_data'][FIPS] = tmp
-
-        elif fn.startswith('USA-MN') or \
-            fn.startswith('USA-WI') or \
-            fn.startswith('USA-FL') or \
-            fn.startswith('USA-AZ'):
+    for name in tqdm(mi['mchrrs']):
+        # add the data of this region
+        tmp = ds_records.load(mi['records'], name)
+        FIPS = tmp['FIPS']
 
-            # add the data of this state
-            tmp = json.load(open(os.path.join(folder_parsed_files, fn)))
-            state = tmp['state']
+        # remove the dates
+        del tmp['dates']
+        
+        # add the state
+        j['mchrr_data'][FIPS] = tmp
 
-            # remove the dates
-            del tmp['dates']
-            
-            # add the state
-            j['state_data'][state] = tmp
+    for name in mi['states']:
+        if name not in ['USA-MN', 'USA-WI', 'USA-FL', 'USA-AZ']:
+            continue
 
-        elif fn.startswith('WORLD-USA'):
+        # add the data of this state
+        tmp, _ = _load_doc(mi, name)
+        state = tmp['state']
 
-            # add the data of this state
-            tmp = json.load(open(os.path.join(folder_parsed_files, fn)))
-            state = tmp['state']
-            j['dates'] = tmp['dates']
+        # add the state
+        j['state_data'][state] = tmp
 
-            # remove the dates
-            del tmp['dates']
-            
-            # add the state
-            j['usa_data'] = tmp
+    # add the usa data
+    tmp, dates = _load_doc(mi, 'WORLD-USA')
+    j['dates'] = dates
+    j['usa_data'] = tmp
 
-        elif fn.startswith('USA-') and len(fn) > 12:
-            countyFIPS = fn[4:4+5]
+    # the lookup of the counties in MCHRR
+    mchrr_counties = set(cfg.MC_HRR_COUNTIES_5DS)
+    for names in mi['counties'].values():
+        for name in names:
+            countyFIPS = name[4:4+5]
 
-            if countyFIPS not in cfg.MC_HRR_COUNTIES_5DS:
+            if countyFIPS not in mchrr_counties:
                 continue
 
             # it's a county!
-            tmp = json.load(open(os.path.join(folder_parsed_files, fn)))
+            tmp = ds_records.load(mi['records'], name)
             _fips = tmp['FIPS']
 
             # remove the dates
@@ -379,21 +585,17 @@ def merge_mchrr_v2(parse_date=None):
             # add the state
             j['county_data'][_fips] = tmp
 
-        else:
-            continue
-
     # add the last update
-    j['last_update_date'] = datetime.datetime.today().strftime('%Y-%m-%d')
-    j['last_update_date_str'] = datetime.datetime.today().strftime('%b %-d, %Y')
+    j['last_update_date'], j['last_update_date_str'] = mi['last_update']
 
     # create folder if not exists
-    folder_output_json = cfg.FOLDER_RST_V2
+    folder_output_json = get_output_folder()
     if not os.path.exists(folder_output_json):
         os.makedirs(folder_output_json, exist_ok=True)
 
     # save json for this county
     fn_web_json = os.path.join(folder_output_json, cfg.FN_OUTPUT_MCHRR)
-    json.dump(j, open(fn_web_json, 'w'))
+    save_output(j, fn_web_json)
     print('* merged WORLD data %s to %s' % (parse_date, fn_web_json))
 
 
@@ -423,18 +625,24 @@ if __name__ == "__main__":
         cfg.FOLDER_PRS, args.calc, parse_date
     )
     if os.path.exists(result_path):
+        # all the merges share one index
+        clear_output_folder()
+        mi = get_merge_index(parse_date)
+
         if args.lv == 'all' or 'state' in args.lv:
-            merge_states_v2(parse_date)
+            merge_states_v2(parse_date, mi)
             print('* merged the state level data')
         if args.lv == 'all' or 'usa' in args.lv:
-            merge_usa_v2(parse_date)
+            merge_usa_v2(parse_date, mi)
             print('* merged the USA level data')
         if args.lv == 'all' or 'world' in args.lv:
-            merge_world_v2(parse_date)
+            merge_world_v2(parse_date, mi)
             print('* merged the world level data')
         if args.lv == 'all' or 'mchrr' in args.lv:
-            merge_mchrr_v2(parse_date)
+            merge_mchrr_v2(parse_date, mi)
             print('* merged the mchrr level data')
+
+        publish_output(parse_date)
             
     else:
         print('* NOT found the specified date %s results data in %s' % (
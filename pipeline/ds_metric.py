@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+The CrRW metric engine
+
+All the parsers calculate the same metrics on the cumulative cases and deaths.
+Instead of looking up the values day by day, the engine takes the 2-D
+(region x date) matrix and calculates all metrics of all regions at once.
+'''
+import numpy as np
+
+import ds_config as cfg
+
+from ds_util import _floor_arr
+from ds_util import _round_arr
+
+
+def calc_crrw_metrics(nccs, dths, pops, start_idx=None, zero_guard=True, valid=None):
+    '''
+    Calculate the CrRW metrics for a batch of regions
+
+    Args:
+        nccs: 2-D array (region x date) of the total cases
+        dths: 2-D array (region x date) of the deaths
+        pops: 1-D array of the population of each region
+        start_idx: the first date index of the output, default START_DATE_IDX
+        zero_guard: True to set 0 when the denominator of dtr and crt is 0,
+            as the county parser does. False to keep the inf/nan result,
+            as the parsers using try/except do.
+        valid: 2-D bool array (region x date[start_idx:]) of the dates with
+            data, the other dates are set as no data, default all valid
+
+    Return:
+        a dict of 2-D arrays (region x date[start_idx:]) with the rounded
+        values and the raw int values of cris and crvs:
+        - nccs, dncs, d7vs, npps, dpps, d7ps
+        - dths, dtrs, cdts
+        - crps, crts, cris, crvs, crcs
+    '''
+    if start_idx is None:
+        start_idx = cfg.START_DATE_IDX
+
+    nccs = np.atleast_2d(np.asarray(nccs, dtype=np.float64))
+    dths = np.atleast_2d(np.asarray(dths, dtype=np.float64))
+    pops = np.asarray(pops, dtype=np.float64).reshape(-1, 1)
+    n_dates = nccs.shape[1]
+
+    # the shifted views of the total cases
+    def _past(n):
+        return nccs[:, start_idx - n:n_dates - n]
+
+    ncc = nccs[:, start_idx:]
+    dth = dths[:, start_idx:]
+    ncc_1 = _past(1)
+    ncc_7 = _past(7)
+    ncc_14 = _past(14)
+    ncc_past = _past(cfg.N_CDT_SMOOTH_DAYS)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # get the basics
+        dnc = ncc - ncc_1
+        d7v = (ncc - ncc_7) / 7
+        npp = ncc / pops * cfg.N_PERCAPITA
+        dpp = dnc / pops * cfg.N_PERCAPITA
+        d7p = d7v / pops * cfg.N_PERCAPITA
+
+        # get the death rate
+        dtr = dth / ncc
+        if zero_guard:
+            dtr = np.where(ncc == 0, 0, dtr)
+
+        # get the CDT, the inf and nan are fixed by rounding
+        cdt = cfg.N_CDT_SMOOTH_DAYS * np.log(2) / np.log((ncc + 0.5) / ncc_past)
+        cdt = np.where(ncc_past == 0, 0, cdt)
+
+        # get the crrw ratio
+        crp = d7p
+        crt = (ncc - ncc_7) / (ncc_7 - ncc_14)
+        if zero_guard:
+            crt = np.where(ncc_7 - ncc_14 == 0, 0, crt)
+
+        # get the cri, the later rules override the former ones
+        cri = np.full(ncc.shape, 2, dtype=np.int64)
+        # the GREEN potential
+        cri[crp <= cfg.S_GREEN_CRP_CUT_VALUE_1] = 1
+        cri[(crt <= cfg.S_GREEN_RW_CUT_VALUE_2) & \
+            (crp <= cfg.S_GREEN_CRP_CUT_VALUE_2)] = 1
+        # the RED potential
+        cri[(crt > cfg.S_RED_RW_CUT_VALUE_1) & \
+            (crp > cfg.S_RED_CRP_CUT_VALUE_1)] = 3
+        cri[crp > cfg.S_RED_CRP_CUT_VALUE_2] = 3
+
+    # which means the no data? so, everything is 0
+    if valid is not None:
+        valid = np.asarray(valid, dtype=bool)
+        for arr in [dnc, d7v, npp, dpp, d7p, dtr, crt]:
+            arr[~valid] = 0
+        ncc = np.where(valid, ncc, 0)
+        dth = np.where(valid, dth, 0)
+        crp = np.where(valid, crp, 0)
+        cdt = np.where(valid, cdt, cfg.CDT_CUT_VALUE)
+        cri[~valid] = 0
+
+    # get the crv as the sum of cri in the past 7 days
+    crv = np.zeros(cri.shape, dtype=np.int64)
+    cri_cumsum = np.cumsum(cri, axis=1)
+    if cri.shape[1] > 7:
+        crv[:, 7] = cri_cumsum[:, 6]
+        crv[:, 8:] = cri_cumsum[:, 7:-1] - cri_cumsum[:, :-8]
+    if valid is not None:
+        crv[~valid] = 0
+
+    # get the crc based on crv
+    crc = np.full(crv.shape, 'Y')
+    crc[crv <= 7] = 'G'
+    crc[crv >= 21] = 'R'
+
+    return {
+        'nccs': _floor_arr(ncc),
+        'dncs': _floor_arr(dnc),
+        'd7vs': _floor_arr(d7v),
+        'npps': _round_arr(npp, 2),
+        'dpps': _round_arr(dpp, 2),
+        'd7ps': _round_arr(d7p, 2),
+
+        'dths': _floor_arr(dth),
+        'dtrs': _round_arr(dtr, 4),
+
+        'cdts': _round_arr(cdt, 2),
+
+        'crps': _round_arr(crp, 2),
+        'crts': _round_arr(crt, 4),
+        'cris': cri,
+        'crvs': crv,
+        'crcs': crc,
+    }
+
+
+def calc_ratio_metrics(vals, pops, start_idx=None):
+    '''
+    Calculate the count and percentage of population, e.g., fvcs and fvps
+
+    Args:
+        vals: 2-D array (region x date) of the count, NaN is treated as 0
+        pops: 1-D array of the population of each region
+        start_idx: the first date index of the output, default START_DATE_IDX
+
+    Return:
+        the floored count and the percentage rounded to 4 digits
+    '''
+    if start_idx is None:
+        start_idx = cfg.START_DATE_IDX
+
+    vals = np.atleast_2d(np.asarray(vals, dtype=np.float64))[:, start_idx:]
+    vals = np.where(np.isnan(vals), 0, vals)
+    pops = np.asarray(pops, dtype=np.float64).reshape(-1, 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = vals / pops
+
+    return _floor_arr(vals), _round_arr(ratio, 4)
+
+
+def calc_test_metrics(ttrs, tpts, start_idx=None):
+    '''
+    Calculate the test metrics for a batch of regions
+
+    Args:
+        ttrs: 2-D array (region x date) of the total tests
+        tpts: 2-D array (region x date) of the total positive tests
+        start_idx: the first date index of the output, default START_DATE_IDX
+
+    Return:
+        a dict of 2-D arrays (region x date[start_idx:]):
+        - ttrs, tpts, tprs, t7rs
+    '''
+    if start_idx is None:
+        start_idx = cfg.START_DATE_IDX
+
+    ttrs = np.atleast_2d(np.asarray(ttrs, dtype=np.float64))
+    tpts = np.atleast_2d(np.asarray(tpts, dtype=np.float64))
+    n_dates = ttrs.shape[1]
+
+    ttr = ttrs[:, start_idx:]
+    tpt = tpts[:, start_idx:]
+    ttr_7 = ttrs[:, start_idx - 7:n_dates - 7]
+    tpt_7 = tpts[:, start_idx - 7:n_dates - 7]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tpr = np.where(ttr == 0, 0, tpt / ttr)
+        t7r = np.where(ttr - ttr_7 == 0, 0, (tpt - tpt_7) / (ttr - ttr_7))
+
+    return {
+        'ttrs': _floor_arr(ttr),
+        'tpts': _floor_arr(tpt),
+        'tprs': _round_arr(tpr, 4),
+        't7rs': _round_arr(t7r, 4),
+    }
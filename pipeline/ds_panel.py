@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+The dense panels of the downloaded source data
+
+Each parser used to load the long-format data frames of the sources, then
+complete the calendar, fill and reshape them by itself. The panel stage
+runs between download and parse, and turns each source into one dense
+array (region x date x field) on the calendar from cfg.FIRST_DATE to the
+parse date, with the vectors of the regions, dates and fields.
+
+The panels are cached by parse date, e.g., data/pnl/2020-05-15/owid.npz,
+and built again when the source file is changed. So the parsers only
+slice the arrays, and the panel of a source is built once for all of them.
+
+Usage:
+
+    python ds_panel.py parse_date [name ...]
+'''
+import os
+import sys
+import warnings
+import collections
+
+import numpy as np
+import pandas as pd
+
+import ds_config as cfg
+
+import ds_util
+import ds_store
+
+
+# values: the array of region x date x field
+# regions, dates, fields: the lists of the labels of each axis
+Panel = collections.namedtuple(
+    'Panel', ['values', 'regions', 'dates', 'fields']
+)
+
+# the sources of the panels
+# - long: one row for each (region, date), completed by complete_calendar,
+#   the ffill and fill_value are passed to it
+# - wide: the JHU time series, one file for each field, and one column
+#   for each date in m/d/yy format. The rows are summed by the region
+PANEL_SOURCES = {
+    'actnow_county': {
+        'format': 'long',
+        'fns': [cfg.FN_SAVE_ACTNOW_COUNTY_DATA],
+        'col_region': 'fips',
+        'fields': [
+            'actuals.cases',
+            'actuals.deaths',
+            'actuals.vaccinationsCompleted',
+            'actuals.vaccinationsInitiated'
+        ],
+        'ffill': True,
+        'fill_value': 0
+    },
+    'actnow_state': {
+        'format': 'long',
+        'fns': [cfg.FN_SAVE_ACTNOW_STATE_DATA],
+        'col_region': 'state',
+        'fields': [
+            'actuals.cases',
+            'actuals.deaths',
+            'actuals.positiveTests',
+            'actuals.negativeTests',
+            'actuals.vaccinationsCompleted',
+            'actuals.vaccinationsInitiated',
+            'metrics.vaccinationsInitiatedRatio'
+        ],
+        'ffill': True,
+        'fill_value': 0
+    },
+    'cdcpvi_county': {
+        'format': 'long',
+        'fns': [cfg.FN_SAVE_CDCPVI_USA_ALL_DATA],
+        'col_region': 'countyFIPS',
+        'fields': ['pvi'],
+        'ffill': False,
+        'fill_value': None
+    },
+    'jhu_world': {
+        'format': 'wide',
+        'fns': [
+            cfg.FN_SAVE_JHU_WORLD_TS_COVID_DATA,
+            cfg.FN_SAVE_JHU_WORLD_TS_DEATH_DATA
+        ],
+        'col_region': 'Country/Region',
+        'fields': ['cases', 'deaths']
+    },
+    'owid': {
+        'format': 'long',
+        'fns': [cfg.FN_SAVE_OWIDVAC_WORLD_VAC_DATA],
+        'col_region': 'iso_code',
+        'fields': ['people_fully_vaccinated', 'total_vaccinations'],
+        'ffill': True,
+        'fill_value': None
+    },
+}
+
+
+def get_date_vals(parse_date):
+    '''
+    Get the calendar of the panels, YYYY-MM-DD from cfg.FIRST_DATE
+    '''
+    return [
+        day.strftime('%Y-%m-%d')
+        for day in pd.date_range(cfg.FIRST_DATE, parse_date)
+    ]
+
+
+def _get_source_fns(name, parse_date):
+    '''
+    Get the files of the source which are actually read
+    '''
+    src = PANEL_SOURCES[name]
+    fns = []
+    for fn in src['fns']:
+        fn = fn % parse_date
+        if src['format'] == 'long' and ds_store.feather is not None and \
+            os.path.exists(ds_store.get_store_fn(fn)):
+            # the same file as ds_store.load_df
+            fn = ds_store.get_store_fn(fn)
+        fns.append(fn)
+
+    return fns
+
+
+def _get_source_sig(name, parse_date):
+    '''
+    Get the signature of the source files by their mtime and size
+    '''
+    sig = []
+    for fn in _get_source_fns(name, parse_date):
+        if not os.path.exists(fn):
+            sig.append('%s:-' % fn)
+            continue
+        stat = os.stat(fn)
+        sig.append('%s:%s:%s' % (fn, stat.st_mtime_ns, stat.st_size))
+
+    return ';'.join(sig)
+
+
+def build_long_panel(df, col_region, date_vals, fields, ffill=True, fill_value=0):
+    '''
+    Build the panel of a long-format data frame
+
+    Args:
+        df: data frame with the `col_region` and `date` columns
+        col_region: the column name of the region, e.g., fips
+        date_vals: the sorted list of YYYY-MM-DD dates of the calendar
+        fields: the columns to keep, a missing column is all NaN
+        ffill: True to forward fill the NaN values of each region
+        fill_value: the value for the rest NaN values, None to keep NaN
+
+    Return:
+        the panel and the gap report of the regions
+    '''
+    # the regions in the order of their first rows
+    regions = df[col_region].dropna().unique().tolist()
+    df = df.reindex(columns=[col_region, 'date'] + fields)
+
+    df, report = ds_util.complete_calendar(
+        df, col_region, regions, date_vals, ffill=ffill, fill_value=fill_value
+    )
+    values = df[fields].values.astype(np.float64)\
+        .reshape(len(regions), len(date_vals), len(fields))
+
+    return Panel(values, regions, list(date_vals), list(fields)), report
+
+
+def build_wide_panel(dfs, col_region, date_vals, fields):
+    '''
+    Build the panel of the JHU time series
+
+    Args:
+        dfs: the list of data frames, one for each field
+        col_region: the column name of the region, e.g., Country/Region
+        date_vals: the sorted list of YYYY-MM-DD dates of the calendar
+        fields: the field of each data frame
+
+    Return:
+        the panel, the regions are in the order of their first rows
+    '''
+    date_cols = [
+        day.strftime('%-m/%-d/%y') for day in pd.to_datetime(date_vals)
+    ]
+    dfs = [ df.groupby([col_region], sort=False).sum() for df in dfs ]
+    regions = dfs[0].index.tolist()
+
+    values = np.stack([
+        df.reindex(index=regions, columns=date_cols).values.astype(np.float64)
+        for df in dfs
+    ], axis=-1)
+
+    return Panel(values, regions, list(date_vals), list(fields))
+
+
+def build_panel(parse_date, name):
+    '''
+    Build the panel of the source from the downloaded files
+
+    Args:
+        parse_date: YYYY-MM-DD format date string
+        name: the name in PANEL_SOURCES, e.g., actnow_county
+
+    Return:
+        the panel
+    '''
+    src = PANEL_SOURCES[name]
+    date_vals = get_date_vals(parse_date)
+
+    if src['format'] == 'wide':
+        dfs = [ pd.read_csv(fn % parse_date) for fn in src['fns'] ]
+        panel = build_wide_panel(
+            dfs, src['col_region'], date_vals, src['fields']
+        )
+
+    else:
+        df = ds_store.load_df(src['fns'][0] % parse_date)
+        panel, report = build_long_panel(
+            df, src['col_region'], date_vals, src['fields'],
+            ffill=src['ffill'], fill_value=src['fill_value']
+        )
+        # missing data is very common in actnow ...
+        ds_util.print_gap_report(name, report)
+
+    print('* built %s panel %s x %s x %s' % ((name, ) + panel.values.shape))
+
+    return panel
+
+
+def save_panel(panel, fn, sig=''):
+    '''
+    Save the panel and the signature of its source files
+    '''
+    os.makedirs(os.path.dirname(fn), exist_ok=True)
+
+    # save to a temp file first, so a broken file is never loaded
+    fn_tmp = fn + '.tmp.npz'
+    np.savez(
+        fn_tmp,
+        values=panel.values,
+        regions=np.asarray(panel.regions),
+        dates=np.asarray(panel.dates),
+        fields=np.asarray(panel.fields),
+        sig=np.asarray(sig)
+    )
+    os.replace(fn_tmp, fn)
+
+
+def load_panel(fn, sig=None):
+    '''
+    Load the panel
+
+    Args:
+        fn: the .npz file of the panel
+        sig: the expected signature of the source files, None to skip
+
+    Return:
+        the panel, or None if not found or the source files are changed
+    '''
+    if not os.path.exists(fn):
+        return None
+
+    with np.load(fn) as npz:
+        if sig is not None and str(npz['sig']) != sig:
+            return None
+
+        return Panel(
+            npz['values'],
+            npz['regions'].tolist(),
+            npz['dates'].tolist(),
+            npz['fields'].tolist()
+        )
+
+
+def get_panel(parse_date, name, rebuild=False):
+    '''
+    Get the panel of the source, from the cache if it's up to date
+
+    Args:
+        parse_date: YYYY-MM-DD format date string
+        name: the name in PANEL_SOURCES, e.g., actnow_county
+        rebuild: True to build the panel even if it's cached
+
+    Return:
+        the panel
+    '''
+    fn = cfg.FN_PANEL % (parse_date, name)
+    sig = _get_source_sig(name, parse_date)
+
+    if cfg.PANEL_CACHE and not rebuild:
+        panel = load_panel(fn, sig)
+        if panel is not None:
+            print('* loaded %s panel from %s' % (name, fn))
+            return panel
+
+    panel = build_panel(parse_date, name)
+    if cfg.PANEL_CACHE:
+        save_panel(panel, fn, sig)
+
+    return panel
+
+
+def build_panels(parse_date, names=None):
+    '''
+    Build the panels of the sources for the parsers
+
+    Args:
+        parse_date: YYYY-MM-DD format date string
+        names: the list of names in PANEL_SOURCES, default all
+    '''
+    if names is None:
+        names = list(PANEL_SOURCES.keys())
+
+    for name in names:
+        get_panel(parse_date, name, rebuild=True)
+
+    print('* done building %s panels of %s' % (len(names), parse_date))
+
+
+def take(panel, regions, fields=None, fill_value=np.nan, out=None):
+    '''
+    Take the values of the regions and fields from the panel
+
+    Args:
+        panel: the panel
+        regions: the list of regions, which may be not in the panel
+        fields: the list of fields, default all
+        fill_value: the value for the regions not in the panel
+        out: the array of region x date x field to write the values in,
+            e.g., a view of a shared buffer, default a new array
+
+    Return:
+        the array of region x date x field
+    '''
+    if fields is None:
+        fields = panel.fields
+    field_idx = [ panel.fields.index(f) for f in fields ]
+
+    region_idx = { r: i for i, r in enumerate(panel.regions) }
+    rows = np.array([ region_idx.get(r, -1) for r in regions ], dtype=np.int64)
+
+    if out is None:
+        out = np.empty(
+            (len(regions), len(panel.dates), len(fields)),
+            dtype=panel.values.dtype
+        )
+
+    # one field at a time, so only a region x date temp array is created
+    for j, idx in enumerate(field_idx):
+        out[:, :, j] = panel.values[np.maximum(rows, 0), :, idx]
+    if (rows < 0).any():
+        out[rows < 0] = fill_value
+
+    return out
+
+
+def ffill(values, fill_value=None):
+    '''
+    Forward fill the NaN values along the dates
+
+    Args:
+        values: the array of region x date (x field)
+        fill_value: the value for the rest NaN values, None to keep NaN
+    '''
+    values = np.asarray(values, dtype=np.float64)
+
+    # the index of the last valid date at each date
+    idx = np.where(np.isnan(values), 0, np.arange(values.shape[1]).reshape(
+        (1, -1) + (1, ) * (values.ndim - 2)
+    ))
+    idx = np.maximum.accumulate(idx, axis=1)
+    ret = np.take_along_axis(values, idx, axis=1)
+
+    if fill_value is not None:
+        ret = np.where(np.isnan(ret), fill_value, ret)
+
+    return ret
+
+
+def nanmedian(values, axis=0):
+    '''
+    Get the median ignoring NaN, NaN if all values are NaN
+    '''
+    with warnings.catch_warnings():
+        # the all-NaN slice is expected, e.g., no PVI of the date
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        return np.nanmedian(values, axis=axis)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print('Usage: python ds_panel.py parse_date [name ...]')
+        sys.exit(1)
+
+    build_panels(sys.argv[1], sys.argv[2:] or None)
@@ -27,6 +27,7 @@ import pandas as pd
 from pandas.api.types import is_numeric_dtype
 
 import ds_config as cfg
+import ds_json
 
 from ds_parser_mchrr import parse_mchrr_with_actnow_and_cdcpvi_data_v2
 from ds_parser_country import parse_country_with_jhu_and_owid_data_v2
@@ -36,19 +37,6 @@ from ds_parser_county import parse_county_with_actnow_and_cdcpvi_data_v2
 
 print('* loaded packages!')
 
-# for solving the int64 serialization
-class NpEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        else:
-            return super(NpEncoder, self).default(obj)
-
-
 # for multiprocessing
 
 if sys.version_info.minor < 8:
@@ -277,7 +265,7 @@ def parse_county_with_usafacts_and_cdcpvi_data_v2(parse_date=None):
             cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, '%s.json' % FIPS
         )
         with open(fn, 'w') as fp:
-            json.dump(j_county, fp, cls=NpEncoder)
+            ds_json.dump(j_county, fp)
         
         # print('* parsed %s / %s %s' % (idx, len(dft), FIPS))
 
@@ -466,7 +454,7 @@ def __parse_county_with_cdcpvi_data_v2(
         cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % FIPS
     )
     with open(fn, 'w') as fp:
-        json.dump(j_county, fp, cls=NpEncoder)
+        ds_json.dump(j_county, fp)
 
     return 0
 
@@ -826,7 +814,7 @@ def __parse_county_with_cdcpvi_and_actnow_data_v2(
         cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % FIPS
     )
     with open(fn, 'w') as fp:
-        json.dump(j_county, fp, cls=NpEncoder)
+        ds_json.dump(j_county, fp)
 
     return 0
 
@@ -1160,7 +1148,7 @@ def parse_state_with_covidtracking_and_cdcpvi_data_v2(parse_date=None):
             cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % state
         )
         with open(fn, 'w') as fp:
-            json.dump(j_state, fp, cls=NpEncoder)
+            ds_json.dump(j_state, fp)
 
     print('* done parsing the state data from covid tracking project data %s' % (parse_date))
 
@@ -1519,7 +1507,7 @@ def parse_state_with_covidtracking_and_cdcpvi_and_jhucci_data_v2(parse_date=None
             cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % state
         )
         with open(fn, 'w') as fp:
-            json.dump(j_state, fp, cls=NpEncoder)
+            ds_json.dump(j_state, fp)
 
     print('* done parsing the state data from covid tracking project data %s' % (parse_date))
 
@@ -1899,7 +1887,7 @@ def parse_state_with_covidtracking_and_cdcpvi_and_jhucci_data_and_cdcvac_v2(pars
             cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % state
         )
         with open(fn, 'w') as fp:
-            json.dump(j_state, fp, cls=NpEncoder)
+            ds_json.dump(j_state, fp)
 
     print('* done parsing the state data from covid tracking project data %s' % (parse_date))
 
@@ -2301,7 +2289,7 @@ def parse_state_with_actnow_and_cdcpvi_and_cdcvac_v2(parse_date=None):
             cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % state
         )
         with open(fn, 'w') as fp:
-            json.dump(j_state, fp, cls=NpEncoder)
+            ds_json.dump(j_state, fp)
 
     print('* done parsing the state data from COVID Act Now data %s' % (parse_date))
 
@@ -2679,7 +2667,7 @@ def parse_state_with_jhu_and_jhucci_and_cdcpvi_and_cdcvac_v2(parse_date=None):
             cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % state
         )
         with open(fn, 'w') as fp:
-            json.dump(j_state, fp, cls=NpEncoder)
+            ds_json.dump(j_state, fp)
 
     print('* done parsing the state data from JHU data %s' % (parse_date))
 
@@ -3090,7 +3078,7 @@ def parse_state_with_jhu_and_cdcpvi_and_actnow_and_cdcvac_v2(parse_date=None):
             cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % state
         )
         with open(fn, 'w') as fp:
-            json.dump(j_state, fp, cls=NpEncoder)
+            ds_json.dump(j_state, fp)
 
     print('* done parsing the state data from JHU data %s' % (parse_date))
 
@@ -3330,7 +3318,7 @@ def parse_country_with_jhu_data_v2(parse_date=None):
             cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'WORLD-%s.json' % FIPS
         )
         with open(fn, 'w') as fp:
-            json.dump(j_country, fp, cls=NpEncoder)
+            ds_json.dump(j_country, fp)
 
     return 0
 
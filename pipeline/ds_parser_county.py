@@ -5,6 +5,7 @@ import json
 import pathlib
 import datetime
 import argparse
+import tempfile
 import multiprocessing
 import multiprocessing.pool as mpp
 
@@ -19,10 +20,31 @@ from pandas.api.types import is_numeric_dtype
 import ds_config as cfg
 
 import ds_util
-from ds_util import NpEncoder
+import ds_panel
+import ds_records
 from ds_util import _floor
 from ds_util import _round
-
+from ds_util import _round_arr
+from ds_metric import calc_crrw_metrics
+from ds_metric import calc_ratio_metrics
+
+try:
+    from multiprocessing import shared_memory
+    from multiprocessing import resource_tracker
+except ImportError:
+    # python < 3.8, the panel will be put in a memory-mapped file
+    shared_memory = None
+
+# the actnow columns for the county-level results
+ACTNOW_COUNTY_COLS = [
+    'actuals.cases',
+    'actuals.deaths',
+    'actuals.vaccinationsCompleted',
+    'actuals.vaccinationsInitiated'
+]
+
+# the panel attached by each worker in the panel mode
+_g_panel = None
 
 # for multiprocessing
 if sys.version_info.minor < 8:
@@ -74,12 +96,15 @@ else:
     mpp.Pool.istarmap = istarmap
 
     
-def parse_county_with_actnow_and_cdcpvi_data_v2(parse_date=None):
+def parse_county_with_actnow_and_cdcpvi_data_v2(parse_date=None, mode=None):
     '''
     Parse county data for given parse_date with CDCPVI data
 
     Args:
         parse_date: YYYY-MM-DD format date string
+        mode: `pool` to send the values of each county to the workers,
+            `panel` to share one dense panel of all counties with the
+            workers, default cfg.COUNTY_PARSE_MODE
 
     Create:
         - nccs: total cases
@@ -138,17 +163,15 @@ def parse_county_with_actnow_and_cdcpvi_data_v2(parse_date=None):
         date_vals.append(day.strftime('%Y-%m-%d'))
     print('* created dates %s to %s' % (date_vals[0], date_vals[-1]))
 
-    # get the covid data
-    fn_cdcpvi_data = cfg.FN_SAVE_CDCPVI_USA_ALL_DATA % parse_date
-    df_cdcpvi = pd.read_csv(fn_cdcpvi_data)
-
-    # get the actnow data
-    fn_actnow_data = cfg.FN_SAVE_ACTNOW_COUNTY_DATA % parse_date
-    df_actnow = pd.read_csv(fn_actnow_data)
+    # get the panels of the actnow and cdcpvi data
+    panels = {
+        'actnow': ds_panel.get_panel(parse_date, 'actnow_county'),
+        'cdcpvi': ds_panel.get_panel(parse_date, 'cdcpvi_county')
+    }
 
     # get all the counties from actnow
-    counties = df_actnow['fips'].unique().tolist()
-    print('* loaded %s lines data frame from %s' % (len(df_cdcpvi), fn_cdcpvi_data))
+    counties = panels['actnow'].regions
+    print('* got %s counties from the actnow panel' % (len(counties)))
 
     # get population data
     df_pop = pd.read_csv(cfg.FN_COUNTY_POPU)
@@ -167,34 +190,64 @@ def parse_county_with_actnow_and_cdcpvi_data_v2(parse_date=None):
         os.makedirs(os.path.join(cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date), exist_ok=True)
         print('* created %s folder in %s' % (parse_date, cfg.FOLDER_PRS))
 
+    if mode is None:
+        mode = cfg.COUNTY_PARSE_MODE
+
+    if mode == 'panel':
+        records = __parse_counties_by_panel(
+            panels, df_geo, df_pop, date_vals, counties
+        )
+    else:
+        # the values of all counties, county x date x column
+        vals = ds_panel.take(panels['actnow'], counties, ACTNOW_COUNTY_COLS)
+        pvi_vals = ds_panel.take(panels['cdcpvi'], counties, ['pvi'])[:, :, 0]
+        panels.clear()
+
+        records = __parse_counties_by_pool(
+            vals, pvi_vals, df_geo, df_pop, date_vals, counties
+        )
+
+    # hand the records to the merger
+    ds_records.begin(parse_date, 'county')
+    for record in records:
+        if record is None: continue
+        ds_records.put(parse_date, 'county', *record)
+    ds_records.save_batch(parse_date, 'county')
+
+    print('* done parsing all the county data %s from CDC PVI and COVID Act Now' % (parse_date))
+
+
+def __parse_counties_by_pool(vals, pvi_vals, df_geo, df_pop, date_vals, counties):
+    '''
+    Parse the counties by sending the values of each county to the pool
+
+    Args:
+        vals: 3-D array (county x date x column) of the ACTNOW_COUNTY_COLS
+        pvi_vals: 2-D array (county x date) of the pvi
+
+    Return:
+        the list of (name, JSON text) of each county
+    '''
     # begin loop on each county for debugging purpose
     # because it takes very long time to run ...
-    # for countyFIPS in tqdm(counties):
-    #     df_cdcpvi_county = df_cdcpvi[df_cdcpvi['countyFIPS']==countyFIPS].copy()
-    #     df_actnow_county = df_actnow[df_actnow['fips'] == countyFIPS].copy()
-
-    #     __parse_county_with_actnow_and_cdcpvi_data_v2(
-    #         df_actnow_county, 
-    #         df_cdcpvi_county, 
+    # for row, countyFIPS in enumerate(tqdm(counties)):
+    #     __get_county_record(
+    #         vals[row].T, 
+    #         pvi_vals[row], 
     #         df_geo, 
     #         df_pop, 
     #         date_vals, 
     #         countyFIPS
     #     )
 
-
-
     # begin the multiprocessing
     with multiprocessing.Pool() as pool:
         arguments_list = [ ]
         print('* creating arguments list for mapping')
-        for _fips in counties:
-            df_cdcpvi_county = df_cdcpvi[df_cdcpvi['countyFIPS']==_fips].copy()
-            df_actnow_county = df_actnow[df_actnow['fips'] == _fips].copy()
-
+        for row, _fips in enumerate(counties):
             arguments_list.append((
-                df_actnow_county, 
-                df_cdcpvi_county, 
+                vals[row].T, 
+                pvi_vals[row], 
                 df_geo, 
                 df_pop, 
                 date_vals, 
@@ -202,77 +255,159 @@ def parse_county_with_actnow_and_cdcpvi_data_v2(parse_date=None):
             ))
 
         print('* run multiprocessing to parse the counties')
-        for _ in tqdm(pool.istarmap( \
-            func=__parse_county_with_actnow_and_cdcpvi_data_v2, \
+        records = list(tqdm(pool.istarmap( \
+            func=__get_county_record, \
             iterable=arguments_list \
-            ), total=len(counties)):
-            pass
-    
+            ), total=len(counties)))
 
-    # for result in tqdm(pool.imap_unordered(func=func, iterable=argument_list), total=len(argument_list)):
-    #     result_list_tqdm.append(result)
+    return records
 
-    print('* done parsing all the county data %s from CDC PVI and COVID Act Now' % (parse_date))
 
+def __parse_counties_by_panel(panels, df_geo, df_pop, date_vals, counties):
+    '''
+    Parse the counties by sharing a dense panel with the pool
+
+    The panel (county x column x date) holds the ACTNOW_COUNTY_COLS and
+    the pvi. It is created once in the shared memory, or a memory-mapped
+    file for python < 3.8, and each worker attaches to it without copy.
+    So each task is only a (row, FIPS) tuple.
 
-def __parse_county_with_actnow_and_cdcpvi_data_v2(
-    df_actnow_county, 
-    df_cdcpvi_county, 
-    df_geo, 
-    df_pop, 
-    date_vals, 
-    countyFIPS):
+    The values are taken from the source panels into the shared buffer
+    directly, then the source panels are dropped before the pool starts,
+    so the parent keeps only one copy of the values.
+
+    Args:
+        panels: the dict of the actnow and cdcpvi panels, cleared after use
+
+    Return:
+        the list of (name, JSON text) of each county
     '''
-    Mainly based COVID ACT Now Data
+    shape = (len(counties), len(ACTNOW_COUNTY_COLS) + 1, len(date_vals))
+    nbytes = int(np.prod(shape)) * np.dtype(np.float64).itemsize
+
+    # create the shared buffer
+    if shared_memory is not None:
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        panel_src = ('shm', shm.name)
+        panel = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    else:
+        fd, fn_panel = tempfile.mkstemp(suffix='.panel')
+        os.close(fd)
+        panel_src = ('mmap', fn_panel)
+        panel = np.memmap(fn_panel, dtype=np.float64, mode='w+', shape=shape)
+
+    try:
+        # take the values into the shared panel, as county x date x column
+        ds_panel.take(
+            panels['actnow'], counties, ACTNOW_COUNTY_COLS,
+            out=panel[:, :-1, :].transpose(0, 2, 1)
+        )
+        ds_panel.take(
+            panels['cdcpvi'], counties, ['pvi'],
+            out=panel[:, -1:, :].transpose(0, 2, 1)
+        )
+        panels.clear()
+
+        with multiprocessing.Pool(
+            initializer=__init_county_panel_worker,
+            initargs=(panel_src, shape, df_geo, df_pop, date_vals)) as pool:
+            print('* run multiprocessing to parse the counties on the panel')
+            records = list(tqdm(pool.istarmap( \
+                func=__parse_county_from_panel, \
+                iterable=enumerate(counties), \
+                chunksize=64 \
+                ), total=len(counties)))
+
+    finally:
+        del panel
+        if panel_src[0] == 'shm':
+            shm.close()
+            shm.unlink()
+        else:
+            os.remove(panel_src[1])
+
+    return records
+
+
+def __attach_shm(name):
     '''
-    parse_date = date_vals[-1]
+    Attach the shared memory in a worker without tracking it
+
+    The parent creates and unlinks the shared memory, so the workers
+    should not register it to the resource tracker. The tracker is shared
+    with the parent, so unregistering it in a worker would drop the entry
+    of the parent as well.
+    '''
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
 
-    # there are missing in the actnow data, fill the missing
-    missing_dates = []
-    existing_dates = set(df_actnow_county.date.values)
-    for date in date_vals:
-        if date not in existing_dates:
-            # missing data is very common in actnow ...
-            df_actnow_county = df_actnow_county.append(
-                {'date': date}, 
-                ignore_index=True
-            )
-            missing_dates.append(date)
-
-    if len(missing_dates) > 0:
-        print(f"* !!!! actnow county {countyFIPS} has {len(missing_dates)}/{len(date_vals)} missing dates but fixed!")
-
-    df_actnow_county.sort_values(by=['date'], inplace=True)
-    df_actnow_county.set_index('date', inplace=True)
-    df_actnow_county.fillna(method="ffill", inplace=True)
-    df_actnow_county.fillna(0, inplace=True)
-
-    # there are missing in the cdcpvi data, fill the missing
-    missing_dates = []
-    existing_dates = set(df_cdcpvi_county.date.values)
-    for date in date_vals:
-        if date not in existing_dates:
-            # missing data is very common in actnow ...
-            df_cdcpvi_county = df_cdcpvi_county.append(
-                {'date': date}, 
-                ignore_index=True
-            )
-            missing_dates.append(date)
-
-    if len(missing_dates) > 0:
-        print(f"* !!!! cdcpvi county {countyFIPS} has {len(missing_dates)}/{len(date_vals)} missing dates but fixed!")
-
-    # set index for data
-    df_cdcpvi_county.set_index('date', inplace=True)
+    # python < 3.13 always registers it when attaching
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def __init_county_panel_worker(panel_src, shape, df_geo, df_pop, date_vals):
+    '''
+    Attach the shared panel once for each worker
+    '''
+    global _g_panel
+    if panel_src[0] == 'shm':
+        shm = __attach_shm(panel_src[1])
+        panel = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    else:
+        shm = None
+        panel = np.memmap(panel_src[1], dtype=np.float64, mode='r', shape=shape)
+
+    # keep the shm object, otherwise the buffer will be closed
+    _g_panel = dict(
+        shm=shm,
+        panel=panel,
+        df_geo=df_geo,
+        df_pop=df_pop,
+        date_vals=date_vals
+    )
+
+
+def __parse_county_from_panel(row, countyFIPS):
+    '''
+    Parse the county at the given row of the shared panel
+    '''
+    vals = _g_panel['panel'][row]
+    return __get_county_record(
+        vals[:-1],
+        vals[-1],
+        _g_panel['df_geo'],
+        _g_panel['df_pop'],
+        _g_panel['date_vals'],
+        countyFIPS
+    )
+
+
+def __get_county_record(vals, pvi_vals, df_geo, df_pop, date_vals, countyFIPS):
+    '''
+    Calculate the metrics of the county and get the JSON record
+
+    Args:
+        vals: 2-D array (column x date) of the ACTNOW_COUNTY_COLS
+        pvi_vals: 1-D array of the pvi of each date
+
+    Return:
+        the (name, JSON text) of the county, None if not found
+    '''
+    parse_date = date_vals[-1]
 
     # check if county exists
     if countyFIPS not in df_geo.index:
         print('* NOT found %s in geo data?' % countyFIPS)
-        return -1
+        return None
 
     if countyFIPS not in df_pop.index:
         print('* NOT found %s in pop data?' % countyFIPS)
-        return -2
+        return None
 
     # get basic characteristics
     FIPS = '%s' % countyFIPS if countyFIPS > 9999 else '0%s' % countyFIPS
@@ -285,176 +420,19 @@ def __parse_county_with_actnow_and_cdcpvi_data_v2(
     # fix for Washington D.C.
     if FIPS == '11001': name = "Washington, D.C."
 
-    # get other values
-    nccs = []
-    dncs = []
-    d7vs = []
-    npps = []
-    dpps = []
-    d7ps = []
-    dths = []
-    dtrs = []
-    cdts = []
-
-    crps = []
-    crts = []
-    cris = []
-    crvs = []
-    crcs = []
-
-    pvis = []
-
-    fvcs = []
-    fvps = []
-    vacs = []
-    vaps = []
-
-    dates = []
-    
-    # for all date, get the values, start from 14 day for calculating the CrRW
-    for i in range(cfg.START_DATE_IDX, len(date_vals)):
-        date_val = date_vals[i]
-
-        # get the basics
-        ncc = df_actnow_county.loc[date_val, 'actuals.cases']
-        dnc = ncc - df_actnow_county.loc[date_vals[i-1], 'actuals.cases']
-        d7v = (ncc - df_actnow_county.loc[date_vals[i-7], 'actuals.cases']) / 7
-        npp = ncc / pop * cfg.N_PERCAPITA
-        dpp = dnc / pop * cfg.N_PERCAPITA
-        d7p = d7v / pop * cfg.N_PERCAPITA
-
-        # get the Death rate
-        dth = df_actnow_county.loc[date_val, 'actuals.deaths']
-        # try: dtr = dth / ncc
-        # except: dtr = 0
-        # to avoid divide by zero exception
-        if ncc == 0: dtr = 0
-        else: dtr = dth / ncc
-
-        # get the CDT
-        _ncc_past = df_actnow_county.loc[date_vals[i-cfg.N_CDT_SMOOTH_DAYS], 'actuals.cases']
-        # cdt = cfg.N_CDT_SMOOTH_DAYS * np.log(2) / np.log((ncc + 0.5) / _ncc_past)
-        # to avoid divide by zero exception
-        if _ncc_past == 0: cdt = 0
-        else: cdt = cfg.N_CDT_SMOOTH_DAYS * np.log(2) / np.log((ncc + 0.5) / _ncc_past)
-
-
-        # get the crrw ratio
-        crp = d7p
-        _ncc_7 = df_actnow_county.loc[date_vals[i-7], 'actuals.cases']
-        # get the past ncc
-        try: _ncc_14 = df_actnow_county.loc[date_vals[i-14], 'actuals.cases']
-        except: _ncc_14 = 0
-
-        # get the crt
-        # try: crt = (ncc - _ncc_7) / (_ncc_7 - _ncc_14)
-        # except: crt = 0
-        # to avoid divide by zero exception
-        if (_ncc_7 - _ncc_14) == 0: crt = 0
-        else: crt = (ncc - _ncc_7) / (_ncc_7 - _ncc_14)
-    
-        # get the cri of today
-        cri = 2
-        # the GREEN potential
-        if crp <= cfg.S_GREEN_CRP_CUT_VALUE_1: cri = 1
-        if crt <=1 and crp <= cfg.S_GREEN_CRP_CUT_VALUE_2: cri = 1
-
-        # the RED potential
-        if crt > cfg.S_RED_RW_CUT_VALUE_1 and crp > cfg.S_RED_CRP_CUT_VALUE_1: cri = 3
-        if crp > cfg.S_RED_CRP_CUT_VALUE_2: cri = 3
-
-        # get the crv of today
-        crv = 0
-        if i >= 7 + cfg.START_DATE_IDX:
-            for j in range(1, 7+1):
-                crv += cris[i - cfg.START_DATE_IDX - j]
-        
-        # get the crc based on crv
-        crc = 'Y'
-        if crv <= 7: crc = 'G'
-        if crv >=21: crc = 'R'
-
-        # get the PVI
-        pvi = df_cdcpvi_county.loc[date_val, 'pvi']
-
-        # get the FVC and FVP
-        try:
-            fvc = df_actnow_county.loc[date_val, 'actuals.vaccinationsCompleted']
-            if pd.isna(fvc):
-                fvc = 0
-                fvp = 0
-            else:
-                fvp = fvc / pop
-        except:
-            fvc = 0
-            fvp = 0
-            
-        # get the VAC and VAP
-        try:
-            vac = df_actnow_county.loc[date_val, 'actuals.vaccinationsInitiated']
-        
-            if pd.isna(vac):
-                vac = 0
-                vap = 0
-            else:
-                vap = vac / pop
-
-        except:
-            vac = 0
-            vap = 0
-
-        # fix values
-        ncc = _floor(ncc)
-        dnc = _floor(dnc)
-        d7v = _floor(d7v)
-        npp = _round(npp, 2)
-        dpp = _round(dpp, 2)
-        d7p = _round(d7p, 2)
-
-        dth = _floor(dth)
-        dtr = _round(dtr, 4)
-
-        cdt = _round(cdt, 2)
-
-        crp = _round(crp, 2)
-        crt = _round(crt, 4)
-        crc = crc
-
-        pvi = _round(pvi, 4)
-
-        fvc = _floor(fvc)
-        fvp = _round(fvp, 4)
-        vac = _floor(vac)
-        vap = _round(vap, 4)
-
-        # append values
-        nccs.append(ncc)
-        dncs.append(dnc)
-        d7vs.append(d7v)
-        npps.append(npp)
-        dpps.append(dpp)
-        d7ps.append(d7p)
-        
-        dths.append(dth)
-        dtrs.append(dtr)
-
-        cdts.append(cdt)
+    # calculate the CrRW metrics, start from 14 day for calculating the CrRW
+    m = calc_crrw_metrics(vals[0], vals[1], [pop])
 
-        crps.append(crp)
-        crts.append(crt)
-        cris.append(cri)
-        crvs.append(crv)
-        crcs.append(crc)
+    # get the PVI
+    pvis = _round_arr(pvi_vals[cfg.START_DATE_IDX:], 4)
 
-        pvis.append(pvi)
+    # get the FVC and FVP
+    fvcs, fvps = calc_ratio_metrics(vals[2], [pop])
 
-        fvcs.append(fvc)
-        fvps.append(fvp)
-        vacs.append(vac)
-        vaps.append(vap)
+    # get the VAC and VAP
+    vacs, vaps = calc_ratio_metrics(vals[3], [pop])
 
-
-        dates.append(date_val)
+    dates = date_vals[cfg.START_DATE_IDX:]
 
     # create JSON for this county
     j_county = {
@@ -466,39 +444,33 @@ def __parse_county_with_actnow_and_cdcpvi_data_v2(
         'lat': lat,
         'lon': lon,
 
-        'nccs': nccs,
-        'dncs': dncs,
-        'd7vs': d7vs,
-        'npps': npps,
-        'dpps': dpps,
-        'd7ps': d7ps,
+        'nccs': m['nccs'][0].tolist(),
+        'dncs': m['dncs'][0].tolist(),
+        'd7vs': m['d7vs'][0].tolist(),
+        'npps': m['npps'][0].tolist(),
+        'dpps': m['dpps'][0].tolist(),
+        'd7ps': m['d7ps'][0].tolist(),
 
-        'dths': dths,
-        'dtrs': dtrs,
+        'dths': m['dths'][0].tolist(),
+        'dtrs': m['dtrs'][0].tolist(),
 
-        'cdts': cdts,
+        'cdts': m['cdts'][0].tolist(),
         
-        'crps': crps,
-        'crts': crts,
+        'crps': m['crps'][0].tolist(),
+        'crts': m['crts'][0].tolist(),
         # 'cris': cris,
         # 'crvs': crvs,
-        'crcs': crcs,
+        'crcs': m['crcs'][0].tolist(),
 
-        'pvis': pvis,
+        'pvis': pvis.tolist(),
 
-        'fvcs': fvcs,
-        'fvps': fvps,
-        'vacs': vacs,
-        'vaps': vaps,
+        'fvcs': fvcs[0].tolist(),
+        'fvps': fvps[0].tolist(),
+        'vacs': vacs[0].tolist(),
+        'vaps': vaps[0].tolist(),
 
         'dates': dates
     }
 
-    # save this json
-    fn = os.path.join(
-        cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % FIPS
-    )
-    with open(fn, 'w') as fp:
-        json.dump(j_county, fp, cls=NpEncoder)
-
-    return 0
+    # the text is small to send back from the worker
+    return 'USA-%s' % FIPS, ds_records.dumps(j_county)
@@ -21,9 +21,38 @@ from pandas.api.types import is_numeric_dtype
 import ds_config as cfg
 
 import ds_util
-from ds_util import NpEncoder
+import ds_panel
+import ds_records
 from ds_util import _floor
 from ds_util import _round
+from ds_util import _round_arr
+from ds_metric import calc_crrw_metrics
+
+
+def get_region_matrix(mc_region_list):
+    '''
+    Get the membership matrix of the regions and the counties
+
+    Each region is a row and each county is a column, so the values of
+    the counties (county x ...) are summed to all regions by one matrix
+    multiply, no matter how many regions there are.
+
+    Args:
+        mc_region_list: the list of dict(name, fips), e.g., cfg.MC_REGIONS
+
+    Return:
+        the matrix (region x county) of the times each county is listed
+        in the region, and the sorted list of the counties
+    '''
+    all_fipss = sorted(set([ fips for _ in mc_region_list for fips in _['fips'] ]))
+    fips_idx = { fips: i for i, fips in enumerate(all_fipss) }
+
+    mat = np.zeros((len(mc_region_list), len(all_fipss)))
+    for i, _ in enumerate(mc_region_list):
+        np.add.at(mat[i], [ fips_idx[fips] for fips in _['fips'] ], 1)
+
+    return mat, all_fipss
+
 
 def parse_mchrr_with_actnow_and_cdcpvi_data_v2(parse_date=None):
     '''
@@ -87,20 +116,9 @@ def parse_mchrr_with_actnow_and_cdcpvi_data_v2(parse_date=None):
     mc_region_list = copy.copy(cfg.MC_REGIONS)
     mchrrs = [ _['name'] for _ in mc_region_list ]
     
-    # get the covid data
-    fn_cdcpvi_data = cfg.FN_SAVE_CDCPVI_USA_ALL_DATA % parse_date
-    df_cdcpvi = pd.read_csv(fn_cdcpvi_data)
-
-    # get the actnow data
-    fn_actnow_data = cfg.FN_SAVE_ACTNOW_COUNTY_DATA % parse_date
-    df_actnow = pd.read_csv(fn_actnow_data)
-
-    # set index
-    # df_cdcpvi.set_index(['date', 'countyFIPS'], inplace=True)
-    # print('* loaded %s lines data frame from %s' % (len(df_cdcpvi), fn_cdcpvi_data))
-
-    # df_actnow.set_index(['date', 'fips'], inplace=True)
-    # print('* loaded %s lines data frame from %s' % (len(df_actnow), fn_actnow_data))
+    # get the panels of the pvi and actnow data
+    panel_cdcpvi = ds_panel.get_panel(parse_date, 'cdcpvi_county')
+    panel_actnow = ds_panel.get_panel(parse_date, 'actnow_county')
 
     # get population data
     df_pop = pd.read_csv(cfg.FN_COUNTY_POPU)
@@ -114,201 +132,52 @@ def parse_mchrr_with_actnow_and_cdcpvi_data_v2(parse_date=None):
         print('* created %s folder in %s' % (parse_date, cfg.FOLDER_PRS))
 
 
-    for _ in tqdm(mc_region_list):
-        mchrr = _['name']
-        fipss = _['fips']
-
-        # get basic characteristics
-        FIPS = mchrr
-        state = mchrr
-        name = mchrr
+    # the membership of the counties in all regions, including the AVG
+    mat, all_fipss = get_region_matrix(mc_region_list)
+    print('* created %s x %s region matrix' % mat.shape)
 
-        pop = df_pop[df_pop['FIPS'].isin(fipss)]['POP'].sum()
-
-        # get other values
-        nccs = []
-        dncs = []
-        d7vs = []
-        npps = []
-        dpps = []
-        d7ps = []
-
-        dths = []
-        dtrs = []
-        cdts = []
-
-        crps = []
-        crts = []
-        cris = []
-        crvs = []
-        crcs = []
-
-        pvis = []
-
-        dates = []
-
-        # first, check the actnow data and fix the missing values
-        df_actnow_mchrr = []
-        for fips in fipss:
-            df_actnow_mchrr_cnty = df_actnow[df_actnow['fips'] == fips].copy()
-            missing_dates = []
-            existing_dates = set(df_actnow_mchrr_cnty.date.values)
-            for date in date_vals:
-                if date not in existing_dates:
-                    # missing data is very common in actnow ...
-                    df_actnow_mchrr_cnty = df_actnow_mchrr_cnty.append(
-                        {'date': date}, 
-                        ignore_index=True
-                    )
-                    missing_dates.append(date)
-
-            if len(missing_dates) > 0:
-                print(f"* !!!! actnow county {fips}/{mchrr} has {len(missing_dates)}/{len(date_vals)} missing dates but fixed!")
-            
-            # then we need to fill the NaN values
-            df_actnow_mchrr_cnty.fillna(method="ffill", inplace=True)
-            df_actnow_mchrr_cnty.fillna(0, inplace=True)
-            df_actnow_mchrr.append(df_actnow_mchrr_cnty)
-        
-        # combine all of the dataframes
-        df_actnow_mchrr = pd.concat(df_actnow_mchrr, ignore_index=True)
-
-        # then sum all by the date
-        # and the date will be used as the index
-        df_actnow_mchrr = df_actnow_mchrr.groupby('date')[[
-            'actuals.cases', 
-            'actuals.deaths', 
-            'actuals.vaccinationsInitiated', 
-            'actuals.vaccinationsCompleted'
-        ]].sum()
-
-        # then check the cdc pvi data and merge
-        df_cdcpvi_mchrr = []
-        for fips in fipss:
-            df_cdcpvi_mchrr_cnty = df_cdcpvi[df_cdcpvi['countyFIPS'] == fips].copy()
-            missing_dates = []
-            existing_dates = set(df_cdcpvi_mchrr_cnty.date.values)
-            for date in date_vals:
-                if date not in existing_dates:
-                    # missing data is very common in actnow ...
-                    df_cdcpvi_mchrr_cnty = df_cdcpvi_mchrr_cnty.append(
-                        {'date': date}, 
-                        ignore_index=True
-                    )
-                    missing_dates.append(date)
-
-            if len(missing_dates) > 0:
-                print(f"* !!!! cdcpvi county {fips}/{mchrr} has {len(missing_dates)}/{len(date_vals)} missing dates but fixed!")
-
-            # then we need to fill the NaN values
-            df_cdcpvi_mchrr_cnty.fillna(method="ffill", inplace=True)
-            df_cdcpvi_mchrr_cnty.fillna(0, inplace=True)
-            df_cdcpvi_mchrr.append(df_cdcpvi_mchrr_cnty)
-
-        # combine all of the dataframes
-        df_cdcpvi_mchrr = pd.concat(df_cdcpvi_mchrr, ignore_index=True)
-
-        # then get the median all by the date
-        # and the date will be used as the index
-        df_cdcpvi_mchrr = df_cdcpvi_mchrr.groupby('date')[[
-            'pvi',
-        ]].median()
-
-
-        # for all date, get the values, start from 14 day
-        for i in range(cfg.START_DATE_IDX, len(date_vals)):
-            date_val = date_vals[i]
-
-            # get the basics
-            ncc = df_actnow_mchrr.loc[date_val, 'actuals.cases']
-            dnc = ncc - df_actnow_mchrr.loc[date_vals[i-1], 'actuals.cases']
-            d7v = (ncc - df_actnow_mchrr.loc[date_vals[i-7], 'actuals.cases']) / 7
-            npp = ncc / pop * cfg.N_PERCAPITA
-            dpp = dnc / pop * cfg.N_PERCAPITA
-            d7p = d7v / pop * cfg.N_PERCAPITA
-
-            # get the Death rate
-            dth = df_actnow_mchrr.loc[date_val, 'actuals.deaths']
-            try: dtr = dth / ncc
-            except: dtr = 0
-
-            # get the CDT
-            _ncc_past = df_actnow_mchrr.loc[date_vals[i-cfg.N_CDT_SMOOTH_DAYS], 'actuals.cases']
-            cdt = ds_util._calc_cdt(ncc, _ncc_past)
-
-            # get the crrw ratio
-            crp = d7p
-            _ncc_7 = df_actnow_mchrr.loc[date_vals[i-7], 'actuals.cases']
-            # get the past ncc
-            try: _ncc_14 = df_actnow_mchrr.loc[date_vals[i-14], 'actuals.cases']
-            except: _ncc_14 = 0
-            # get the crt
-            crt = ds_util._calc_crt(ncc, _ncc_7, _ncc_14)
-
-            # get the cri of today
-            cri = 2
-            # the GREEN potential
-            if crp <= cfg.S_GREEN_CRP_CUT_VALUE_1: cri = 1
-            if crt <=1 and crp <= cfg.S_GREEN_CRP_CUT_VALUE_2: cri = 1
-
-            # the RED potential
-            if crt > cfg.S_RED_RW_CUT_VALUE_1 and crp > cfg.S_RED_CRP_CUT_VALUE_1: cri = 3
-            if crp > cfg.S_RED_CRP_CUT_VALUE_2: cri = 3
-
-            # get the crv of today
-            crv = 0
-            if i >= 7 + cfg.START_DATE_IDX:
-                for j in range(1, 7+1):
-                    crv += cris[i - cfg.START_DATE_IDX - j]
-            
-            # get the crc based on crv
-            crc = 'Y'
-            if crv <= 7: crc = 'G'
-            if crv >=21: crc = 'R'
-
-            pvi = df_cdcpvi_mchrr.loc[date_val, 'pvi']
-
-            # fix values
-            ncc = _floor(ncc)
-            dnc = _floor(dnc)
-            d7v = _floor(d7v)
-            npp = _round(npp, 2)
-            dpp = _round(dpp, 2)
-            d7p = _round(d7p, 2)
+    # the values of all the counties of the regions at once, the missing
+    # values of each county are filled, and the counties not in the data
+    # are all 0
+    cols = [
+        'actuals.cases', 
+        'actuals.deaths', 
+        'actuals.vaccinationsInitiated', 
+        'actuals.vaccinationsCompleted'
+    ]
+    act_vals = ds_panel.take(panel_actnow, all_fipss, cols, fill_value=0)
+    pvi_vals = ds_panel.ffill(
+        ds_panel.take(panel_cdcpvi, all_fipss, ['pvi'])[:, :, 0], fill_value=0
+    )
 
-            dth = _floor(dth)
-            dtr = _round(dtr, 4)
+    # sum the counties of all regions by the date, region x date x column
+    sum_vals = np.tensordot(mat, act_vals, axes=1)
 
-            cdt = _round(cdt, 2)
+    # the population of each region, each county is counted once
+    pop_vals = df_pop.groupby('FIPS')['POP'].sum()\
+        .reindex(all_fipss, fill_value=0).values
+    pops = np.dot((mat > 0).astype(pop_vals.dtype), pop_vals)
 
-            crp = _round(crp, 2)
-            crt = _round(crt, 4)
-            crc = crc
+    # calculate the CrRW metrics of all regions in one batch, start from 14 day
+    m = calc_crrw_metrics(sum_vals[:, :, 0], sum_vals[:, :, 1], pops)
 
-            pvi = _round(pvi, 4)
+    # then get the median of the counties by the date
+    pvis = _round_arr(np.stack([
+        np.median(np.repeat(pvi_vals, row.astype(np.int64), axis=0), axis=0)
+        for row in mat
+    ])[:, cfg.START_DATE_IDX:], 4)
 
-            # append values
-            nccs.append(ncc)
-            dncs.append(dnc)
-            d7vs.append(d7v)
-            npps.append(npp)
-            dpps.append(dpp)
-            d7ps.append(d7p)
-            
-            dths.append(dth)
-            dtrs.append(dtr)
-
-            cdts.append(cdt)
-
-            crps.append(crp)
-            crts.append(crt)
-            cris.append(cri)
-            crvs.append(crv)
-            crcs.append(crc)
+    dates = date_vals[cfg.START_DATE_IDX:]
 
-            pvis.append(pvi)
+    ds_records.begin(parse_date, 'mchrr')
+    for idx, _ in enumerate(tqdm(mc_region_list)):
+        mchrr = _['name']
 
-            dates.append(date_val)
+        # get basic characteristics
+        FIPS = mchrr
+        state = mchrr
+        name = mchrr
+        pop = pops[idx]
 
         # create JSON for this county
         j_county = {
@@ -318,36 +187,33 @@ def parse_mchrr_with_actnow_and_cdcpvi_data_v2(parse_date=None):
             'name': name,
             'date': parse_date,
 
-            'nccs': nccs,
-            'dncs': dncs,
-            'd7vs': d7vs,
-            'npps': npps,
-            'dpps': dpps,
-            'd7ps': d7ps,
+            'nccs': m['nccs'][idx].tolist(),
+            'dncs': m['dncs'][idx].tolist(),
+            'd7vs': m['d7vs'][idx].tolist(),
+            'npps': m['npps'][idx].tolist(),
+            'dpps': m['dpps'][idx].tolist(),
+            'd7ps': m['d7ps'][idx].tolist(),
 
-            'dths': dths,
-            'dtrs': dtrs,
+            'dths': m['dths'][idx].tolist(),
+            'dtrs': m['dtrs'][idx].tolist(),
 
-            'cdts': cdts,
+            'cdts': m['cdts'][idx].tolist(),
             
-            'crps': crps,
-            'crts': crts,
-            'crcs': crcs,
+            'crps': m['crps'][idx].tolist(),
+            'crts': m['crts'][idx].tolist(),
+            'crcs': m['crcs'][idx].tolist(),
 
-            'pvis': pvis,
+            'pvis': pvis[idx].tolist(),
 
             'dates': dates
         }
 
-        # save this json
-        fn = os.path.join(
-            cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'MCHRR-%s.json' % FIPS
-        )
-        with open(fn, 'w') as fp:
-            json.dump(j_county, fp, cls=NpEncoder)
+        # hand this record to the merger
+        ds_records.put(parse_date, 'mchrr', 'MCHRR-%s' % FIPS, j_county)
 
         print('* parsed %s data %s' % (mchrr, parse_date))
 
+    ds_records.save_batch(parse_date, 'mchrr')
     print('* done parsing all the MCHRR data %s from ACTNOW+CDCPVI' % (parse_date))
 
 
@@ -19,9 +19,27 @@ from pandas.api.types import is_numeric_dtype
 import ds_config as cfg
 
 import ds_util
-from ds_util import NpEncoder
+import ds_store
+import ds_panel
+import ds_records
 from ds_util import _floor
 from ds_util import _round
+from ds_util import _floor_arr
+from ds_util import _round_arr
+from ds_metric import calc_crrw_metrics
+from ds_metric import calc_ratio_metrics
+from ds_metric import calc_test_metrics
+
+# the actnow columns for the state-level results
+ACTNOW_STATE_COLS = [
+    'actuals.cases',
+    'actuals.deaths',
+    'actuals.positiveTests',
+    'actuals.negativeTests',
+    'actuals.vaccinationsCompleted',
+    'actuals.vaccinationsInitiated',
+    'metrics.vaccinationsInitiatedRatio'
+]
 
 
 def parse_state_with_jhu_and_cdcpvi_and_actnow_v2(parse_date=None):
@@ -90,18 +108,18 @@ def parse_state_with_jhu_and_cdcpvi_and_actnow_v2(parse_date=None):
 
     # get the covid data and pvi data
     fn_cdcpvi_data = cfg.FN_SAVE_CDCPVI_USA_ALL_DATA % parse_date
-    df_cdcpvi = pd.read_csv(fn_cdcpvi_data)
+    df_cdcpvi = ds_store.load_df(fn_cdcpvi_data)
     df_cdcpvi['stateFIPS'] = df_cdcpvi['countyFIPS'] // 1000
     # df_cdcpvi.set_index(['date', 'stateFIPS'], inplace=True)
     print('* loaded %s lines data frame from %s' % (len(df_cdcpvi), fn_cdcpvi_data))
 
     # get the covid data
     fn_data = cfg.FN_SAVE_JHU_STATE_ALL_DATA % parse_date
-    df_jhu = pd.read_csv(fn_data)
+    df_jhu = ds_store.load_df(fn_data)
 
     # get the vaccination data of JHU
     fn_actnow = cfg.FN_SAVE_ACTNOW_STATE_DATA % parse_date
-    df_actnow = pd.read_csv(fn_actnow)
+    df_actnow = ds_store.load_df(fn_actnow)
 
     # get geo data
     df_geo = pd.read_csv(cfg.FN_STATE_GEO)
@@ -125,6 +143,7 @@ def parse_state_with_jhu_and_cdcpvi_and_actnow_v2(parse_date=None):
         print('* created %s folder in %s' % (parse_date, cfg.FOLDER_PRS))
 
     # loop on state
+    ds_records.begin(parse_date, 'state')
     for state in tqdm(states):
         # get basic info
         stateFIPS = df_pop.loc[state, 'FIPS']
@@ -144,218 +163,67 @@ def parse_state_with_jhu_and_cdcpvi_and_actnow_v2(parse_date=None):
         df_actnow_state = df_actnow[df_actnow['state']==state].copy()
         df_actnow_state.set_index('date', inplace=True)
         
-        # get the values
-        nccs = []
-        dncs = []
-        d7vs = []
-        npps = []
-        dpps = []
-        d7ps = []
-
-        tprs = []
-        ttrs = []
-        tpts = []
-        t7rs = []
-
-        dths = []
-        dtrs = []
-
-        cdts = []
-
-        crps = []
-        crts = []
-        cris = []
-        crvs = []
-        crcs = []
-
-        pvis = []
-        fvcs = []
-        fvps = []
-        vacs = []
-        vaps = []
-
-        dates = []
-
-        # for all date, get the values, start from 7 day
-        for i in range(cfg.START_DATE_IDX, len(date_vals)):
-            # get the date
-            date_val = date_vals[i]
-
-            if date_vals[i-7] in df_jhu_state.index:
-                ncc = df_jhu_state.loc[date_val, 'cases']
-                dnc = ncc - df_jhu_state.loc[date_vals[i-1], 'cases']
-                d7v = (ncc - df_jhu_state.loc[date_vals[i-7], 'cases']) / 7
-
-                npp = ncc / pop * cfg.N_PERCAPITA
-                dpp = dnc / pop * cfg.N_PERCAPITA
-                d7p = d7v / pop * cfg.N_PERCAPITA
-
-                ttr = df_jhu_state.loc[date_val, 'totalTestResults']
-                tpt = df_jhu_state.loc[date_val, 'cases']
-                tpr = 0 if ttr == 0 else tpt / ttr
-                dth = df_jhu_state.loc[date_val, 'deaths']
-                dtr = 0 if ncc == 0 else dth / ncc
-
-                _ttr7 = df_jhu_state.loc[date_vals[i-7], 'totalTestResults']
-                _tpt7 = df_jhu_state.loc[date_vals[i-7], 'cases']
-                t7r = 0 if (ttr - _ttr7) == 0 else (ncc - _tpt7) / (ttr - _ttr7)
-
-                # get the CDT
-                _ncc_past = df_jhu_state.loc[date_vals[i-cfg.N_CDT_SMOOTH_DAYS], 'cases']
-                cdt = cfg.N_CDT_SMOOTH_DAYS * np.log(2) / np.log((ncc + 0.5) / _ncc_past)
-
-                # get the crrw ratio
-                crp = d7p
-                _ncc_7 = df_jhu_state.loc[date_vals[i-7], 'cases']
-                # get the past ncc
-                try: _ncc_14 = df_jhu_state.loc[date_vals[i-14], 'cases']
-                except: _ncc_14 = 0
-                # get the crt
-                try: crt = (ncc - _ncc_7) / (_ncc_7 - _ncc_14)
-                except: crt = 0
-
-                # get the cri of today
-                cri = 2
-                # the GREEN potential
-                if crp <= cfg.S_GREEN_CRP_CUT_VALUE_1: cri = 1
-                if crt <= cfg.S_GREEN_RW_CUT_VALUE_2 and crp <= cfg.S_GREEN_CRP_CUT_VALUE_2: cri = 1
-
-                # the RED potential
-                if crt > cfg.S_RED_RW_CUT_VALUE_1 and crp > cfg.S_RED_CRP_CUT_VALUE_1: cri = 3
-                if crp > cfg.S_RED_CRP_CUT_VALUE_2: cri = 3
-
-                # get the crv of today
-                crv = 0
-                if i >= 7 + cfg.START_DATE_IDX:
-                    for j in range(1, 7+1):
-                        crv += cris[i-cfg.START_DATE_IDX-j]
-                
-                # get the crc based on crv
-                crc = 'Y'
-                if crv <= 7: crc = 'G'
-                if crv >=21: crc = 'R'
-
-                # get the PVI as median value of this state
-                try: pvi = df_cdcpvi_state.loc[date_val, 'pvi'].median()
-                except: pvi = 0
-
-                # get the FVP
-                try:
-                    fvc = df_actnow_state.loc[date_val, 'actuals.vaccinationsCompleted']
-                    if pd.isna(fvc):
-                        fvc = 0
-                        fvp = 0
-                    else:
-                        fvp = fvc / pop
-                except:
-                    fvc = 0
-                    fvp = 0
-
-                # get the VAP and VAC
-                try:
-                    vac = df_actnow_state.loc[date_val, 'actuals.vaccinationsInitiated']
-                    vap = df_actnow_state.loc[date_val, 'metrics.vaccinationsInitiatedRatio']
-                
-                    if pd.isna(vac):
-                        vac = 0
-                    if pd.isna(vap):
-                        vap = 0
-                except:
-                    vac = 0
-                    vap = 0
-
-            else:
-                # which means the no data? so, everything is 0
-                ncc = 0
-                dnc = 0
-                d7v = 0
-                npp = 0
-                dpp = 0
-                d7p = 0
-
-                dth = 0
-                dtr = 0
-
-                tpr = 0
-                ttr = 0
-                tpt = 0
-                t7r = 0
-
-                cdt = cfg.CDT_CUT_VALUE
-
-                crp = 0
-                crt = 0
-                cri = 0
-                crv = 0
-                crc = 'G'
-
-                pvi = 0
-                fvc = 0
-                fvp = 0
-                vac = 0
-                vap = 0
-
-            # fix values
-            ncc = _floor(ncc)
-            dnc = _floor(dnc)
-            d7v = _floor(d7v)
-            npp = _round(npp, 2)
-            dpp = _round(dpp, 2)
-            d7p = _round(d7p, 2)
-
-            dth = _floor(dth)
-            dtr = _round(dtr, 4)
-
-            tpr = _round(tpr, 4)
-            ttr = _floor(ttr)
-            tpt = _floor(tpt)
-            t7r = _round(t7r, 4)
-
-            cdt = _round(cdt, 2)
-
-            crp = _round(crp, 2)
-            crt = _round(crt, 4)
-            crc = crc
-
-            pvi = _round(pvi, 4)
-
-            fvc = _floor(fvc)
-            fvp = _round(fvp, 4)
-            vac = _floor(vac)
-            vap = _round(vap, 4)
-            
-            # append values
-            nccs.append(ncc)
-            dncs.append(dnc)
-            d7vs.append(d7v)
-            npps.append(npp)
-            dpps.append(dpp)
-            d7ps.append(d7p)
-
-            dths.append(dth)
-            dtrs.append(dtr)
-
-            ttrs.append(ttr)
-            tpts.append(tpt)
-            tprs.append(tpr)
-            t7rs.append(t7r)
-            
-            cdts.append(cdt)
-
-            crps.append(crp)
-            crts.append(crt)
-            cris.append(cri)
-            crvs.append(crv)
-            crcs.append(crc)
-
-            pvis.append(pvi)
-
-            fvcs.append(fvc)
-            fvps.append(fvp)
-            vacs.append(vac)
-            vaps.append(vap)
-
-            dates.append(date_val)
+        # get the values of all dates in one batch
+        df_vals = df_jhu_state.reindex(
+            index=date_vals,
+            columns=['cases', 'deaths', 'totalTestResults']
+        )
+        df_act_vals = df_actnow_state.reindex(
+            index=date_vals,
+            columns=[
+                'actuals.vaccinationsCompleted',
+                'actuals.vaccinationsInitiated',
+                'metrics.vaccinationsInitiatedRatio'
+            ]
+        )
+
+        # the date without data 7 days ago means no data, everything is 0
+        valid = np.array([
+            date_vals[i-7] in df_jhu_state.index
+            for i in range(cfg.START_DATE_IDX, len(date_vals))
+        ])
+
+        # calculate the CrRW metrics, start from 14 day
+        m = calc_crrw_metrics(
+            df_vals['cases'].values,
+            df_vals['deaths'].values,
+            [pop],
+            zero_guard=False,
+            valid=[valid]
+        )
+
+        # get the test metrics
+        t = calc_test_metrics(
+            df_vals['totalTestResults'].values,
+            df_vals['cases'].values
+        )
+
+        # get the PVI as median value of this state
+        pvis = _round_arr(
+            df_cdcpvi_state.groupby(level=0)['pvi'].median()\
+                .reindex(date_vals).values[cfg.START_DATE_IDX:],
+            4
+        )
+
+        # get the FVP and FVC
+        fvcs, fvps = calc_ratio_metrics(
+            df_act_vals['actuals.vaccinationsCompleted'].values, [pop]
+        )
+
+        # get the VAP and VAC
+        vacs = _floor_arr(
+            df_act_vals['actuals.vaccinationsInitiated'].values[cfg.START_DATE_IDX:]
+        )
+        vaps = _round_arr(
+            df_act_vals['metrics.vaccinationsInitiatedRatio'].values[cfg.START_DATE_IDX:], 4
+        )
+
+        dates = date_vals[cfg.START_DATE_IDX:]
+
+        # fix values of the dates without data
+        for arr in [t['ttrs'], t['tpts'], t['tprs'], t['t7rs'],
+                    pvis, fvcs, fvps, vacs, vaps]:
+            arr[..., ~valid] = 0
 
         # create JSON for this state
         j_state = {
@@ -367,47 +235,44 @@ def parse_state_with_jhu_and_cdcpvi_and_actnow_v2(parse_date=None):
             'lat': lat,
             'lon': lon,
 
-            'nccs': nccs,
-            'dncs': dncs,
-            'd7vs': d7vs,
+            'nccs': m['nccs'][0].tolist(),
+            'dncs': m['dncs'][0].tolist(),
+            'd7vs': m['d7vs'][0].tolist(),
 
-            'npps': npps,
-            'dpps': dpps,
-            'd7ps': d7ps,
+            'npps': m['npps'][0].tolist(),
+            'dpps': m['dpps'][0].tolist(),
+            'd7ps': m['d7ps'][0].tolist(),
 
-            'tprs': tprs,
-            'ttrs': ttrs,
-            'tpts': tpts,
-            't7rs': t7rs,
+            'tprs': t['tprs'][0].tolist(),
+            'ttrs': t['ttrs'][0].tolist(),
+            'tpts': t['tpts'][0].tolist(),
+            't7rs': t['t7rs'][0].tolist(),
 
-            'dths': dths,
-            'dtrs': dtrs,
+            'dths': m['dths'][0].tolist(),
+            'dtrs': m['dtrs'][0].tolist(),
 
-            'cdts': cdts,
+            'cdts': m['cdts'][0].tolist(),
 
-            'crps': crps,
-            'crts': crts,
+            'crps': m['crps'][0].tolist(),
+            'crts': m['crts'][0].tolist(),
             # 'cris': cris,
             # 'crvs': crvs,
-            'crcs': crcs,
+            'crcs': m['crcs'][0].tolist(),
 
-            'pvis': pvis,
+            'pvis': pvis.tolist(),
 
-            'fvcs': fvcs,
-            'fvps': fvps,
-            'vacs': vacs,
-            'vaps': vaps,
+            'fvcs': fvcs[0].tolist(),
+            'fvps': fvps[0].tolist(),
+            'vacs': vacs.tolist(),
+            'vaps': vaps.tolist(),
 
             'dates': dates
         }
 
-        # save this json
-        fn = os.path.join(
-            cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % state
-        )
-        with open(fn, 'w') as fp:
-            json.dump(j_state, fp, cls=NpEncoder)
+        # hand this record to the merger
+        ds_records.put(parse_date, 'state', 'USA-%s' % state, j_state)
 
+    ds_records.save_batch(parse_date, 'state')
     print('* done parsing the state data from JHU data %s' % (parse_date))
 
 
@@ -475,16 +340,12 @@ def parse_state_with_cdcpvi_and_actnow_v2(parse_date=None):
         date_vals.append(day.strftime('%Y-%m-%d'))
     print('* created dates %s to %s' % (date_vals[0], date_vals[-1]))
 
-    # get the covid data and pvi data
-    fn_cdcpvi_data = cfg.FN_SAVE_CDCPVI_USA_ALL_DATA % parse_date
-    df_cdcpvi = pd.read_csv(fn_cdcpvi_data)
-    df_cdcpvi['stateFIPS'] = df_cdcpvi['countyFIPS'] // 1000
-    # df_cdcpvi.set_index(['date', 'stateFIPS'], inplace=True)
-    print('* loaded %s lines data frame from %s' % (len(df_cdcpvi), fn_cdcpvi_data))
+    # get the panel of the pvi data, and the state of each county
+    panel_cdcpvi = ds_panel.get_panel(parse_date, 'cdcpvi_county')
+    cdcpvi_states = np.asarray(panel_cdcpvi.regions) // 1000
 
-    # get the vaccination data
-    fn_actnow = cfg.FN_SAVE_ACTNOW_STATE_DATA % parse_date
-    df_actnow = pd.read_csv(fn_actnow)
+    # get the panel of the vaccination data
+    panel_actnow = ds_panel.get_panel(parse_date, 'actnow_state')
 
     # get geo data
     df_geo = pd.read_csv(cfg.FN_STATE_GEO)
@@ -507,8 +368,47 @@ def parse_state_with_cdcpvi_and_actnow_v2(parse_date=None):
         os.makedirs(os.path.join(cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date), exist_ok=True)
         print('* created %s folder in %s' % (parse_date, cfg.FOLDER_PRS))
 
+    # the values of all states, state x date x column, the missing values
+    # have been filled in the panel, and the states not in it are all 0
+    act_vals = ds_panel.take(
+        panel_actnow, states, ACTNOW_STATE_COLS, fill_value=0
+    )
+    act = dict(zip(ACTNOW_STATE_COLS, act_vals.transpose(2, 0, 1)))
+    pops = df_pop.loc[states, 'POP'].values
+
+    # calculate the CrRW metrics of all states in one batch, start from 14 day
+    m = calc_crrw_metrics(
+        act['actuals.cases'],
+        act['actuals.deaths'],
+        pops,
+        zero_guard=False
+    )
+
+    # get the test metrics
+    t = calc_test_metrics(
+        act['actuals.positiveTests'] + \
+            act['actuals.negativeTests'],
+        act['actuals.positiveTests']
+    )
+
+    # get the FVP and FVC
+    fvcs, fvps = calc_ratio_metrics(
+        act['actuals.vaccinationsCompleted'], pops
+    )
+
+    # get the VAP and VAC
+    vacs = _floor_arr(
+        act['actuals.vaccinationsInitiated'][:, cfg.START_DATE_IDX:]
+    )
+    vaps = _round_arr(
+        act['metrics.vaccinationsInitiatedRatio'][:, cfg.START_DATE_IDX:], 4
+    )
+
+    dates = date_vals[cfg.START_DATE_IDX:]
+
     # loop on state
-    for state in tqdm(states):
+    ds_records.begin(parse_date, 'state')
+    for idx, state in enumerate(tqdm(states)):
         # get basic info
         stateFIPS = df_pop.loc[state, 'FIPS']
         FIPS = '%s' % stateFIPS if stateFIPS > 9 else '0%s' % stateFIPS
@@ -518,249 +418,13 @@ def parse_state_with_cdcpvi_and_actnow_v2(parse_date=None):
         lon = df_geo.loc[state, 'lon']
         print("* parsing state [%s, %s/%s]" % (state, name, FIPS))
 
-        df_cdcpvi_state = df_cdcpvi[df_cdcpvi['stateFIPS']==stateFIPS].copy()
-        df_cdcpvi_state.set_index('date', inplace=True)
-
-        df_actnow_state = df_actnow[df_actnow['state']==state].copy()
-        print(df_actnow_state.tail(10))
-
-        # there are missing in the actnow data, fill the missing
-        missing_dates = []
-        existing_dates = set(df_actnow_state.date.values)
-        for date in date_vals:
-            if date not in existing_dates:
-                # missing data is very common in actnow ...
-                df_actnow_state = df_actnow_state.append(
-                    {'date': date}, 
-                    ignore_index=True
-                )
-                missing_dates.append(date)
-
-        if len(missing_dates) > 0:
-            print(f"* !!!! actnow state {state} has {len(missing_dates)}/{len(date_vals)} missing dates but fixed!")
-
-        # set index
-        df_actnow_state.set_index('date', inplace=True)
-        print('* get df_actnow_stat as:')
-
-        # fix the missing values for tests and others.
-        df_actnow_state.fillna(method="ffill", inplace=True)
-        
-        # get the values
-        nccs = []
-        dncs = []
-        d7vs = []
-        npps = []
-        dpps = []
-        d7ps = []
-
-        tprs = []
-        ttrs = []
-        tpts = []
-        t7rs = []
-
-        dths = []
-        dtrs = []
-
-        cdts = []
-
-        crps = []
-        crts = []
-        cris = []
-        crvs = []
-        crcs = []
-
-        pvis = []
-        fvcs = []
-        fvps = []
-        vacs = []
-        vaps = []
-
-        dates = []
-
-        # for all date, get the values, start from 7 day
-        for i in range(cfg.START_DATE_IDX, len(date_vals)):
-            # get the date
-            date_val = date_vals[i]
-
-            if date_vals[i-7] in df_actnow_state.index:
-                ncc = df_actnow_state.loc[date_val, 'actuals.cases']
-                dnc = ncc - df_actnow_state.loc[date_vals[i-1], 'actuals.cases']
-                d7v = (ncc - df_actnow_state.loc[date_vals[i-7], 'actuals.cases']) / 7
-
-                npp = ncc / pop * cfg.N_PERCAPITA
-                dpp = dnc / pop * cfg.N_PERCAPITA
-                d7p = d7v / pop * cfg.N_PERCAPITA
-
-                ttr = df_actnow_state.loc[date_val, 'actuals.positiveTests'] + \
-                      df_actnow_state.loc[date_val, 'actuals.negativeTests']
-
-                tpt = df_actnow_state.loc[date_val, 'actuals.positiveTests']
-                tpr = 0 if ttr == 0 else tpt / ttr
-                dth = df_actnow_state.loc[date_val, 'actuals.deaths']
-                dtr = 0 if ncc == 0 else dth / ncc
-
-                _ttr7 = df_actnow_state.loc[date_vals[i-7], 'actuals.positiveTests'] + \
-                        df_actnow_state.loc[date_vals[i-7], 'actuals.negativeTests']
-                _tpt7 = df_actnow_state.loc[date_vals[i-7], 'actuals.positiveTests']
-                t7r = 0 if (ttr - _ttr7) == 0 else (tpt - _tpt7) / (ttr - _ttr7)
-
-                # get the CDT
-                _ncc_past = df_actnow_state.loc[date_vals[i-cfg.N_CDT_SMOOTH_DAYS], 'actuals.cases']
-                cdt = cfg.N_CDT_SMOOTH_DAYS * np.log(2) / np.log((ncc + 0.5) / _ncc_past)
-
-                # get the crrw ratio
-                crp = d7p
-                _ncc_7 = df_actnow_state.loc[date_vals[i-7], 'actuals.cases']
-                # get the past ncc
-                try: _ncc_14 = df_actnow_state.loc[date_vals[i-14], 'actuals.cases']
-                except: _ncc_14 = 0
-                # get the crt
-                try: crt = (ncc - _ncc_7) / (_ncc_7 - _ncc_14)
-                except: crt = 0
-
-                # get the cri of today
-                cri = 2
-                # the GREEN potential
-                if crp <= cfg.S_GREEN_CRP_CUT_VALUE_1: cri = 1
-                if crt <= cfg.S_GREEN_RW_CUT_VALUE_2 and crp <= cfg.S_GREEN_CRP_CUT_VALUE_2: cri = 1
-
-                # the RED potential
-                if crt > cfg.S_RED_RW_CUT_VALUE_1 and crp > cfg.S_RED_CRP_CUT_VALUE_1: cri = 3
-                if crp > cfg.S_RED_CRP_CUT_VALUE_2: cri = 3
-
-                # get the crv of today
-                crv = 0
-                if i >= 7 + cfg.START_DATE_IDX:
-                    for j in range(1, 7+1):
-                        crv += cris[i-cfg.START_DATE_IDX-j]
-                
-                # get the crc based on crv
-                crc = 'Y'
-                if crv <= 7: crc = 'G'
-                if crv >=21: crc = 'R'
-
-                # get the PVI as median value of this state
-                try: pvi = df_cdcpvi_state.loc[date_val, 'pvi'].median()
-                except: pvi = 0
-
-                # get the FVP
-                try:
-                    fvc = df_actnow_state.loc[date_val, 'actuals.vaccinationsCompleted']
-                    if pd.isna(fvc):
-                        fvc = 0
-                        fvp = 0
-                    else:
-                        fvp = fvc / pop
-                except:
-                    fvc = 0
-                    fvp = 0
-
-                # get the VAP and VAC
-                try:
-                    vac = df_actnow_state.loc[date_val, 'actuals.vaccinationsInitiated']
-                    vap = df_actnow_state.loc[date_val, 'metrics.vaccinationsInitiatedRatio']
-                
-                    if pd.isna(vac):
-                        vac = 0
-                    if pd.isna(vap):
-                        vap = 0
-                except:
-                    vac = 0
-                    vap = 0
-
-            else:
-                # which means the no data? so, everything is 0
-                ncc = 0
-                dnc = 0
-                d7v = 0
-                npp = 0
-                dpp = 0
-                d7p = 0
-
-                dth = 0
-                dtr = 0
-
-                tpr = 0
-                ttr = 0
-                tpt = 0
-                t7r = 0
-
-                cdt = cfg.CDT_CUT_VALUE
-
-                crp = 0
-                crt = 0
-                cri = 0
-                crv = 0
-                crc = 'G'
-
-                pvi = 0
-                fvc = 0
-                fvp = 0
-                vac = 0
-                vap = 0
-
-            # fix values
-            ncc = _floor(ncc)
-            dnc = _floor(dnc)
-            d7v = _floor(d7v)
-            npp = _round(npp, 2)
-            dpp = _round(dpp, 2)
-            d7p = _round(d7p, 2)
-
-            dth = _floor(dth)
-            dtr = _round(dtr, 4)
-
-            tpr = _round(tpr, 4)
-            ttr = _floor(ttr)
-            tpt = _floor(tpt)
-            t7r = _round(t7r, 4)
-
-            cdt = _round(cdt, 2)
-
-            crp = _round(crp, 2)
-            crt = _round(crt, 4)
-            crc = crc
-
-            pvi = _round(pvi, 4)
-
-            fvc = _floor(fvc)
-            fvp = _round(fvp, 4)
-            vac = _floor(vac)
-            vap = _round(vap, 4)
-            
-            # append values
-            nccs.append(ncc)
-            dncs.append(dnc)
-            d7vs.append(d7v)
-            npps.append(npp)
-            dpps.append(dpp)
-            d7ps.append(d7p)
-
-            dths.append(dth)
-            dtrs.append(dtr)
-
-            ttrs.append(ttr)
-            tpts.append(tpt)
-            tprs.append(tpr)
-            t7rs.append(t7r)
-            
-            cdts.append(cdt)
-
-            crps.append(crp)
-            crts.append(crt)
-            cris.append(cri)
-            crvs.append(crv)
-            crcs.append(crc)
-
-            pvis.append(pvi)
-
-            fvcs.append(fvc)
-            fvps.append(fvp)
-            vacs.append(vac)
-            vaps.append(vap)
-
-            dates.append(date_val)
+        # get the PVI as median value of this state
+        pvis = _round_arr(
+            ds_panel.nanmedian(
+                panel_cdcpvi.values[cdcpvi_states == stateFIPS, :, 0]
+            )[cfg.START_DATE_IDX:],
+            4
+        )
 
         # create JSON for this state
         j_state = {
@@ -772,46 +436,43 @@ def parse_state_with_cdcpvi_and_actnow_v2(parse_date=None):
             'lat': lat,
             'lon': lon,
 
-            'nccs': nccs,
-            'dncs': dncs,
-            'd7vs': d7vs,
+            'nccs': m['nccs'][idx].tolist(),
+            'dncs': m['dncs'][idx].tolist(),
+            'd7vs': m['d7vs'][idx].tolist(),
 
-            'npps': npps,
-            'dpps': dpps,
-            'd7ps': d7ps,
+            'npps': m['npps'][idx].tolist(),
+            'dpps': m['dpps'][idx].tolist(),
+            'd7ps': m['d7ps'][idx].tolist(),
 
-            'tprs': tprs,
-            'ttrs': ttrs,
-            'tpts': tpts,
-            't7rs': t7rs,
+            'tprs': t['tprs'][idx].tolist(),
+            'ttrs': t['ttrs'][idx].tolist(),
+            'tpts': t['tpts'][idx].tolist(),
+            't7rs': t['t7rs'][idx].tolist(),
 
-            'dths': dths,
-            'dtrs': dtrs,
+            'dths': m['dths'][idx].tolist(),
+            'dtrs': m['dtrs'][idx].tolist(),
 
-            'cdts': cdts,
+            'cdts': m['cdts'][idx].tolist(),
 
-            'crps': crps,
-            'crts': crts,
+            'crps': m['crps'][idx].tolist(),
+            'crts': m['crts'][idx].tolist(),
             # 'cris': cris,
             # 'crvs': crvs,
-            'crcs': crcs,
+            'crcs': m['crcs'][idx].tolist(),
 
-            'pvis': pvis,
+            'pvis': pvis.tolist(),
 
-            'fvcs': fvcs,
-            'fvps': fvps,
-            'vacs': vacs,
-            'vaps': vaps,
+            'fvcs': fvcs[idx].tolist(),
+            'fvps': fvps[idx].tolist(),
+            'vacs': vacs[idx].tolist(),
+            'vaps': vaps[idx].tolist(),
 
             'dates': dates
         }
 
-        # save this json
-        fn = os.path.join(
-            cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date, 'USA-%s.json' % state
-        )
-        with open(fn, 'w') as fp:
-            json.dump(j_state, fp, cls=NpEncoder)
+        # hand this record to the merger
+        ds_records.put(parse_date, 'state', 'USA-%s' % state, j_state)
 
+    ds_records.save_batch(parse_date, 'state')
     print('* done parsing the state data from JHU data %s' % (parse_date))
 
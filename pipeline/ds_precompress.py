@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+The precompressed variants of the result JSON files
+
+After merging, each result file gets the .gz and .br siblings at the
+maximum compression, e.g., AL-history.json.gz and AL-history.json.br.
+The web servers send the sibling matching the Accept-Encoding directly,
+instead of compressing the same file again for every request.
+
+The .br is only saved when brotli is installed. A sibling newer than its
+source file is not compressed again.
+
+Usage:
+
+    python ds_precompress.py [folder ...]
+'''
+import os
+import sys
+import gzip
+
+import ds_config as cfg
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _write_atomic(fn, data):
+    '''
+    Write the bytes to a temp file and then rename it
+    '''
+    fn_tmp = fn + '.tmp'
+    with open(fn_tmp, 'wb') as fp:
+        fp.write(data)
+    os.replace(fn_tmp, fn)
+
+
+def _is_fresh(fn, fn_sibling):
+    '''
+    Check if the sibling is newer than the source file
+    '''
+    return os.path.exists(fn_sibling) and \
+        os.path.getmtime(fn_sibling) >= os.path.getmtime(fn)
+
+
+def compress_file(fn, force=False):
+    '''
+    Save the .gz and .br siblings of the file
+
+    Args:
+        fn: the full path of the source file
+        force: compress even if the sibling is fresh
+
+    Return:
+        the list of the saved siblings
+    '''
+    fn_gz = fn + '.gz'
+    fn_br = fn + '.br'
+    todo_gz = force or not _is_fresh(fn, fn_gz)
+    todo_br = brotli is not None and (force or not _is_fresh(fn, fn_br))
+    if not todo_gz and not todo_br:
+        return []
+
+    with open(fn, 'rb') as fp:
+        data = fp.read()
+
+    saved = []
+    if todo_gz:
+        # mtime=0 makes the same bytes for the same content
+        _write_atomic(fn_gz, gzip.compress(
+            data, compresslevel=cfg.PRECOMPRESS_GZIP_LEVEL, mtime=0))
+        saved.append(fn_gz)
+
+    if todo_br:
+        _write_atomic(fn_br, brotli.compress(
+            data, quality=cfg.PRECOMPRESS_BR_QUALITY))
+        saved.append(fn_br)
+
+    return saved
+
+
+def compress_folder(folder, force=False):
+    '''
+    Save the .gz and .br siblings of the files in the folder
+
+    Return:
+        the number of the saved siblings
+    '''
+    if not os.path.exists(folder):
+        return 0
+
+    n_saved = 0
+    for fn in sorted(os.listdir(folder)):
+        if not fn.endswith(tuple(cfg.PRECOMPRESS_EXTS)):
+            continue
+        n_saved += len(compress_file(os.path.join(folder, fn), force))
+
+    return n_saved
+
+
+def compress_all(folders=None, force=False):
+    '''
+    Save the .gz and .br siblings of the result files
+
+    Args:
+        folders: the list of folders, default cfg.PRECOMPRESS_FOLDERS
+        force: compress even if the sibling is fresh
+    '''
+    if folders is None:
+        folders = cfg.PRECOMPRESS_FOLDERS
+
+    if brotli is None:
+        print('* brotli is not installed, only .gz is saved')
+
+    for folder in folders:
+        n_saved = compress_folder(folder, force)
+        print('* precompressed %s files in %s' % (n_saved, folder))
+
+
+if __name__ == "__main__":
+    compress_all(sys.argv[1:] or None)
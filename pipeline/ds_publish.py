@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+Publish the merged result files
+
+The merger writes the result files to the staging folder instead of the
+v2 folder, which is read by the web server. The publish step syncs the
+staged files to the disk, then moves each of them into the v2 folder by
+os.replace. The staging folder is on the same disk, so a reader always
+gets either the old or the new file, never a half-written one.
+
+The manifest.json is replaced at last. It has the parse date, the time
+of publish, and the size and SHA-256 of each file, so the clients can
+tell which files are from the same run, and cache them by the hash.
+The files not in this run keep their entries from the last manifest.
+Each entry also keeps the SHA-256 and parse date of the recent versions
+of the file in its history, so a client with an old version can get the
+delta since that date.
+'''
+import os
+import hashlib
+import datetime
+
+import ds_config as cfg
+import ds_json
+
+
+def _fsync_file(fn):
+    '''
+    Flush the file content to the disk
+    '''
+    with open(fn, 'rb') as fp:
+        os.fsync(fp.fileno())
+
+
+def _fsync_dir(folder):
+    '''
+    Flush the directory entries to the disk, e.g., after rename
+    '''
+    if not hasattr(os, 'O_DIRECTORY'):
+        # not supported on Windows
+        return
+
+    fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _get_sha256(fn):
+    '''
+    Get the SHA-256 of the file
+    '''
+    h = hashlib.sha256()
+    with open(fn, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1024 * 1024), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def load_manifest(folder=None):
+    '''
+    Load the manifest of the folder, None if not found
+    '''
+    if folder is None:
+        folder = cfg.FOLDER_RST_V2
+
+    fn = os.path.join(folder, cfg.FN_MANIFEST)
+    if not os.path.exists(fn):
+        return None
+
+    return ds_json.load_file(fn)
+
+
+def _get_history(item, sha256):
+    '''
+    Get the recent versions of the file, the newest first
+
+    Args:
+        item: the entry of the file in the last manifest, None if new
+        sha256: the SHA-256 of the new version
+    '''
+    if item is None:
+        return []
+
+    history = [{
+        'sha256': item['sha256'],
+        'parse_date': item['parse_date']
+    }] + item.get('history', [])
+    history = [ h for h in history if h['sha256'] != sha256 ]
+
+    return history[:cfg.MANIFEST_HISTORY_N]
+
+
+def publish(parse_date, folder_staging=None, folder_target=None):
+    '''
+    Move the staged files to the target folder and update the manifest
+
+    Args:
+        parse_date: the YYYY-MM-DD parse date of the files
+        folder_staging: default cfg.FOLDER_RST_V2_STAGING
+        folder_target: default cfg.FOLDER_RST_V2
+
+    Return:
+        the manifest, or None if nothing is staged
+    '''
+    if folder_staging is None:
+        folder_staging = cfg.FOLDER_RST_V2_STAGING
+    if folder_target is None:
+        folder_target = cfg.FOLDER_RST_V2
+
+    if not os.path.exists(folder_staging):
+        print('* NOT found staging folder %s' % folder_staging)
+        return None
+
+    fns = sorted([
+        fn for fn in os.listdir(folder_staging)
+        if not fn.endswith('.tmp') and fn != cfg.FN_MANIFEST
+    ])
+    if len(fns) == 0:
+        print('* NOT found any staged files in %s' % folder_staging)
+        return None
+
+    os.makedirs(folder_target, exist_ok=True)
+    old = load_manifest(folder_target)
+    old_files = {} if old is None else old['files']
+
+    # make sure all files are on the disk before they are visible
+    files = {}
+    for fn in fns:
+        full_fn = os.path.join(folder_staging, fn)
+        _fsync_file(full_fn)
+        sha256 = _get_sha256(full_fn)
+        files[fn] = {
+            'size': os.path.getsize(full_fn),
+            'sha256': sha256,
+            'parse_date': parse_date,
+            'history': _get_history(old_files.get(fn), sha256)
+        }
+
+    for fn in fns:
+        os.replace(
+            os.path.join(folder_staging, fn),
+            os.path.join(folder_target, fn)
+        )
+    _fsync_dir(folder_target)
+
+    # the files of the last runs which are still there
+    for fn, item in old_files.items():
+        if fn not in files and os.path.exists(os.path.join(folder_target, fn)):
+            files[fn] = item
+
+    manifest = {
+        'parse_date': parse_date,
+        'published_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'files': dict(sorted(files.items()))
+    }
+
+    fn_manifest = os.path.join(folder_target, cfg.FN_MANIFEST)
+    fn_tmp = fn_manifest + '.tmp'
+    ds_json.dump_file(manifest, fn_tmp)
+    _fsync_file(fn_tmp)
+    os.replace(fn_tmp, fn_manifest)
+    _fsync_dir(folder_target)
+
+    print('* published %s files of %s to %s' % (len(fns), parse_date, folder_target))
+
+    return manifest
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+The parsed records of the regions for the merger
+
+The parsers used to save one JSON file for each region in the prs folder,
+e.g., USA-01001.json, and the merger loads them back one by one. Now the
+parsers put the record of each region here by its name (the file name
+without .json). The records are kept in memory for the merger running in
+the same process, and the records of each kind (county, state, country and
+mchrr) are also saved in one batch file, so the merger in another process
+loads one file instead of thousands.
+
+Each line of the batch file is the name and the JSON text split by a tab.
+The JSON text is the same as the per-region file, which is only saved for
+debugging when cfg.PRS_SAVE_JSON is True.
+'''
+import os
+
+import ds_config as cfg
+import ds_json
+
+
+# parse_date -> kind -> name -> JSON text
+_records = {}
+
+
+def get_folder(parse_date):
+    '''
+    Get the folder of the parsed files of the date
+    '''
+    return os.path.join(cfg.FOLDER_PRS, cfg.FOLDER_V2, parse_date)
+
+
+def dumps(record):
+    '''
+    Convert the record to JSON text, the same as the per-region file
+    '''
+    return ds_json.dumps(record)
+
+
+def begin(parse_date, kind):
+    '''
+    Begin a new batch of the given kind, the old records are dropped
+    '''
+    _records.setdefault(parse_date, {})[kind] = {}
+
+
+def put(parse_date, kind, name, record):
+    '''
+    Put the record of a region
+
+    Args:
+        parse_date: the YYYY-MM-DD parse date
+        kind: county, state, country or mchrr
+        name: the name of the region, e.g., USA-01001, USA-AL, WORLD-USA
+        record: the dict of the record, or its JSON text by dumps
+    '''
+    if not isinstance(record, str):
+        record = dumps(record)
+
+    _records.setdefault(parse_date, {}).setdefault(kind, {})[name] = record
+
+    # the per-region file for debugging
+    if cfg.PRS_SAVE_JSON:
+        fn = os.path.join(get_folder(parse_date), '%s.json' % name)
+        with open(fn, 'w') as fp:
+            fp.write(record)
+
+
+def save_batch(parse_date, kind):
+    '''
+    Save the records of the given kind to the batch file
+
+    Return:
+        the file name of the batch
+    '''
+    records = _records.get(parse_date, {}).get(kind, {})
+    folder = get_folder(parse_date)
+    os.makedirs(folder, exist_ok=True)
+
+    fn = os.path.join(folder, cfg.FN_PRS_BATCH % kind)
+    fn_tmp = fn + '.tmp'
+    with open(fn_tmp, 'w') as fp:
+        for name, text in records.items():
+            fp.write('%s\t%s\n' % (name, text))
+    os.replace(fn_tmp, fn)
+
+    print('* saved %s %s records to %s' % (len(records), kind, fn))
+
+    return fn
+
+
+def _load_batch(fn):
+    '''
+    Load the name -> JSON text of the batch file
+    '''
+    records = {}
+    with open(fn) as fp:
+        for line in fp:
+            name, text = line.rstrip('\n').split('\t', 1)
+            records[name] = text
+
+    return records
+
+
+def get_index(parse_date):
+    '''
+    Get the index of all the records of the date
+
+    The records in memory are used first, then the batch files of the
+    other kinds. When neither exists, e.g., the date was parsed by an old
+    version, the per-region JSON files are loaded.
+
+    Return:
+        a dict of name -> JSON text, use load() to get the record
+    '''
+    index = {}
+    folder = get_folder(parse_date)
+    in_memory = _records.get(parse_date, {})
+
+    for kind in cfg.PRS_BATCH_KINDS:
+        if kind in in_memory:
+            index.update(in_memory[kind])
+            continue
+
+        fn = os.path.join(folder, cfg.FN_PRS_BATCH % kind)
+        if os.path.exists(fn):
+            index.update(_load_batch(fn))
+
+    if len(index) == 0 and os.path.exists(folder):
+        for fn in os.listdir(folder):
+            if not fn.endswith('.json'):
+                continue
+            with open(os.path.join(folder, fn)) as fp:
+                index[fn[:-5]] = fp.read()
+
+    return index
+
+
+def load(index, name):
+    '''
+    Load the record of the region from the index
+
+    Each call returns a new dict, so the merger can change it.
+    '''
+    return ds_json.loads(index[name])
+
+
+def clear(parse_date=None):
+    '''
+    Release the records in memory, default all dates
+    '''
+    if parse_date is None:
+        _records.clear()
+    else:
+        _records.pop(parse_date, None)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+The columnar store for the downloaded source data
+
+The downloaders used to save a full CSV for each parse_date, and each parser
+needs to tokenize the CSV again. When pyarrow is available, the data frame
+is saved as a Feather file next to the CSV (same name, .feather suffix),
+which keeps the column types and dictionary-encodes the text columns such
+as state and date. The Feather file is written uncompressed, so it's
+memory-mapped without a copy when loading.
+
+Without pyarrow, or when the Feather file doesn't exist, the CSV is used.
+
+The store also keeps the per-day fragments of the sources which are merged
+from daily raw files, e.g., CDC PVI and JHU state data. Each fragment is
+keyed by the date and the MD5 of its raw files, so that only the new or
+changed days are normalized again when building the history. The merged
+history is also saved with its last date, so the days before it are not
+loaded again unless their raw files are changed.
+'''
+import os
+import json
+import hashlib
+
+from tqdm import tqdm
+
+import pandas as pd
+
+import ds_config as cfg
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+
+def get_store_fn(fn):
+    '''
+    Get the columnar file name of the given CSV file name
+    '''
+    return os.path.splitext(fn)[0] + cfg.STORE_SUFFIX
+
+
+def exists(fn):
+    '''
+    Check if the data frame of the given CSV file name is in the store
+    '''
+    if feather is not None and os.path.exists(get_store_fn(fn)):
+        return True
+
+    return os.path.exists(fn)
+
+
+def save_df(df, fn, export_csv=None):
+    '''
+    Save the data frame to the store
+
+    Args:
+        df: the data frame to save, the index is not saved
+        fn: the CSV file name, e.g., cfg.FN_SAVE_ACTNOW_COUNTY_DATA % date
+        export_csv: also save the CSV file, default cfg.STORE_EXPORT_CSV
+
+    Return:
+        the list of saved file names
+    '''
+    if export_csv is None:
+        export_csv = cfg.STORE_EXPORT_CSV
+
+    fns = []
+    if feather is not None:
+        fn_store = get_store_fn(fn)
+        df = df.reset_index(drop=True)
+
+        # dictionary encoding for the repeated text values
+        for col in df.columns:
+            if col in cfg.STORE_CATEGORY_COLUMNS and df[col].dtype == object:
+                df[col] = df[col].astype('category')
+
+        # uncompressed, so the memory-mapped read doesn't decompress it
+        feather.write_feather(df, fn_store, compression='uncompressed')
+        fns.append(fn_store)
+
+    if feather is None or export_csv:
+        df.to_csv(fn, index=False)
+        fns.append(fn)
+
+    return fns
+
+
+def load_df(fn, columns=None):
+    '''
+    Load the data frame from the store
+
+    Args:
+        fn: the CSV file name, e.g., cfg.FN_SAVE_ACTNOW_COUNTY_DATA % date
+        columns: the columns to load, default all
+
+    Return:
+        the data frame, the dictionary-encoded columns are decoded
+        so that the parsers get the same values as reading the CSV
+    '''
+    fn_store = get_store_fn(fn)
+    if feather is not None and os.path.exists(fn_store):
+        df = feather.read_table(
+            fn_store, columns=columns, memory_map=True
+        ).to_pandas()
+
+        for col in df.columns:
+            if pd.api.types.is_categorical_dtype(df[col]):
+                df[col] = df[col].astype(object)
+
+        return df
+
+    return pd.read_csv(fn, usecols=columns)
+
+
+def get_md5(fns):
+    '''
+    Get the MD5 of the content of the given files
+    '''
+    md5 = hashlib.md5()
+    for fn in fns:
+        with open(fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+def _get_stat(fns):
+    '''
+    Get the [mtime, size] of the given files, which is checked before MD5
+    '''
+    stat = []
+    for fn in fns:
+        st = os.stat(fn)
+        stat.append([st.st_mtime_ns, st.st_size])
+
+    return stat
+
+
+def _load_index(fn_index):
+    '''
+    Load the fragment index, {history: the last date, dates: {date: item}}
+    '''
+    if not os.path.exists(fn_index):
+        return {'history': None, 'dates': {}}
+
+    with open(fn_index) as f:
+        index = json.load(f)
+
+    if 'dates' not in index:
+        # the old index of date to MD5, the stat is checked by MD5 once
+        index = {
+            'history': None,
+            'dates': { date: {'md5': md5, 'stat': None} for date, md5 in index.items() }
+        }
+
+    return index
+
+
+def _save_index(index, fn_index):
+    '''
+    Save the fragment index by a temp file, so it's never half-written
+    '''
+    fn_tmp = fn_index + '.tmp'
+    with open(fn_tmp, 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(fn_tmp, fn_index)
+
+
+def build_history(folder, date_vals, func_fns, func_parse, col_date='date'):
+    '''
+    Build the history data frame from the per-day fragments
+
+    The merged history is saved in the folder with its last date (the
+    high-water mark) in the index. The next build loads it, and only
+    parses the dates after the mark and the dates whose raw files are
+    changed. The raw files are checked by the mtime and size first, and
+    only hashed by MD5 when they are different, e.g., downloaded again.
+    The index is saved after each parsed day, so an interrupted build
+    keeps the fragments done.
+
+    Args:
+        folder: the folder for the fragments, the history and the index
+        date_vals: the list of YYYY-MM-DD dates of the history
+        func_fns: function(date) returns the raw file names of the date,
+            the raw files should be downloaded in this function if missing
+        func_parse: function(date) returns the normalized data frame
+        col_date: the column of the date in the normalized data frame
+
+    Return:
+        the history data frame, and the number of re-parsed days
+    '''
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+
+    date_vals = list(date_vals)
+    fn_index = os.path.join(folder, cfg.FN_FRAG_INDEX)
+    fn_history = os.path.join(folder, cfg.FN_FRAG_HISTORY)
+    index = _load_index(fn_index)
+    items = index['dates']
+
+    # the history of a later parse date has more days, so it's not used
+    mark = index['history']
+    if mark is not None and (mark > date_vals[-1] or not exists(fn_history)):
+        mark = None
+
+    # the data frames of the days which are not in the saved history
+    dfs = {}
+    n_parsed = 0
+    for date in tqdm(date_vals):
+        fns = func_fns(date)
+        stat = _get_stat(fns)
+        item = items.get(date)
+
+        if item is not None and item['stat'] != stat:
+            if item['md5'] == get_md5(fns):
+                # the same content, e.g., downloaded again
+                item['stat'] = stat
+                _save_index(index, fn_index)
+            else:
+                item = None
+
+        if item is not None and mark is not None and date <= mark:
+            continue
+
+        fn_frag = os.path.join(folder, cfg.FN_FRAG % date)
+        if item is not None and exists(fn_frag):
+            # not changed, but after the mark
+            dfs[date] = load_df(fn_frag)
+            continue
+
+        dfs[date] = func_parse(date)
+        save_df(dfs[date], fn_frag, export_csv=False)
+        items[date] = {'md5': get_md5(fns), 'stat': stat}
+        _save_index(index, fn_index)
+        n_parsed += 1
+
+    if mark is None:
+        df = pd.concat([ dfs[date] for date in date_vals ], ignore_index=True)
+    else:
+        df = load_df(fn_history)
+        if len(dfs) > 0:
+            # replace the changed days, and keep the rows in the date order
+            df = df[~df[col_date].isin(list(dfs.keys()))]
+            df = pd.concat(
+                [df] + [ dfs[date] for date in date_vals if date in dfs ],
+                ignore_index=True
+            )
+            if min(dfs.keys()) <= mark:
+                df = df.sort_values(col_date, kind='stable', ignore_index=True)
+
+    if len(dfs) > 0 or mark != date_vals[-1]:
+        # clear the mark first, so a half-written history is never used
+        index['history'] = None
+        _save_index(index, fn_index)
+        save_df(df, fn_history, export_csv=False)
+        index['history'] = date_vals[-1]
+        _save_index(index, fn_index)
+
+    return df, n_parsed
@@ -1,10 +1,8 @@
 import os
 import math
-import json
 import datetime
 import argparse
 
-import wget
 
 import numpy as np
 
@@ -12,6 +10,10 @@ from tqdm import tqdm
 import pandas as pd
 
 import ds_config as cfg
+import ds_fetcher
+
+# the encoder is moved to ds_json, kept here for the old scripts
+from ds_json import NpEncoder
 
 
 def download_jhu_raw_world_data_by_date(dt):
@@ -38,7 +40,7 @@ def download_jhu_raw_world_data_by_date(dt):
     if os.path.exists(save_raw_fn):
         print('* %s data exists %s' % (dt_save_fn, save_raw_fn))
     else:
-        wget.download(url, save_raw_fn)
+        ds_fetcher.download(url, save_raw_fn)
         print('* done downloading %s to %s' % (dt, save_raw_fn))
 
 
@@ -57,7 +59,8 @@ def download_jhu_raw_world_data_by_date_range(ds, de):
 
     dates = pd.date_range(ds, de)
 
-    for date in tqdm(dates):
+    tasks = []
+    for date in dates:
         # get the url for this date
         dt_fn = date.strftime('%m-%d-%Y')
     
@@ -71,9 +74,10 @@ def download_jhu_raw_world_data_by_date_range(ds, de):
         if os.path.exists(save_raw_fn):
             continue
 
+        tasks.append((ds_fetcher.download, (url, save_raw_fn)))
 
-        # download
-        wget.download(url, save_raw_fn)
+    # download in parallel
+    ds_fetcher.run_parallel(tasks)
 
     print('* done downloading from %s to %s' % (ds, de))
 
@@ -141,14 +145,127 @@ def _round(v, d=4):
     except:
         return 0
 
-        
-class NpEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        else:
-            return super(NpEncoder, self).default(obj)
\ No newline at end of file
+
+def _floor_arr(arr):
+    '''
+    Floor an array as the _floor, the NaN and Inf are converted to 0
+    '''
+    arr = np.asarray(arr, dtype=np.float64)
+    arr = np.where(np.isfinite(arr), arr, 0)
+    return np.floor(arr).astype(np.int64)
+
+
+def _round_arr(arr, d=4):
+    '''
+    Round an array as the _round, the NaN and Inf are converted to 0
+    '''
+    arr = np.asarray(arr, dtype=np.float64)
+    arr = np.where(np.isfinite(arr), arr, 0)
+    return np.round(arr, d)
+
+
+def ffill_by_group(df, col_group, cols, fill_value=0):
+    '''
+    Forward fill the NaN values of the columns in each group
+
+    The rows are filled in their order in the data frame, and the NaN
+    values before the first value of each group are set to fill_value.
+    All the groups and columns are filled in one pass.
+
+    Args:
+        df: the data frame, which is changed in place
+        col_group: the column of the group, e.g., state or fips
+        cols: the list of columns to fill, the missing ones are skipped
+        fill_value: the value for the rest NaN values
+
+    Return:
+        the data frame
+    '''
+    cols = [ col for col in cols if col in df.columns ]
+    df[cols] = df.groupby(col_group, sort=False)[cols].ffill().fillna(fill_value)
+
+    return df
+
+
+def complete_calendar(df, col_group, groups, date_vals, ffill=True, fill_value=0):
+    '''
+    Complete a long-format data frame to the calendar of each group
+
+    The missing dates of all groups are added as NaN rows in one pass
+    instead of appending them one by one. Then the NaN values are forward
+    filled in each group by date, and the rest are set to fill_value.
+
+    Args:
+        df: data frame with the `col_group` and `date` columns
+        col_group: the column name of the group, e.g., fips or state
+        groups: the list of groups to keep, which is also the output order
+        date_vals: the sorted list of YYYY-MM-DD dates of the calendar
+        ffill: True to forward fill the NaN values
+        fill_value: the value for the rest NaN values, None to keep NaN
+
+    Return:
+        the data frame indexed by (group, date) in which each group owns
+        a block of len(date_vals) rows, and the gap report of the groups
+    '''
+    df = df[df[col_group].isin(groups)]
+    df = df.drop_duplicates(subset=[col_group, 'date'], keep='last')
+
+    # count the missing dates of each group
+    n_existing = df[df['date'].isin(date_vals)].groupby(col_group).size()
+    n_missing = (len(date_vals) - n_existing.reindex(groups).fillna(0)).astype(int)
+
+    # the dates out of calendar are kept for ffill, then dropped
+    all_dates = sorted(set(date_vals) | set(df['date'].unique()))
+    df = df.set_index([col_group, 'date'])
+    df = df.reindex(pd.MultiIndex.from_product(
+        [groups, all_dates], names=[col_group, 'date']
+    ))
+    if ffill:
+        df = df.groupby(level=0, sort=False).ffill()
+    if fill_value is not None:
+        df = df.fillna(fill_value)
+
+    if len(all_dates) > len(date_vals):
+        df = df[df.index.get_level_values('date').isin(date_vals)]
+
+    return df, get_gap_report(n_missing.to_dict(), len(date_vals))
+
+
+def get_gap_report(n_missing, n_dates):
+    '''
+    Get the gap report of the groups
+
+    Args:
+        n_missing: a dict of group to the number of missing dates
+        n_dates: the number of dates of the calendar
+
+    Return:
+        a dict of:
+        - n_groups: the number of groups
+        - n_dates: the number of dates
+        - n_filled: the total number of missing dates which are filled
+        - n_missing: the dict of group to the number of missing dates
+        - gaps: the dict of the groups which have missing dates
+    '''
+    return {
+        'n_groups': len(n_missing),
+        'n_dates': n_dates,
+        'n_filled': int(sum(n_missing.values())),
+        'n_missing': n_missing,
+        'gaps': { k: v for k, v in n_missing.items() if v > 0 },
+    }
+
+
+def print_gap_report(name, report, n_top=5):
+    '''
+    Print the summary of the gap report in one line
+    '''
+    if len(report['gaps']) == 0:
+        print('* %s has no missing dates in %s groups' % (name, report['n_groups']))
+        return
+
+    tops = sorted(report['gaps'].items(), key=lambda kv: -kv[1])[:n_top]
+    print('* !!!! %s has %s/%s groups with missing dates, filled %s records, e.g., %s' % (
+        name, len(report['gaps']), report['n_groups'], report['n_filled'],
+        ', '.join([ '%s: %s/%s' % (k, v, report['n_dates']) for k, v in tops ])
+    ))
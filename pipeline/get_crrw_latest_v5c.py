@@ -17,6 +17,9 @@ import numpy as np
 import pandas as pd
 from pandas.api.types import is_numeric_dtype
 
+# for the int64 serialization
+import ds_json
+
 
 print('* loaded packages!')
 
@@ -100,34 +103,6 @@ USE_THIS_COVID_CASE_DATA = 'no'
 USE_THIS_COVID_DEATH_DATA = 'no'
 
 
-# quick fix for the int64 not json serialization
-# from https://stackoverflow.com/questions/50916422/python-typeerror-object-of-type-int64-is-not-json-serializable
-class NpEncoder(json.JSONEncoder):
-    """ Custom encoder for numpy data types """
-    def default(self, obj):
-        if isinstance(obj, (np.int_, np.intc, np.intp, np.int8,
-                            np.int16, np.int32, np.int64, np.uint8,
-                            np.uint16, np.uint32, np.uint64)):
-
-            return int(obj)
-
-        elif isinstance(obj, (np.float_, np.float16, np.float32, np.float64)):
-            return float(obj)
-
-        elif isinstance(obj, (np.complex_, np.complex64, np.complex128)):
-            return {'real': obj.real, 'imag': obj.imag}
-
-        elif isinstance(obj, (np.ndarray,)):
-            return obj.tolist()
-
-        elif isinstance(obj, (np.bool_)):
-            return bool(obj)
-
-        elif isinstance(obj, (np.void)): 
-            return None
-
-        return json.JSONEncoder.default(self, obj)
-
 #%% the main part
 
 def main(mode='all'):
@@ -1033,7 +1008,7 @@ def main(mode='all'):
         'usa_data': output_data_usa,
         'mc_data': output_data_mc
     }
-    json.dump(output_json_mchrr, open(FN_OUTPUT_MC_FC_HIST, 'w'), cls=NpEncoder)
+    ds_json.dump_file(output_json_mchrr, FN_OUTPUT_MC_FC_HIST)
     print('* saved %s days of json of CASES, CDT, DEATH, DEATH RATE data of all MC HRR regions %s' % (n_days, FN_OUTPUT_CNTY_FC_HIST))
 
 
@@ -1045,7 +1020,7 @@ def main(mode='all'):
         'dates': list(map(_dconv, dates_w4dm[smooth_days:].tolist())),
         'world_data': output_data_world
     }
-    json.dump(output_json_world, open(FN_OUTPUT_WORLD_FC_HIST, 'w'), cls=NpEncoder)
+    ds_json.dump_file(output_json_world, FN_OUTPUT_WORLD_FC_HIST)
     print('* saved %s days of json of CASES, CDT, DEATH, DEATH RATE data of our WORLD %s' % (n_days, FN_OUTPUT_WORLD_FC_HIST))
     
 
@@ -1078,7 +1053,7 @@ def main(mode='all'):
             'state_data': output_json['state_data'][state],
             'usa_data': output_json['usa_data']
         }
-        json.dump(state_output_json, open(fn, 'w'), cls=NpEncoder)
+        ds_json.dump_file(state_output_json, fn)
     print('\n')
     print('* saved splited all history data to %s files' % (len(states)))
 
@@ -1091,7 +1066,7 @@ def main(mode='all'):
         'state_data': output_json['state_data'],
         'usa_data': output_json['usa_data']
     }
-    json.dump(all_state_output_json, open(FN_OUTPUT_STATE_FC_HIST, 'w'), cls=NpEncoder)
+    ds_json.dump_file(all_state_output_json, FN_OUTPUT_STATE_FC_HIST)
     print('* saved splited all history state data to %s' % (FN_OUTPUT_STATE_FC_HIST))
 
 
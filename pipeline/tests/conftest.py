@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+The settings of the tests
+
+    python -m pytest pipeline/tests
+'''
+import os
+import sys
+
+# the pipeline modules are imported by name, as in the pipeline folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
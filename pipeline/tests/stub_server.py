@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+A local HTTP server standing in for the data sources in the tests
+
+Each path is served by a route function, which gets the request handler
+and returns (status, headers, body). The requests are logged, so the
+tests can check the headers and statuses.
+'''
+import re
+import time
+import threading
+import http.server
+
+
+class StubServer(object):
+    '''
+    The server on a random port of localhost
+    '''
+    def __init__(self):
+        self.routes = {}
+        self.log = []
+        self.n_active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+        stub = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                stub._handle(self, send_body=False)
+
+            def do_GET(self):
+                stub._handle(self, send_body=True)
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path):
+        return 'http://127.0.0.1:%s%s' % (self.httpd.server_port, path)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handle(self, handler, send_body):
+        with self._lock:
+            self.n_active += 1
+            self.max_active = max(self.max_active, self.n_active)
+
+        try:
+            route = self.routes.get(handler.path)
+            if route is None:
+                status, headers, body = 404, {}, b'not found'
+            else:
+                status, headers, body = route(handler)
+
+            with self._lock:
+                self.log.append({
+                    'method': handler.command,
+                    'path': handler.path,
+                    'headers': dict(handler.headers),
+                    'status': status
+                })
+
+            handler.send_response(status)
+            for k, v in headers.items():
+                handler.send_header(k, v)
+            handler.send_header('Content-Length', str(len(body)))
+            handler.end_headers()
+            if send_body and status != 304:
+                handler.wfile.write(body)
+        finally:
+            with self._lock:
+                self.n_active -= 1
+
+    def requests(self, path, method=None):
+        '''
+        Get the logged requests of the path
+        '''
+        return [
+            r for r in self.log
+            if r['path'] == path and (method is None or r['method'] == method)
+        ]
+
+
+def serve_file(body, etag=None, range_ok=True, delay=0):
+    '''
+    Get the route of a static file with ETag, conditional GET and Range
+    '''
+    def route(handler):
+        if delay > 0:
+            time.sleep(delay)
+
+        headers = {}
+        if etag is not None:
+            headers['ETag'] = etag
+            if handler.headers.get('If-None-Match') == etag:
+                return 304, headers, b''
+
+        rng = handler.headers.get('Range')
+        if range_ok and rng is not None:
+            m = re.match(r'bytes=(-?\d+)-?(\d*)$', rng)
+            start = int(m.group(1))
+            if start < 0:
+                start = max(len(body) + start, 0)
+                end = len(body)
+            else:
+                end = min(int(m.group(2)) + 1, len(body)) if m.group(2) else len(body)
+            headers['Content-Range'] = 'bytes %s-%s/%s' % (start, end - 1, len(body))
+            return 206, headers, body[start:end]
+
+        return 200, headers, body
+
+    return route
+
+
+def serve_errors(n_errors, status, body):
+    '''
+    Get the route which fails the first n_errors requests
+    '''
+    n = [0]
+    def route(handler):
+        n[0] += 1
+        if n[0] <= n_errors:
+            return status, {}, b'error'
+        return 200, {}, body
+
+    return route
+
+
+def make_csv(n_regions, dates, skip=()):
+    '''
+    Make a CSV sorted by region then date, without the (region, date) in skip
+    '''
+    lines = ['region,date,value']
+    for i in range(n_regions):
+        for date in dates:
+            if (i, date) in skip:
+                continue
+            lines.append('R%03d,%s,%s' % (i, date, i))
+
+    return ('\n'.join(lines) + '\n').encode('utf8')
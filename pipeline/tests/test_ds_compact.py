@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+Test the compact schema and the delta of the merged history JSON
+
+    python -m pytest pipeline/tests
+'''
+import copy
+import datetime
+import unittest
+
+import ds_compact
+import ds_delta
+
+
+def make_history(n_dates, start='2021-02-01'):
+    '''
+    Make a merged history JSON of a state with two counties
+    '''
+    day = datetime.datetime.strptime(start, '%Y-%m-%d')
+    dates = [
+        (day + datetime.timedelta(days=i)).strftime('%Y-%m-%d')
+        for i in range(n_dates)
+    ]
+
+    def make_record(seed):
+        return {
+            'name': 'R%s' % seed,
+            'pop': 1000 * seed,
+            'nccs': [ seed * i * (i + 1) // 2 for i in range(n_dates) ],
+            'npps': [ round(seed * i / 7, 2) for i in range(n_dates) ],
+            'dtrs': [ round(seed / (i + 3), 4) for i in range(n_dates) ],
+            'crcs': [ 'GYR'[(seed + i) % 3] for i in range(n_dates) ],
+        }
+
+    return {
+        'last_update': dates[-1],
+        'dates': dates,
+        'state_data': make_record(1),
+        'county_data': {
+            '27109': make_record(2),
+            '27045': make_record(3),
+        },
+    }
+
+
+class TestCompact(unittest.TestCase):
+
+    def test_round_trip(self):
+        j = make_history(40)
+
+        self.assertEqual(ds_compact.decode(ds_compact.encode(j)), j)
+
+    def test_encoded(self):
+        enc = ds_compact.encode(make_history(40))
+
+        self.assertEqual(enc['dates'], {'start': '2021-02-01', 'n': 40})
+        self.assertEqual(enc['state_data']['nccs'][:3], [0, 1, 2])
+        self.assertEqual(enc['county_data']['27109']['npps'][:2], [0, 29])
+        self.assertIsInstance(enc['state_data']['crcs'], str)
+
+    def test_missing_values(self):
+        j = make_history(10)
+        j['state_data']['npps'][2] = None
+        j['state_data']['dtrs'][3] = float('nan')
+
+        dec = ds_compact.decode(ds_compact.encode(j))
+
+        self.assertIsNone(dec['state_data']['npps'][2])
+        self.assertIsNone(dec['state_data']['dtrs'][3])
+        self.assertEqual(dec['state_data']['npps'][3], j['state_data']['npps'][3])
+
+    def test_full_schema_as_is(self):
+        j = make_history(10)
+
+        self.assertIs(ds_compact.decode(j), j)
+
+
+class TestDelta(unittest.TestCase):
+
+    def test_patch_yesterday(self):
+        today = make_history(40)
+        delta = ds_delta.make_delta(today, 7)
+
+        for n_days in [1, 3, 7]:
+            old = make_history(40 - n_days)
+            self.assertEqual(ds_delta.apply_delta(old, delta), today)
+
+    def test_revised_values(self):
+        today = make_history(40)
+        delta = ds_delta.make_delta(today, 7)
+
+        # the source revised the last days
+        old = make_history(39)
+        old['county_data']['27045']['nccs'][-1] += 100
+
+        self.assertEqual(ds_delta.apply_delta(old, delta), today)
+
+    def test_too_old(self):
+        delta = ds_delta.make_delta(make_history(40), 7)
+
+        self.assertIsNone(ds_delta.apply_delta(make_history(32), delta))
+
+    def test_new_region(self):
+        today = make_history(40)
+        delta = ds_delta.make_delta(today, 7)
+
+        old = make_history(39)
+        del old['county_data']['27045']
+
+        self.assertIsNone(ds_delta.apply_delta(old, delta))
+
+    def test_short_history(self):
+        today = make_history(5)
+        delta = ds_delta.make_delta(today, 7)
+
+        self.assertEqual(delta['base_n'], 0)
+        self.assertIsNone(delta['since'])
+        self.assertEqual(ds_delta.apply_delta(make_history(3), delta), today)
+
+    def test_delta_not_changed(self):
+        today = make_history(40)
+        old = make_history(39)
+        copy_old = copy.deepcopy(old)
+
+        ds_delta.apply_delta(old, ds_delta.make_delta(today, 7))
+
+        self.assertEqual(old, copy_old)
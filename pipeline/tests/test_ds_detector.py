@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+Test the concurrent detectors against a local HTTP server
+
+    python -m pytest pipeline/tests
+'''
+import time
+import threading
+import unittest
+
+from stub_server import StubServer, serve_file, serve_errors, make_csv
+
+import ds_config as cfg
+import ds_fetcher
+import ds_detector
+
+
+PARSE_DATE = '2021-02-28'
+DATES = ['2021-02-%02d' % d for d in range(1, 29)]
+
+
+def _get_detector(name):
+    return [ d for d in ds_detector.DETECTORS if d['name'] == name ][0]
+
+
+def _get_detector_threads():
+    return [ t for t in threading.enumerate() if t.name.startswith('detector') ]
+
+
+def _detect_raise(parse_date):
+    raise ValueError('broken detector')
+
+
+class TestRunDetectors(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.server.routes['/actnow.csv'] = serve_file(make_csv(5, DATES), etag='"a"')
+        self.server.routes['/owid.csv'] = serve_file(
+            make_csv(5, DATES), etag='"o"', delay=2
+        )
+        self.server.routes['/nytimes.csv'] = serve_errors(100, 500, b'')
+
+        self._cfg = {}
+        for k, v in [
+            ('DS_ACTNOW_TS_COUNTY', self.server.url('/actnow.csv')),
+            ('DS_OWIDVAC_WORLD', self.server.url('/owid.csv')),
+            ('DS_NYTIMES_LATEST_USA', self.server.url('/nytimes.csv')),
+            ('DETECT_PROBE_MODE', True),
+            ('DETECT_TIMEOUT', 10),
+            ('DETECT_TIMEOUTS', {'owidvac_world': 0.5}),
+            ('FETCH_BACKOFF_FACTOR', 0),
+        ]:
+            self._cfg[k] = getattr(cfg, k)
+            setattr(cfg, k, v)
+
+        ds_fetcher._session = None
+        ds_fetcher._probe_cache.clear()
+
+        # the slow one is the first, and the failing ones are in between
+        self._detectors = ds_detector.DETECTORS
+        ds_detector.DETECTORS = [
+            _get_detector('owidvac_world'),
+            _get_detector('nytimes_usa'),
+            {'name': 'broken', 'group': 'broken', 'func': _detect_raise, 'required': True},
+            _get_detector('actnow_county'),
+        ]
+
+    def tearDown(self):
+        ds_detector.DETECTORS = self._detectors
+        for k, v in self._cfg.items():
+            setattr(cfg, k, v)
+        ds_fetcher._session = None
+        self.server.stop()
+
+    def test_run_detectors(self):
+        t0 = time.time()
+        rs = ds_detector.run_detectors(PARSE_DATE)
+        elapsed = time.time() - t0
+
+        # the slow one doesn't delay the results
+        self.assertLess(elapsed, 1.5)
+
+        # in the order of DETECTORS, not the order of finishing
+        self.assertEqual(
+            list(rs.keys()),
+            ['owidvac_world', 'nytimes_usa', 'broken', 'actnow_county']
+        )
+
+        self.assertEqual(rs['owidvac_world'].errmsg, 'Timeout')
+        self.assertFalse(rs['owidvac_world'].flag)
+
+        self.assertFalse(rs['nytimes_usa'].success)
+        self.assertFalse(rs['nytimes_usa'].flag)
+        self.assertFalse(rs['nytimes_usa'].required)
+
+        self.assertTrue(rs['broken'].errmsg.startswith('Err: broken detector'))
+
+        self.assertTrue(rs['actnow_county'].success)
+        self.assertTrue(rs['actnow_county'].flag)
+        self.assertEqual(rs['actnow_county'].latest_date, PARSE_DATE)
+
+        # only the required ones block the pipeline
+        self.assertEqual(ds_detector.get_not_ready(rs), ['owidvac_world', 'broken'])
+
+    def test_timeout_thread_ends(self):
+        t0 = time.time()
+        rs = ds_detector.run_detectors(PARSE_DATE)
+        self.assertEqual(rs['owidvac_world'].errmsg, 'Timeout')
+
+        # the slow one stops at its deadline, not when the server replies
+        while time.time() - t0 < 1.5 and len(_get_detector_threads()) > 0:
+            time.sleep(0.05)
+        self.assertEqual(_get_detector_threads(), [])
+
+    def test_groups(self):
+        rs = ds_detector.run_detectors(PARSE_DATE, groups=['actnow'])
+
+        self.assertEqual(list(rs.keys()), ['actnow_county'])
+        self.assertEqual(ds_detector.get_not_ready(rs), [])
+
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+Test the download manager against a local HTTP server
+
+    python -m pytest pipeline/tests
+'''
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from stub_server import StubServer, serve_file, serve_errors, make_csv
+
+import ds_config as cfg
+import ds_fetcher
+
+
+DATES = ['2021-02-%02d' % d for d in range(1, 29)]
+
+
+class FetcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.folder = tempfile.mkdtemp()
+
+        # the settings for the tests, restored in tearDown
+        self._cfg = {}
+        for k, v in [
+            ('FETCH_BACKOFF_FACTOR', 0),
+            ('FETCH_RETRIES', 3),
+            ('FETCH_MAX_PER_HOST', 2),
+            ('FETCH_TIMEOUT', 10),
+            ('PROBE_HEAD_BYTES', 256),
+            ('PROBE_TAIL_BYTES', 256),
+            ('PROBE_SCAN_LINES', 100),
+        ]:
+            self._cfg[k] = getattr(cfg, k)
+            setattr(cfg, k, v)
+
+        # the session and semaphores are created by the settings above
+        ds_fetcher._session = None
+        ds_fetcher._host_sems.clear()
+        ds_fetcher._probe_cache.clear()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.folder)
+        for k, v in self._cfg.items():
+            setattr(cfg, k, v)
+        ds_fetcher._session = None
+        ds_fetcher._host_sems.clear()
+
+
+class TestGet(FetcherTestCase):
+
+    def test_200(self):
+        self.server.routes['/a.csv'] = serve_file(b'a,b\n1,2\n')
+
+        r = ds_fetcher.get(self.server.url('/a.csv'))
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.content, b'a,b\n1,2\n')
+
+    def test_retry_on_5xx(self):
+        self.server.routes['/a.csv'] = serve_errors(2, 503, b'ok')
+
+        r = ds_fetcher.get(self.server.url('/a.csv'))
+
+        self.assertEqual(r.content, b'ok')
+        self.assertEqual(
+            [ q['status'] for q in self.server.requests('/a.csv') ],
+            [503, 503, 200]
+        )
+
+    def test_retry_exhausted(self):
+        self.server.routes['/a.csv'] = serve_errors(10, 500, b'ok')
+
+        with self.assertRaises(requests.exceptions.RequestException):
+            ds_fetcher.get(self.server.url('/a.csv'))
+        self.assertEqual(len(self.server.requests('/a.csv')), cfg.FETCH_RETRIES + 1)
+
+    def test_no_retry_on_404(self):
+        with self.assertRaises(requests.exceptions.HTTPError):
+            ds_fetcher.get(self.server.url('/missing.csv'))
+        self.assertEqual(len(self.server.requests('/missing.csv')), 1)
+
+    def test_per_host_limit(self):
+        self.server.routes['/slow.csv'] = serve_file(b'x', delay=0.2)
+
+        t0 = time.time()
+        ds_fetcher.run_parallel(
+            [ (ds_fetcher.get, (self.server.url('/slow.csv'), )) ] * 6,
+            max_workers=6
+        )
+
+        self.assertEqual(self.server.max_active, cfg.FETCH_MAX_PER_HOST)
+        # 6 requests, 2 at a time
+        self.assertGreaterEqual(time.time() - t0, 0.6)
+
+
+class TestDeadline(FetcherTestCase):
+
+    def test_slow_server(self):
+        self.server.routes['/slow.csv'] = serve_file(b'a,b\n1,2\n', delay=2)
+
+        t0 = time.time()
+        with ds_fetcher.deadline(t0 + 0.5):
+            with self.assertRaises(requests.exceptions.RequestException):
+                ds_fetcher.get(self.server.url('/slow.csv'))
+
+        # no retry after the deadline
+        self.assertLess(time.time() - t0, 1.5)
+
+    def test_passed(self):
+        self.server.routes['/a.csv'] = serve_file(b'a,b\n1,2\n')
+        url = self.server.url('/a.csv')
+
+        with ds_fetcher.deadline(time.time() - 1):
+            with self.assertRaises(ds_fetcher.DeadlineError):
+                ds_fetcher.read_csv(url)
+        self.assertEqual(self.server.requests('/a.csv'), [])
+
+        # no deadline out of the block
+        self.assertEqual(ds_fetcher.read_csv(url)['b'].tolist(), [2])
+
+
+class TestDownloadCached(FetcherTestCase):
+
+    def test_304(self):
+        self.server.routes['/a.csv'] = serve_file(b'v1', etag='"v1"')
+        url = self.server.url('/a.csv')
+        fn = os.path.join(self.folder, 'a.csv')
+
+        self.assertTrue(ds_fetcher.download_cached(url, fn))
+        self.assertFalse(ds_fetcher.download_cached(url, fn))
+
+        reqs = self.server.requests('/a.csv')
+        self.assertEqual([ q['status'] for q in reqs ], [200, 304])
+        self.assertNotIn('If-None-Match', reqs[0]['headers'])
+        self.assertEqual(reqs[1]['headers']['If-None-Match'], '"v1"')
+        with open(fn, 'rb') as f:
+            self.assertEqual(f.read(), b'v1')
+
+    def test_modified(self):
+        url = self.server.url('/a.csv')
+        fn = os.path.join(self.folder, 'a.csv')
+        self.server.routes['/a.csv'] = serve_file(b'v1', etag='"v1"')
+        ds_fetcher.download_cached(url, fn)
+
+        self.server.routes['/a.csv'] = serve_file(b'v2', etag='"v2"')
+        self.assertTrue(ds_fetcher.download_cached(url, fn))
+        with open(fn, 'rb') as f:
+            self.assertEqual(f.read(), b'v2')
+        self.assertFalse(os.path.exists(fn + '.tmp'))
+
+    def test_failed_download_keeps_file(self):
+        url = self.server.url('/a.csv')
+        fn = os.path.join(self.folder, 'a.csv')
+        self.server.routes['/a.csv'] = serve_file(b'v1', etag='"v1"')
+        ds_fetcher.download_cached(url, fn)
+
+        self.server.routes['/a.csv'] = serve_errors(10, 500, b'v2')
+        with self.assertRaises(requests.exceptions.RequestException):
+            ds_fetcher.download_cached(url, fn)
+        with open(fn, 'rb') as f:
+            self.assertEqual(f.read(), b'v1')
+
+
+class TestReadCsvHead(FetcherTestCase):
+
+    def test_head_cut_in_char(self):
+        body = make_csv(1, DATES).replace(b'R000', 'Curaçao'.encode('utf8'))
+        # the head ends in the middle of the character of the 3rd row
+        lines = body.split(b'\n')
+        cfg.PROBE_HEAD_BYTES = len(b'\n'.join(lines[:3])) + 1 + \
+            lines[3].index('ç'.encode('utf8')) + 1
+        self.server.routes['/ts.csv'] = serve_file(body)
+
+        df = ds_fetcher.read_csv_head(self.server.url('/ts.csv'), 10)
+
+        self.assertEqual(df['date'].tolist(), DATES[:2])
+
+    def test_whole_file(self):
+        body = make_csv(1, DATES[:3])
+        self.server.routes['/ts.csv'] = serve_file(body)
+
+        df = ds_fetcher.read_csv_head(self.server.url('/ts.csv'), 10)
+
+        self.assertEqual(df['date'].tolist(), DATES[:3])
+
+
+class TestProbeCsvDates(FetcherTestCase):
+
+    def test_206_tail(self):
+        self.server.routes['/ts.csv'] = serve_file(make_csv(50, DATES), etag='"v1"')
+
+        rs = ds_fetcher.probe_csv_dates(self.server.url('/ts.csv'), 'date', '2021-02-27')
+
+        self.assertEqual(rs['method'], 'range')
+        self.assertEqual(rs['sample'], 'tail')
+        self.assertEqual(rs['latest_date'], '2021-02-28')
+        self.assertGreater(rs['n_found'], 0)
+        self.assertEqual(
+            [ q['status'] for q in self.server.requests('/ts.csv', 'GET') ],
+            [206, 206]
+        )
+
+    def test_scan_when_not_in_tail(self):
+        # the last region doesn't have the last date, but the others have
+        body = make_csv(50, DATES, skip=[(49, '2021-02-28')])
+        self.server.routes['/ts.csv'] = serve_file(body, etag='"v1"')
+
+        rs = ds_fetcher.probe_csv_dates(self.server.url('/ts.csv'), 'date', '2021-02-28')
+
+        self.assertEqual(rs['method'], 'scan')
+        self.assertIsNone(rs['sample'])
+        self.assertEqual(rs['n_found'], 49)
+        self.assertEqual(rs['latest_date'], '2021-02-28')
+
+    def test_tail_cut_in_char(self):
+        # the tail starts in the middle of a 2-byte character
+        body = make_csv(50, DATES, skip=[(49, '2021-02-28')])\
+            .replace(b'R049', 'Curaçao'.encode('utf8'))
+        cfg.PROBE_TAIL_BYTES = len(body) - body.rindex('ç'.encode('utf8')) - 1
+        self.server.routes['/ts.csv'] = serve_file(body, etag='"v1"')
+
+        rs = ds_fetcher.probe_csv_dates(self.server.url('/ts.csv'), 'date', '2021-02-28')
+
+        self.assertEqual(rs['method'], 'scan')
+        self.assertEqual(rs['n_found'], 49)
+
+    def test_not_found(self):
+        self.server.routes['/ts.csv'] = serve_file(make_csv(50, DATES), etag='"v1"')
+
+        rs = ds_fetcher.probe_csv_dates(self.server.url('/ts.csv'), 'date', '2021-03-01')
+
+        self.assertIsNone(rs['sample'])
+        self.assertEqual(rs['n_found'], 0)
+        self.assertEqual(rs['latest_date'], '2021-02-28')
+
+    def test_stream_without_range(self):
+        self.server.routes['/ts.csv'] = serve_file(
+            make_csv(50, DATES), etag='"v1"', range_ok=False
+        )
+        url = self.server.url('/ts.csv')
+
+        rs = ds_fetcher.probe_csv_dates(url, 'date', '2021-02-01')
+        self.assertEqual(rs['method'], 'stream')
+        self.assertEqual(rs['sample'], 'head')
+        self.assertGreater(rs['n_found'], 0)
+
+        rs = ds_fetcher.probe_csv_dates(url, 'date', '2021-03-01')
+        self.assertEqual(rs['method'], 'stream')
+        self.assertIsNone(rs['sample'])
+        self.assertEqual(rs['latest_date'], '2021-02-28')
+
+    def test_cache_by_etag(self):
+        self.server.routes['/ts.csv'] = serve_file(make_csv(50, DATES), etag='"v1"')
+        url = self.server.url('/ts.csv')
+
+        rs1 = ds_fetcher.probe_csv_dates(url, 'date', '2021-02-27')
+        rs2 = ds_fetcher.probe_csv_dates(url, 'date', '2021-02-27')
+        self.assertEqual(rs2['method'], 'cache')
+        self.assertEqual(rs2['n_found'], rs1['n_found'])
+        self.assertEqual(len(self.server.requests('/ts.csv', 'GET')), 2)
+
+        # a new version is probed again
+        self.server.routes['/ts.csv'] = serve_file(make_csv(50, DATES), etag='"v2"')
+        rs3 = ds_fetcher.probe_csv_dates(url, 'date', '2021-02-27')
+        self.assertEqual(rs3['method'], 'range')
+
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+Test the incremental history of the per-day fragments
+
+    python -m pytest pipeline/tests
+'''
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+import ds_config as cfg
+import ds_store
+
+
+DATES = ['2021-02-%02d' % d for d in range(1, 11)]
+
+
+class TestBuildHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.folder_raw = os.path.join(self.folder, 'raw')
+        self.folder_frag = os.path.join(self.folder, 'frag')
+        os.makedirs(self.folder_raw)
+        for date in DATES:
+            self.write_raw(date, '1')
+
+        self.parsed = []
+        self.n_md5 = 0
+        self._get_md5 = ds_store.get_md5
+        def get_md5(fns):
+            self.n_md5 += 1
+            return self._get_md5(fns)
+        ds_store.get_md5 = get_md5
+
+    def tearDown(self):
+        ds_store.get_md5 = self._get_md5
+        shutil.rmtree(self.folder)
+
+    def write_raw(self, date, value):
+        with open(self.get_fns(date)[0], 'w') as f:
+            f.write('state,value\nMN,%s\nWI,%s\n' % (value, value))
+
+    def get_fns(self, date):
+        return [os.path.join(self.folder_raw, '%s.csv' % date)]
+
+    def parse(self, date):
+        self.parsed.append(date)
+        df = pd.read_csv(self.get_fns(date)[0])
+        df['date'] = date
+        return df
+
+    def build(self, date_vals=DATES):
+        self.parsed = []
+        self.n_md5 = 0
+        return ds_store.build_history(
+            self.folder_frag, date_vals, self.get_fns, self.parse
+        )
+
+    def get_expected(self, date_vals=DATES):
+        dfs = []
+        for date in date_vals:
+            df = pd.read_csv(self.get_fns(date)[0])
+            df['date'] = date
+            dfs.append(df)
+        return pd.concat(dfs, ignore_index=True)
+
+    def assert_df(self, df, date_vals=DATES):
+        pd.testing.assert_frame_equal(
+            df.reset_index(drop=True), self.get_expected(date_vals),
+            check_dtype=False
+        )
+
+    def test_no_change(self):
+        df, n_parsed = self.build()
+        self.assertEqual(n_parsed, len(DATES))
+        self.assert_df(df)
+
+        df, n_parsed = self.build()
+        self.assertEqual(n_parsed, 0)
+        self.assertEqual(self.n_md5, 0)
+        self.assert_df(df)
+
+    def test_new_day(self):
+        self.build(DATES[:-1])
+
+        df, n_parsed = self.build()
+        self.assertEqual(self.parsed, DATES[-1:])
+        self.assert_df(df)
+
+    def test_same_content(self):
+        self.build()
+
+        # downloaded again, only hashed
+        self.write_raw(DATES[3], '1')
+        os.utime(self.get_fns(DATES[3])[0], ns=(0, 0))
+        df, n_parsed = self.build()
+        self.assertEqual(n_parsed, 0)
+        self.assertEqual(self.n_md5, 1)
+        self.assert_df(df)
+
+        # the new mtime is kept
+        df, n_parsed = self.build()
+        self.assertEqual(self.n_md5, 0)
+
+    def test_changed_day(self):
+        self.build()
+
+        self.write_raw(DATES[3], '22')
+        os.utime(self.get_fns(DATES[3])[0], ns=(0, 0))
+        df, n_parsed = self.build()
+        self.assertEqual(self.parsed, [DATES[3]])
+        self.assert_df(df)
+
+    def test_old_parse_date(self):
+        self.build()
+
+        df, n_parsed = self.build(DATES[:5])
+        self.assertEqual(n_parsed, 0)
+        self.assert_df(df, DATES[:5])
+
+        df, n_parsed = self.build()
+        self.assertEqual(n_parsed, 0)
+        self.assert_df(df)
+
+    def test_old_index(self):
+        # the index of date to MD5 by the old builds
+        os.makedirs(self.folder_frag)
+        index = {}
+        for date in DATES:
+            df = self.parse(date)
+            ds_store.save_df(
+                df, os.path.join(self.folder_frag, cfg.FN_FRAG % date),
+                export_csv=False
+            )
+            index[date] = self._get_md5(self.get_fns(date))
+        with open(os.path.join(self.folder_frag, cfg.FN_FRAG_INDEX), 'w') as f:
+            json.dump(index, f)
+
+        df, n_parsed = self.build()
+        self.assertEqual(n_parsed, 0)
+        self.assertEqual(self.n_md5, len(DATES))
+        self.assert_df(df)
+
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+'''Series Index
+The in-memory columnar index of the merged history files for /api/series.
+
+For each geo level, the index has the list of dates, the row of each
+region, and one 2D array (regions x dates) for each metric, so a query of
+a few regions, metrics and dates is answered by slicing the arrays,
+without loading the state files.
+
+The index is built from the files in the v2 folder, and built again when
+any of them is changed by the pipeline. Each geo level is built at its
+first query. The build runs outside the global lock, and the other
+queries get the old index of the geo level until the new one is ready.
+
+The integer series, e.g., the counts, are kept as int32 (or float32 with
+missing values) when the values fit, which is the most of the index.
+'''
+import os
+import json
+import threading
+
+import numpy as np
+
+# geo -> [(file name pattern, the key of the data)]
+GEO_SOURCES = {
+    'county': [('%s-history.json', 'county_data')],
+    'state': [('US-history.json', 'state_data')],
+    'usa': [('US-history.json', 'usa_data')],
+    'country': [('WORLD-history.json', 'world_data')],
+    'mchrr': [('MCHRR-history.json', 'mchrr_data')],
+}
+
+# the history files which are not a state
+NON_STATE_FILES = ['US-history.json', 'WORLD-history.json', 'MCHRR-history.json']
+
+# the fields of the region which are not series
+META_FIELDS = ['state', 'FIPS', 'name', 'pop', 'lat', 'lon']
+
+# (folder, geo) -> (version, the index of the geo level)
+_index = {}
+# (folder, geo) -> the lock of building the index
+_build_locks = {}
+_lock = threading.Lock()
+
+# float32 keeps the integers exactly up to 2^24
+MAX_FLOAT32_INT = 2 ** 24
+
+
+def _get_source_files(folder, geo):
+    '''
+    Get the list of (file name, data key) of the geo level
+    '''
+    ret = []
+    for pattern, key in GEO_SOURCES[geo]:
+        if '%s' not in pattern:
+            ret.append((pattern, key))
+            continue
+
+        # all the state files, e.g., AL-history.json
+        for fn in sorted(os.listdir(folder)):
+            if fn.endswith('-history.json') and fn not in NON_STATE_FILES:
+                ret.append((fn, key))
+
+    return ret
+
+
+def _get_version(folder):
+    '''
+    Get the version of the history files by their mtime and size
+    '''
+    if not os.path.exists(folder):
+        return None
+
+    version = []
+    for fn in sorted(os.listdir(folder)):
+        if not fn.endswith('-history.json'):
+            continue
+        stat = os.stat(os.path.join(folder, fn))
+        version.append((fn, stat.st_mtime_ns, stat.st_size))
+
+    return tuple(version)
+
+
+def _to_int_arr(arr):
+    '''
+    Convert the float array of an integer series to the smallest exact type
+    '''
+    missing = np.isnan(arr)
+    if missing.all():
+        return arr.astype(np.float32)
+
+    vmax = np.abs(arr[~missing]).max()
+    if not missing.any():
+        # keep the integers if no value is missing
+        if vmax <= np.iinfo(np.int32).max:
+            return arr.astype(np.int32)
+        return arr.astype(np.int64)
+
+    if vmax <= MAX_FLOAT32_INT:
+        return arr.astype(np.float32)
+
+    return arr
+
+
+def _build_geo(folder, geo):
+    '''
+    Build the index of one geo level
+
+    Return:
+        a dict of dates, regions (id -> row), meta (list of dict),
+        and metrics (metric -> 2D array and the mask of the rows having it)
+    '''
+    records = {}
+    all_dates = set()
+    for fn, key in _get_source_files(folder, geo):
+        full_fn = os.path.join(folder, fn)
+        if not os.path.exists(full_fn):
+            continue
+
+        with open(full_fn) as f:
+            j = json.load(f)
+        data = j.get(key)
+        if not data:
+            continue
+
+        # the data of one region, e.g., usa_data
+        if any([ isinstance(v, list) for v in data.values() ]):
+            data = {data.get('FIPS', geo.upper()): data}
+
+        for rid, rec in data.items():
+            records[rid] = (j['dates'], rec)
+        all_dates.update(j['dates'])
+
+    dates = sorted(all_dates)
+    date_idx = { d: i for i, d in enumerate(dates) }
+    regions = {}
+    meta = []
+    rows = {}
+    for rid, (rec_dates, rec) in records.items():
+        regions[rid] = len(meta)
+        meta.append({ k: rec[k] for k in META_FIELDS if k in rec })
+        cols = [ date_idx[d] for d in rec_dates ]
+        for k, v in rec.items():
+            if isinstance(v, list) and len(v) == len(rec_dates):
+                rows.setdefault(k, []).append((regions[rid], cols, v))
+
+    metrics = {}
+    n_regions, n_dates = len(meta), len(dates)
+    for k, items in rows.items():
+        sample = np.asarray(items[0][2])
+        if sample.dtype.kind in 'iuf':
+            arr = np.full((n_regions, n_dates), np.nan)
+        else:
+            arr = np.full((n_regions, n_dates), None, dtype=object)
+        mask = np.zeros(n_regions, dtype=bool)
+        for row, cols, v in items:
+            arr[row, cols] = v
+            mask[row] = True
+
+        if arr.dtype.kind == 'f' and \
+            all([ np.asarray(v).dtype.kind in 'iu' for _, _, v in items ]):
+            arr = _to_int_arr(arr)
+
+        metrics[k] = (arr, mask)
+
+    return {
+        'dates': dates,
+        'regions': regions,
+        'meta': meta,
+        'metrics': metrics
+    }
+
+
+def get_index(folder, geo):
+    '''
+    Get the index of the geo level, build it if the files are changed
+
+    Only one thread builds the index of a geo level. The other threads get
+    the old index if there is one, otherwise they wait for the build.
+    '''
+    key = (folder, geo)
+    version = _get_version(folder)
+    with _lock:
+        item = _index.get(key)
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+
+    if item is not None and item[0] == version:
+        return item[1]
+
+    if not build_lock.acquire(blocking=item is None):
+        # being built by another thread
+        return item[1]
+
+    try:
+        # it may be built while waiting for the lock
+        with _lock:
+            item = _index.get(key)
+        if item is not None and item[0] == version:
+            return item[1]
+
+        gi = _build_geo(folder, geo)
+        with _lock:
+            _index[key] = (version, gi)
+        print('* built the %s series index of %s' % (geo, folder))
+
+        return gi
+
+    finally:
+        build_lock.release()
+
+
+def _to_list(arr):
+    '''
+    Convert the row to list, NaN to None
+    '''
+    if arr.dtype.kind == 'f':
+        return [ None if np.isnan(v) else v for v in arr.tolist() ]
+
+    return arr.tolist()
+
+
+def query(folder, geo, ids, metrics=None, date_from=None, date_to=None):
+    '''
+    Query the series of the regions
+
+    Args:
+        folder: the folder of the history files
+        geo: county, state, usa, country or mchrr
+        ids: the list of region ids, e.g., FIPS of the county
+        metrics: the list of metrics, default all
+        date_from: the first YYYY-MM-DD date, default the first one
+        date_to: the last YYYY-MM-DD date, default the last one
+
+    Return:
+        the dict of dates and the data of each region, the same
+        structure as the history files
+    '''
+    if geo not in GEO_SOURCES:
+        raise ValueError('unknown geo %s' % geo)
+
+    gi = get_index(folder, geo)
+
+    if metrics is None:
+        metrics = sorted(gi['metrics'].keys())
+    unknown = [ m for m in metrics if m not in gi['metrics'] ]
+    if len(unknown) > 0:
+        raise ValueError('unknown metrics %s' % ','.join(unknown))
+
+    # the dates are sorted YYYY-MM-DD
+    dates = gi['dates']
+    i0 = 0 if date_from is None else int(np.searchsorted(dates, date_from, 'left'))
+    i1 = len(dates) if date_to is None else int(np.searchsorted(dates, date_to, 'right'))
+
+    data = {}
+    not_found = []
+    for rid in ids:
+        if rid not in gi['regions']:
+            not_found.append(rid)
+            continue
+
+        row = gi['regions'][rid]
+        rec = dict(gi['meta'][row])
+        for m in metrics:
+            arr, mask = gi['metrics'][m]
+            if mask[row]:
+                rec[m] = _to_list(arr[row, i0:i1])
+        data[rid] = rec
+
+    return {
+        'geo': geo,
+        'dates': dates[i0:i1],
+        'metrics': metrics,
+        'data': data,
+        'not_found': not_found
+    }
@@ -12,6 +12,9 @@ import random
 import datetime
 import subprocess
 import pathlib
+import hashlib
+import threading
+from collections import OrderedDict
 
 from flask import Flask
 from flask import g
@@ -22,14 +25,23 @@ from flask import Response
 from flask import session
 from flask import jsonify
 from flask import send_from_directory
+from flask import send_file
+from flask import abort
 
 from flask_compress import Compress
 
 import numpy as np
 import pandas as pd
 
+try:
+    from werkzeug.utils import safe_join
+except ImportError:
+    # werkzeug < 2.0 has it in the security module
+    from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
+import series_index
+
 # import newshub as newshub_srv
 
 HOST = '0.0.0.0'
@@ -118,6 +130,119 @@ def delta_dashboard():
 # COVID Data files
 ###########################################################
 
+# the precompressed siblings saved by the pipeline, in the order of preference
+PRECOMPRESSED_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+def send_precompressed(full_filename):
+    '''
+    Send the precompressed sibling matching the Accept-Encoding
+
+    Return None if the client doesn't accept any of them or the sibling
+    is not available. The Compress skips the response which has the
+    Content-Encoding already.
+    '''
+    for encoding, ext in PRECOMPRESSED_ENCODINGS:
+        if request.accept_encodings[encoding] <= 0:
+            continue
+
+        fn = full_filename + ext
+        if not os.path.exists(fn) or \
+            os.path.getmtime(fn) < os.path.getmtime(full_filename):
+            continue
+
+        response = send_file(fn, mimetype='application/json', conditional=True)
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    return None
+
+
+# the bytes of the data files, path -> (mtime, size, etag, data)
+FILE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+_file_cache = OrderedDict()
+_file_cache_bytes = 0
+_file_cache_lock = threading.Lock()
+
+def _get_file_bytes(full_filename, stat):
+    '''
+    Get the (etag, data) of the file from the cache
+
+    The cached bytes are used until the mtime or size of the file is
+    changed, e.g., the pipeline rewrites the file.
+    '''
+    global _file_cache_bytes
+    with _file_cache_lock:
+        item = _file_cache.get(full_filename)
+        if item is not None and item[:2] == (stat.st_mtime_ns, stat.st_size):
+            _file_cache.move_to_end(full_filename)
+            return item[2], item[3]
+
+    with open(full_filename, 'rb') as f:
+        data = f.read()
+    etag = hashlib.md5(data).hexdigest()
+
+    with _file_cache_lock:
+        old = _file_cache.pop(full_filename, None)
+        if old is not None:
+            _file_cache_bytes -= len(old[3])
+        _file_cache[full_filename] = (stat.st_mtime_ns, stat.st_size, etag, data)
+        _file_cache_bytes += len(data)
+
+        # drop the least recently used files
+        while _file_cache_bytes > FILE_CACHE_MAX_BYTES and len(_file_cache) > 1:
+            _, old = _file_cache.popitem(last=False)
+            _file_cache_bytes -= len(old[3])
+
+    return etag, data
+
+
+# the values parsed from the small JSON files, e.g., the manifest,
+# path -> (mtime, size, value)
+_value_cache = {}
+
+def _get_file_value(full_filename, get_value):
+    '''
+    Get the value parsed from the JSON file by get_value(obj)
+
+    The file is only parsed again when its mtime or size is changed, the
+    same as _get_file_bytes, and only the value is kept.
+    '''
+    stat = os.stat(full_filename)
+    with _file_cache_lock:
+        item = _value_cache.get(full_filename)
+        if item is not None and item[:2] == (stat.st_mtime_ns, stat.st_size):
+            return item[2]
+
+    with open(full_filename, 'rb') as f:
+        value = get_value(json.load(f))
+
+    with _file_cache_lock:
+        _value_cache[full_filename] = (stat.st_mtime_ns, stat.st_size, value)
+
+    return value
+
+
+def send_json_file(full_filename):
+    '''
+    Send the JSON file as is, without loading and dumping it again
+
+    The response has the ETag and Last-Modified, and it's 304 when the
+    client has the same version.
+    '''
+    try:
+        stat = os.stat(full_filename)
+    except OSError:
+        abort(404)
+
+    etag, data = _get_file_bytes(full_filename, stat)
+
+    response = Response(data, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = int(stat.st_mtime)
+    return response.make_conditional(request)
+
+
 @app.route('/covid_data/<fn>')
 def covid_data(fn):
     if fn is None or fn == '':
@@ -126,9 +251,7 @@ def covid_data(fn):
     # TODO secure check
     full_filename = os.path.join(DATA_RST_FOLDER, fn)
 
-    # load json
-    ret = json.load(open(full_filename))
-    return jsonify(ret)
+    return send_json_file(full_filename)
 
 
 @app.route('/covid_data/v2/<fn>')
@@ -136,12 +259,73 @@ def covid_data_v2(fn):
     if fn is None or fn == '':
         return 'error filename'
 
-    # TODO secure check
-    full_filename = os.path.join(DATA_RST_FOLDER, 'v2', fn)
+    full_filename = safe_join(os.path.join(DATA_RST_FOLDER, 'v2'), fn)
+    if full_filename is None:
+        abort(404)
 
-    # load json
-    ret = json.load(open(full_filename))
-    return jsonify(ret)
+    # the compact schema, e.g., AL-history.compact.json,
+    # the full one is returned if not available
+    if request.args.get('schema') == 'compact':
+        compact_filename = os.path.splitext(full_filename)[0] + '.compact.json'
+        if os.path.exists(compact_filename):
+            full_filename = compact_filename
+
+    # the .br or .gz saved by the pipeline
+    response = send_precompressed(full_filename)
+    if response is not None:
+        return response
+
+    return send_json_file(full_filename)
+
+
+@app.route('/covid_data/v2/delta/<fn>')
+def covid_data_v2_delta(fn):
+    '''
+    Send the last days of the history file for patching an old one
+
+    The client sends the last date of its file by since, and/or the
+    SHA-256 of its file in the manifest by version. It's 304 if the
+    version is the latest. A stale version is mapped to its parse date by
+    the history of the file in the manifest, which is used as the since.
+    It's the delta if the since is in the window of the delta, otherwise
+    the full file.
+    '''
+    if fn is None or fn == '':
+        return 'error filename'
+
+    full_filename = safe_join(os.path.join(DATA_RST_FOLDER, 'v2'), fn)
+    if full_filename is None or not os.path.isfile(full_filename):
+        abort(404)
+
+    since = request.args.get('since')
+    version = request.args.get('version')
+    manifest_filename = os.path.join(DATA_RST_FOLDER, 'v2', 'manifest.json')
+    if version is not None and os.path.exists(manifest_filename):
+        item = _get_file_value(manifest_filename, lambda j: j['files']).get(fn)
+        if item is not None:
+            # the same file as the client has
+            if item['sha256'] == version:
+                return Response(status=304)
+
+            # the client has the file of a recent run
+            for old in item.get('history', []):
+                if old['sha256'] == version:
+                    since = old['parse_date']
+                    break
+
+    # the delta covers the dates after its since
+    delta_filename = os.path.splitext(full_filename)[0] + '.delta.json'
+    if since is not None and os.path.exists(delta_filename):
+        delta_since = _get_file_value(delta_filename, lambda j: j['since'])
+        if delta_since is None or delta_since <= since:
+            full_filename = delta_filename
+
+    # the .br or .gz saved by the pipeline
+    response = send_precompressed(full_filename)
+    if response is not None:
+        return response
+
+    return send_json_file(full_filename)
 
 
 @app.route('/covid_data/dsvm/<fn>')
@@ -154,9 +338,7 @@ def covid_data_dsvm(fn):
     # TODO secure check
     full_filename = os.path.join(DATA_RST_FOLDER, 'dsvm', fn)
 
-    # load json
-    ret = json.load(open(full_filename))
-    return jsonify(ret)
+    return send_json_file(full_filename)
 
 
 @app.route('/covid_data/state/<fn>')
@@ -167,8 +349,38 @@ def covid_date_state(fn):
     # TODO secure check
     full_filename = os.path.join(DATA_RST_FOLDER, 'state', fn)
 
-    # load json
-    ret = json.load(open(full_filename))
+    return send_json_file(full_filename)
+
+###########################################################
+# COVID Data API
+###########################################################
+
+@app.route('/api/series')
+def api_series():
+    '''
+    Get the series of some regions, metrics and dates
+
+    e.g., /api/series?geo=county&fips=27109,27037&metrics=crps,crcs&from=2021-01-01
+    '''
+    geo = request.args.get('geo', 'county')
+    ids = [ v for v in request.args.get('fips', '').split(',') if v != '' ]
+    metrics = [ v for v in request.args.get('metrics', '').split(',') if v != '' ]
+
+    if len(ids) == 0:
+        return jsonify({'error': 'fips is required'}), 400
+
+    try:
+        ret = series_index.query(
+            os.path.join(DATA_RST_FOLDER, 'v2'),
+            geo,
+            ids,
+            metrics if len(metrics) > 0 else None,
+            request.args.get('from'),
+            request.args.get('to')
+        )
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+
     return jsonify(ret)
 
 ###########################################################
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Huan He (He.Huan@mayo.edu)
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+'''
+Test the series index of the merged history files
+
+    python -m pytest web/tests
+'''
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+import series_index
+
+
+DATES = ['2021-02-%02d' % d for d in range(1, 11)]
+
+
+def make_county(fips, seed, n_dates=len(DATES)):
+    return {
+        'FIPS': fips,
+        'name': 'County %s' % fips,
+        'pop': 1000 * seed,
+        'nccs': [ seed * i for i in range(n_dates) ],
+        'dtrs': [ round(seed / (i + 3), 4) for i in range(n_dates) ],
+        'crcs': [ 'GYR'[(seed + i) % 3] for i in range(n_dates) ],
+    }
+
+
+class TestQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.n_writes = 0
+        self.write('MN', {
+            '27109': make_county('27109', 2),
+            '27045': make_county('27045', 3),
+        })
+        # a state with a shorter history
+        self.write('WI', {'55001': make_county('55001', 4, 5)}, DATES[:5])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, state, county_data, dates=DATES):
+        j = {
+            'last_update': dates[-1],
+            'dates': dates,
+            'county_data': county_data
+        }
+        fn = os.path.join(self.folder, '%s-history.json' % state)
+        with open(fn, 'w') as f:
+            json.dump(j, f)
+        # a new version even if it's written in the same clock tick
+        self.n_writes += 1
+        os.utime(fn, ns=(0, self.n_writes))
+
+    def test_query(self):
+        rs = series_index.query(self.folder, 'county', ['27109', '55001'])
+
+        self.assertEqual(rs['dates'], DATES)
+        self.assertEqual(rs['metrics'], ['crcs', 'dtrs', 'nccs'])
+        self.assertEqual(rs['data']['27109']['name'], 'County 27109')
+        self.assertEqual(rs['data']['27109']['nccs'], make_county('27109', 2)['nccs'])
+        self.assertEqual(rs['data']['27109']['dtrs'], make_county('27109', 2)['dtrs'])
+
+        # the missing dates of the shorter history
+        self.assertEqual(rs['data']['55001']['nccs'], [0, 4, 8, 12, 16] + [None] * 5)
+        self.assertEqual(rs['data']['55001']['crcs'][5:], [None] * 5)
+
+    def test_unknown_fips(self):
+        rs = series_index.query(self.folder, 'county', ['27045', '99999'])
+
+        self.assertEqual(list(rs['data'].keys()), ['27045'])
+        self.assertEqual(rs['not_found'], ['99999'])
+
+    def test_metrics(self):
+        rs = series_index.query(self.folder, 'county', ['27045'], metrics=['nccs'])
+
+        self.assertEqual(rs['metrics'], ['nccs'])
+        self.assertIn('nccs', rs['data']['27045'])
+        self.assertNotIn('dtrs', rs['data']['27045'])
+        self.assertNotIn('crcs', rs['data']['27045'])
+
+        with self.assertRaises(ValueError):
+            series_index.query(self.folder, 'county', ['27045'], metrics=['xxxx'])
+
+        with self.assertRaises(ValueError):
+            series_index.query(self.folder, 'city', ['27045'])
+
+    def test_from_to(self):
+        nccs = make_county('27045', 3)['nccs']
+
+        rs = series_index.query(
+            self.folder, 'county', ['27045'],
+            date_from='2021-02-03', date_to='2021-02-05'
+        )
+        self.assertEqual(rs['dates'], DATES[2:5])
+        self.assertEqual(rs['data']['27045']['nccs'], nccs[2:5])
+
+        # only one side, and the dates not in the index
+        rs = series_index.query(self.folder, 'county', ['27045'], date_from='2021-02-08')
+        self.assertEqual(rs['dates'], DATES[7:])
+        self.assertEqual(rs['data']['27045']['nccs'], nccs[7:])
+
+        rs = series_index.query(self.folder, 'county', ['27045'], date_to='2021-01-31')
+        self.assertEqual(rs['dates'], [])
+        self.assertEqual(rs['data']['27045']['nccs'], [])
+
+        rs = series_index.query(self.folder, 'county', ['27045'], date_to='2021-03-31')
+        self.assertEqual(rs['dates'], DATES)
+
+    def test_compact_types(self):
+        gi = series_index.get_index(self.folder, 'county')
+
+        self.assertEqual(gi['metrics']['nccs'][0].dtype, np.float32)
+        self.assertEqual(gi['metrics']['dtrs'][0].dtype, np.float64)
+
+        # no missing values
+        self.write('WI', {'55001': make_county('55001', 4)})
+        gi = series_index.get_index(self.folder, 'county')
+        self.assertEqual(gi['metrics']['nccs'][0].dtype, np.int32)
+
+    def test_rebuild(self):
+        series_index.get_index(self.folder, 'county')
+        self.write('MN', {'27109': make_county('27109', 5)})
+
+        # the queries get the old index while the new one is being built
+        building = threading.Event()
+        done = threading.Event()
+        _build_geo = series_index._build_geo
+        def build_geo(folder, geo):
+            building.set()
+            done.wait(5)
+            return _build_geo(folder, geo)
+        series_index._build_geo = build_geo
+        try:
+            t = threading.Thread(
+                target=series_index.query, args=(self.folder, 'county', ['27109'])
+            )
+            t.start()
+            self.assertTrue(building.wait(5))
+
+            rs = series_index.query(self.folder, 'county', ['27109', '27045'])
+            self.assertEqual(rs['data']['27109']['pop'], 2000)
+            self.assertEqual(rs['not_found'], [])
+
+            done.set()
+            t.join()
+        finally:
+            series_index._build_geo = _build_geo
+
+        rs = series_index.query(self.folder, 'county', ['27109', '27045'])
+        self.assertEqual(rs['data']['27109']['pop'], 5000)
+        self.assertEqual(rs['not_found'], ['27045'])